@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the DPDK telemetry agent against fake DPDK telemetry sockets
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import fake_telemetry_server
+
+AGENT_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "dpdk-telemetry.py"
+)
+
+
+def load_agent(path):
+    # the agent is a script with a dash in its name, it cannot be imported by name
+    spec = importlib.util.spec_from_file_location("dpdk_telemetry", path)
+    agent = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(agent)
+    return agent
+
+
+def run_server(args):
+    try:
+        asyncio.run(fake_telemetry_server.serve_all(args))
+    except KeyboardInterrupt:
+        pass
+
+
+def wait_for_sockets(directory, apps, timeout=10):
+    deadline = time.monotonic() + timeout
+    paths = [
+        os.path.join(directory, f"app{i}", "dpdk_telemetry.v2") for i in range(apps)
+    ]
+    while not all(os.path.exists(p) for p in paths):
+        if time.monotonic() > deadline:
+            raise SystemExit(
+                f"fake telemetry sockets did not show up under {directory}"
+            )
+        time.sleep(0.05)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def measure(name, operation, iterations):
+    """Run operation iterations times, then once more under tracemalloc."""
+    wall = []
+    cpu = []
+    for _ in range(iterations):
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        operation()
+        cpu.append(time.process_time() - cpu_start)
+        wall.append(time.perf_counter() - wall_start)
+    # tracing slows everything down, keep it out of the timed iterations
+    tracemalloc.start()
+    operation()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "operation": name,
+        "iterations": iterations,
+        "p50_ms": percentile(wall, 50) * 1000,
+        "p90_ms": percentile(wall, 90) * 1000,
+        "p99_ms": percentile(wall, 99) * 1000,
+        "max_ms": max(wall) * 1000,
+        "cpu_ms": sum(cpu) / len(cpu) * 1000,
+        "alloc_peak_kib": peak / 1024,
+    }
+
+
+def prometheus_scrape(agent, sampler):
+    from prometheus_client import CollectorRegistry, generate_latest
+
+    registry = CollectorRegistry()
+    registry.register(agent.PrometheusCollector(sampler))
+    return lambda: generate_latest(registry)
+
+
+def otlp_collect(agent, sampler):
+    from opentelemetry.sdk.metrics import MeterProvider
+    from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+
+    reader = InMemoryMetricReader()
+    # older revisions of the agent, benchmarked with --agent, have no views
+    views = agent.otlp_views() if hasattr(agent, "otlp_views") else ()
+    provider = MeterProvider(metric_readers=[reader], views=views)
+    agent.OtlpCollector(sampler).register(provider.get_meter("dpdk.stats"))
+    return reader.get_metrics_data
+
+
+def run_benchmark(args, directory):
+    agent = load_agent(args.agent)
+    sock_dict = {}
+    telemetry_options = {"pipeline_depth": args.pipeline_depth}
+    agent.initialize_sock_dict(directory, sock_dict, telemetry_options)
+    stats_filter = agent.StatsFilter(args.stats_filter, args.xstats_filter)
+    sampler = agent.TelemetrySampler(sock_dict, 1, args.query_timeout, stats_filter)
+
+    loop = asyncio.new_event_loop()
+    # connect and take the baseline for the rates, twice so rates exist
+    loop.run_until_complete(sampler.sample())
+    loop.run_until_complete(sampler.sample())
+
+    results = [
+        measure(
+            "sample",
+            lambda: loop.run_until_complete(sampler.sample()),
+            args.iterations,
+        )
+    ]
+    if "prometheus" in args.backends:
+        results.append(
+            measure(
+                "prometheus scrape",
+                prometheus_scrape(agent, sampler),
+                args.iterations,
+            )
+        )
+    if "otlp" in args.backends:
+        results.append(
+            measure("otlp collect", otlp_collect(agent, sampler), args.iterations)
+        )
+
+    for sock in sock_dict.values():
+        sock._close_sock()
+    loop.close()
+    return {
+        "apps": args.apps,
+        "ports": args.ports,
+        "stale_apps": sum(sample.stale for sample in sampler.snapshot.apps.values()),
+        "max_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "results": results,
+    }
+
+
+def print_report(report):
+    print(
+        f"{report['apps']} apps x {report['ports']} ports, "
+        f"{report['stale_apps']} stale"
+    )
+    print(
+        f"{'operation':<18} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}"
+        f" {'cpu ms':>9} {'alloc KiB':>10}"
+    )
+    for r in report["results"]:
+        print(
+            f"{r['operation']:<18} {r['p50_ms']:>9.3f} {r['p90_ms']:>9.3f}"
+            f" {r['p99_ms']:>9.3f} {r['max_ms']:>9.3f} {r['cpu_ms']:>9.3f}"
+            f" {r['alloc_peak_kib']:>10.1f}"
+        )
+    print(f"max RSS: {report['max_rss_mib']:.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    fake_telemetry_server.add_arguments(parser)
+    parser.add_argument(
+        "--agent",
+        default=AGENT_PATH,
+        help="Path to the agent script under test.",
+    )
+    parser.add_argument(
+        "-n",
+        "--iterations",
+        type=int,
+        default=200,
+        help="Timed iterations per operation.",
+    )
+    parser.add_argument(
+        "--backends",
+        default="prometheus,otlp",
+        help="Comma separated backends to benchmark the export of, prometheus "
+        "and/or otlp.",
+    )
+    parser.add_argument(
+        "--pipeline-depth",
+        type=int,
+        default=8,
+        help="Agent --pipeline-depth.",
+    )
+    parser.add_argument(
+        "--query-timeout",
+        type=float,
+        default=0.5,
+        help="Agent --query-timeout.",
+    )
+    parser.add_argument("--stats-filter", default=".*", help="Agent --stats-filter.")
+    parser.add_argument(
+        "--xstats-filter",
+        default="missed|errors|dropped|discard|nombuf",
+        help="Agent --xstats-filter.",
+    )
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    args = parser.parse_args()
+    args.backends = args.backends.split(",")
+
+    directory = tempfile.mkdtemp(prefix="fake-dpdk-")
+    server = multiprocessing.Process(
+        target=run_server,
+        args=(argparse.Namespace(**vars(args), dir=directory),),
+    )
+    server.start()
+    try:
+        wait_for_sockets(directory, args.apps)
+        report = run_benchmark(args, directory)
+    finally:
+        server.terminate()
+        server.join()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
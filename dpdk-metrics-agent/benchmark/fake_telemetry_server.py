@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+
+"""
+Stand-in for the dpdk_telemetry.v2 socket of N DPDK applications with M ports each
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import socket
+import time
+
+MAX_OUTPUT_LEN = 16384
+QUEUE_STAT_CNTRS = 16
+MEMPOOL_SIZE = 8192
+HEAP_SIZE = 1 << 30
+TSC_HZ = 2000000000
+# packet rate at which a forwarding lcore is fully busy
+LCORE_MAX_PPS = 20000000
+
+
+class FakeApplication:
+    """Answer the telemetry commands of one emulated DPDK application.
+
+    Like the real telemetry server, commands of a connection are handled one at
+    a time and in order. Counters grow with the time since the application
+    started, at pps_per_port packets per second on every port.
+    """
+
+    def __init__(
+        self, sock_path, ports, xstats, latency, fail_rate, wedged, pps_per_port
+    ):
+        self.sock_path = sock_path
+        self.ports = ports
+        self.xstats = xstats
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.wedged = wedged
+        self.pps_per_port = pps_per_port
+        self.started = time.monotonic()
+        self.commands = 0
+
+    def _packets(self, port):
+        return int((time.monotonic() - self.started) * self.pps_per_port * (port + 1))
+
+    def _stats(self, port):
+        packets = self._packets(port)
+        queue_packets = (
+            [packets // 2, packets - packets // 2] + [0] * (QUEUE_STAT_CNTRS - 2)
+        )
+        return {
+            "ipackets": packets,
+            "opackets": packets,
+            "ibytes": packets * 64,
+            "obytes": packets * 64,
+            "imissed": packets // 1000,
+            "ierrors": 0,
+            "oerrors": 0,
+            "rx_nombuf": packets // 10000,
+            "q_ipackets": queue_packets,
+            "q_opackets": queue_packets,
+            "q_ibytes": [p * 64 for p in queue_packets],
+            "q_obytes": [p * 64 for p in queue_packets],
+            "q_errors": [0] * QUEUE_STAT_CNTRS,
+        }
+
+    def _xstats(self, port):
+        packets = self._packets(port)
+        xstats = {
+            "rx_good_packets": packets,
+            "tx_good_packets": packets,
+            "rx_missed_errors": packets // 1000,
+            "rx_errors": 0,
+            "tx_errors": 0,
+            "rx_mbuf_allocation_errors": packets // 10000,
+        }
+        for i in range(len(xstats), self.xstats):
+            xstats[f"rx_priority{i}_xoff_packets"] = 0
+        return xstats
+
+    def _mempool_info(self, name):
+        # one mempool per port, filling up and draining every 10 seconds
+        phase = (time.monotonic() - self.started) % 10 / 10
+        in_use = int(MEMPOOL_SIZE * min(phase, 1 - phase) * 2)
+        cached = min(512, MEMPOOL_SIZE - in_use)
+        return {
+            "name": name,
+            "size": MEMPOOL_SIZE,
+            "cache_size": 512,
+            "elt_size": 2176,
+            "common_pool_count": MEMPOOL_SIZE - in_use - cached,
+            "total_cache_count": cached,
+        }
+
+    def _heap_info(self, heap_id):
+        return {
+            "Heap_id": heap_id,
+            "Name": f"socket_{heap_id}",
+            "Heap_size": HEAP_SIZE,
+            "Free_size": HEAP_SIZE // 2,
+            "Alloc_size": HEAP_SIZE // 2,
+            "Greatest_free_size": HEAP_SIZE // 4,
+            "Alloc_count": 100,
+            "Free_count": 10,
+        }
+
+    def _lcore_usage(self):
+        # one forwarding lcore per port, busy in proportion to the port's rate
+        total = int((time.monotonic() - self.started) * TSC_HZ)
+        lcores = range(1, self.ports + 1)
+        return {
+            "lcore_ids": list(lcores),
+            "total_cycles": [total for _ in lcores],
+            "busy_cycles": [
+                int(total * min(1.0, self.pps_per_port * lcore / LCORE_MAX_PPS))
+                for lcore in lcores
+            ],
+        }
+
+    def reply(self, cmd):
+        url, _, param = cmd.partition(",")
+        data = None
+        mempools = [f"mb_pool_{port}" for port in range(self.ports)]
+        if url == "/ethdev/list":
+            data = list(range(self.ports))
+        elif url in ("/ethdev/stats", "/ethdev/xstats") and param.isdigit():
+            port = int(param)
+            if port < self.ports:
+                if url == "/ethdev/stats":
+                    data = self._stats(port)
+                else:
+                    data = self._xstats(port)
+        elif url == "/mempool/list":
+            data = mempools
+        elif url == "/mempool/info" and param in mempools:
+            data = self._mempool_info(param)
+        elif url == "/eal/heap_list":
+            data = [0]
+        elif url == "/eal/heap_info" and param == "0":
+            data = self._heap_info(0)
+        elif url == "/eal/lcore/usage":
+            data = self._lcore_usage()
+        return json.dumps({url: data})
+
+    async def serve(self, conn):
+        loop = asyncio.get_running_loop()
+        handshake = {
+            "version": "DPDK 23.11.0",
+            "pid": os.getpid(),
+            "max_output_len": MAX_OUTPUT_LEN,
+        }
+        try:
+            await loop.sock_sendall(conn, json.dumps(handshake).encode())
+            while True:
+                cmd = await loop.sock_recv(conn, 1024)
+                if not cmd:
+                    return
+                self.commands += 1
+                if self.wedged:
+                    continue
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                if random.random() < self.fail_rate:
+                    # the application went away in the middle of a command
+                    return
+                await loop.sock_sendall(conn, self.reply(cmd.decode()).encode())
+        except OSError:
+            pass
+        finally:
+            conn.close()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        os.makedirs(os.path.dirname(self.sock_path), exist_ok=True)
+        if os.path.exists(self.sock_path):
+            os.unlink(self.sock_path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        server.bind(self.sock_path)
+        server.listen(16)
+        server.setblocking(False)
+        while True:
+            conn, _ = await loop.sock_accept(server)
+            conn.setblocking(False)
+            loop.create_task(self.serve(conn))
+
+
+async def serve_all(args):
+    apps = [
+        FakeApplication(
+            os.path.join(args.dir, f"app{i}", "dpdk_telemetry.v2"),
+            args.ports,
+            args.xstats,
+            args.latency / 1000,
+            args.fail_rate,
+            i < args.wedged,
+            args.pps,
+        )
+        for i in range(args.apps)
+    ]
+    await asyncio.gather(*(app.run() for app in apps))
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        "--apps",
+        type=int,
+        default=10,
+        help="Number of emulated DPDK applications.",
+    )
+    parser.add_argument(
+        "--ports",
+        type=int,
+        default=4,
+        help="Number of ports of every application.",
+    )
+    parser.add_argument(
+        "--xstats",
+        type=int,
+        default=100,
+        help="Number of xstats reported per port.",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0,
+        help="Processing time of every command in milliseconds.",
+    )
+    parser.add_argument(
+        "--fail-rate",
+        type=float,
+        default=0,
+        help="Probability that a command drops the connection instead of answering.",
+    )
+    parser.add_argument(
+        "--wedged",
+        type=int,
+        default=0,
+        help="Number of applications that never answer a command.",
+    )
+    parser.add_argument(
+        "--pps",
+        type=int,
+        default=1000000,
+        help="Packet rate of port 0, port n runs at n+1 times the rate.",
+    )
+
+
+def main():
+    logging.basicConfig(format='%(asctime)s - %(message)s', level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "-d",
+        "--dir",
+        default="/tmp/dpdk",
+        help="Directory to create the <app>/dpdk_telemetry.v2 sockets in, removed "
+        "on exit.",
+    )
+    add_arguments(parser)
+    args = parser.parse_args()
+    logging.info(
+        f"Serving {args.apps} applications with {args.ports} ports under {args.dir}"
+    )
+    try:
+        asyncio.run(serve_all(args))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shutil.rmtree(args.dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
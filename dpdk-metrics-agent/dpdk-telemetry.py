@@ -4,137 +4,2892 @@
 DPDK telemetry data over REST API
 """
 
+from __future__ import annotations
+
 import argparse
+import asyncio
+import glob
 import json
+import multiprocessing
+import multiprocessing.connection
 import socket
 import time
 import os
+import re
 import logging
+import math
 import signal
-from collections import defaultdict
-from typing import Iterable
-from prometheus_client import start_http_server
+import struct
+import threading
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import defaultdict, deque, namedtuple
+from typing import TYPE_CHECKING, Iterable
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from prometheus_client.core import REGISTRY, CounterMetricFamily
-from opentelemetry import metrics
-from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
-from opentelemetry.sdk.metrics import MeterProvider
-from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
-from opentelemetry.sdk.resources import SERVICE_NAME, Resource
+
+# prometheus_client and opentelemetry are only imported by the backends that are
+# enabled, see start_prometheus_backend() and start_otlp_backend()
+if TYPE_CHECKING:
+    # for the annotations of the OTLP callbacks
+    from opentelemetry import metrics
+
+
+# An immutable view of every DPDK application's stats at one point in time.
+# timestamp is taken from time.monotonic() once the sampling pass completes.
+Snapshot = namedtuple("Snapshot", ["timestamp", "apps"])
+
+# Per application entry of a Snapshot. An application that missed its query
+# deadline or failed keeps its last known stats and timestamp with stale set.
+# duration is the wall time of the whole query, rtt the mean command round trip.
+# rates, drops and resets are the per port outputs of RateTracker.update().
+# counters, queues and xstats are the allow-listed values flattened by StatsFilter,
+# as (port, stat, value), (port, queue, stat, value) and (port, stat, value) tuples.
+# mempools and heaps are the MempoolUsage and HeapUsage of the application,
+# lcores the {lcore: busy cycles / total cycles} of LcoreTracker.update().
+AppSample = namedtuple(
+    "AppSample",
+    [
+        "stats", "timestamp", "stale", "duration", "rtt", "rates", "drops", "resets",
+        "counters", "queues", "xstats", "bursts", "mempools", "heaps", "lcores",
+    ],
+)
+
+# in_use counts the objects neither in the common pool nor in a per-lcore cache
+MempoolUsage = namedtuple("MempoolUsage", ["name", "size", "in_use", "utilization"])
+HeapUsage = namedtuple(
+    "HeapUsage", ["name", "size", "free", "greatest_free", "utilization"]
+)
+
+# Windowed view of the high-frequency samples of one port, see BurstDetector.
+# buckets holds cumulative (upper bound, count) pairs of the rx pps histogram.
+BurstSummary = namedtuple(
+    "BurstSummary",
+    ["buckets", "rx_pps_sum", "rx_pps_max", "tx_pps_max", "window_bursts", "bursts"],
+)
+
+
+class Histogram:
+    """Fixed-bucket histogram, counts holds one count per bound plus the overflow."""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def buckets(self):
+        """Return cumulative (upper bound, count) pairs, ending with +Inf."""
+        buckets = []
+        total = 0
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            total += count
+            buckets.append((bound, total))
+        return buckets
+
+
+class AgentStats:
+    """Self-instrumentation of the agent, updated from the sampler, watchdog and
+    backend threads.
+
+    Histograms and counters are kept here rather than in the snapshot, they
+    accumulate over every query attempt, including the ones that fail. Backends
+    that keep their own histograms, such as OTLP, are called with every observed
+    value through listeners, as listener(histogram, value, labels).
+    """
+
+    DURATION_BUCKETS = (
+        0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5
+    )
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # histogram name -> label values -> Histogram
+        self.histograms = {"collection": {}, "command": {}, "export": {}}
+        # (app, reason) -> count
+        self.errors = defaultdict(int)
+        # (app, reason) -> count, connections dropped and reopened
+        self.reconnects = defaultdict(int)
+        # backend -> count
+        self.export_errors = defaultdict(int)
+        # discovery event -> count
+        self.discovery = defaultdict(int)
+        self.listeners = []
+        # when set to a list, every update is also appended to it, for a worker
+        # process to ship them to the main process, see replay()
+        self.journal = None
+
+    def observe(self, histogram, observations):
+        """Record (labels, value) observations, labels being a tuple of label values."""
+        with self.lock:
+            histograms = self.histograms[histogram]
+            for labels, value in observations:
+                if labels not in histograms:
+                    histograms[labels] = Histogram(self.DURATION_BUCKETS)
+                histograms[labels].observe(value)
+            if self.journal is not None:
+                self.journal.append(("observe", histogram, observations))
+        for listener in self.listeners:
+            for labels, value in observations:
+                listener(histogram, value, labels)
+
+    def _count(self, counter, key):
+        with self.lock:
+            getattr(self, counter)[key] += 1
+            if self.journal is not None:
+                self.journal.append(("count", counter, key))
+
+    def count_error(self, app, reason):
+        self._count("errors", (app, reason))
+
+    def count_reconnect(self, app, reason):
+        self._count("reconnects", (app, reason))
+
+    def count_export_error(self, backend):
+        self._count("export_errors", backend)
+
+    def count_discovery(self, event):
+        self._count("discovery", event)
+
+    def take_journal(self):
+        with self.lock:
+            journal, self.journal = self.journal, []
+        return journal
+
+    def replay(self, journal):
+        """Apply the updates journaled by the AgentStats of a worker process."""
+        for kind, name, update in journal:
+            if kind == "observe":
+                self.observe(name, update)
+            elif kind == "count":
+                self._count(name, update)
+            else:
+                self.forget(name)
+
+    def forget(self, app):
+        with self.lock:
+            self.histograms["collection"].pop((app,), None)
+            for counters in (self.errors, self.reconnects):
+                for key in [key for key in counters if key[0] == app]:
+                    del counters[key]
+            if self.journal is not None:
+                self.journal.append(("forget", app, None))
+
+    def view(self):
+        """Return copies of the histogram buckets and counters.
+
+        Safe to read while sampling.
+        """
+        with self.lock:
+            histograms = {
+                name: {labels: (h.buckets(), h.sum) for labels, h in histograms.items()}
+                for name, histograms in self.histograms.items()
+            }
+            return (
+                histograms,
+                dict(self.errors),
+                dict(self.reconnects),
+                dict(self.export_errors),
+                dict(self.discovery),
+            )
+
+
+AGENT_STATS = AgentStats()
+
+
+class TelemetryBackoff(Exception):
+    """Raised instead of reconnecting while an application is in reconnect backoff."""
+
+
+class DPDKTelemetry:
+    """Persistent connection to the telemetry socket of one DPDK application.
+
+    The connection, the max_output_len handshake and the port list are kept for as
+    long as the socket is healthy. The port list is refreshed on the open
+    connection every port_refresh seconds, or right away when a port stops
+    answering, so hotplugged ports are picked up without reconnecting.
+
+    Besides per-port urls, a query can cover urls indexed by another list, such as
+    /mempool/info by the names returned by /mempool/list. These lists are
+    refreshed together with the port list. A url without a list, such as
+    /eal/lcore/usage, is sent once without a parameter. DPDK versions without
+    such a command reply null, it is then no longer sent until the next
+    reconnect.
+
+    Only transport errors (socket errors, a closed or undecodable reply) drop the
+    connection. Reconnects are then spaced by an exponential backoff, from
+    backoff_min up to backoff_max seconds, and TelemetryBackoff is raised while it
+    lasts. A url that the application does not answer is left out of the results
+    without affecting the other urls.
+    """
+
+    def __init__(
+        self, sock_path, pipeline_depth=1, port_refresh=10.0, backoff_min=1.0,
+        backoff_max=30.0, app=None,
+    ):
+        self.sock_path = sock_path
+        # labels the agent's own metrics, the application directory name by default
+        self.app = app or os.path.basename(os.path.dirname(sock_path))
+        self.sock = None
+        self.max_out_len = 0
+        self.pid = None
+        self.port_ids = []
+        # list url -> keys of the indexed urls, for instance /mempool/list -> names
+        self.indexes = {}
+        # last successful result of every url
+        self.stats = defaultdict(dict)
+        self.pipeline_depth = max(1, pipeline_depth)
+        # mean command round trip of the last _cmds() call, in seconds
+        self.rtt = 0.0
+        # number of commands of the last query
+        self.query_commands = 0
+        # the sampler and the high-frequency sampler share the socket
+        self.lock = asyncio.Lock()
+        self.port_refresh = port_refresh
+        self.ports_refreshed = 0.0
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.backoff = 0.0
+        self.next_connect = 0.0
+        # urls the application did not answer, logged once until they recover
+        self.failed_urls = set()
+        # urls without a list the application does not support, not sent again
+        # on this connection
+        self.unsupported_urls = set()
+
+    def __del__(self):
+        self._close_sock()
+
+    def _close_sock(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except Exception as e:
+                e = f"{self.sock_path}: {e}"
+                logging.warning(f"Failed to close socket: {e}")
+            finally:
+                self.sock = None
+                self.max_out_len = 0
+
+    def _backoff_and_close(self, reason):
+        AGENT_STATS.count_error(self.app, reason)
+        # max_out_len is only known once the handshake went through
+        if self.sock is not None and self.max_out_len:
+            AGENT_STATS.count_reconnect(self.app, reason)
+        if self.backoff:
+            self.backoff = min(self.backoff_max, self.backoff * 2)
+        else:
+            self.backoff = self.backoff_min
+        self.next_connect = time.monotonic() + self.backoff
+        self._close_sock()
+
+    @staticmethod
+    def _failure_reason(e):
+        if isinstance(e, (FileNotFoundError, ConnectionRefusedError)):
+            return "connect_failed"
+        if isinstance(e, ConnectionError):
+            return "connection_closed"
+        if isinstance(e, OSError):
+            return "socket_error"
+        return "bad_reply"
+
+    def _connection_failed(self, e):
+        self._backoff_and_close(self._failure_reason(e))
+        logging.warning(f"{self.sock_path}: {e}, reconnecting in {self.backoff:.1f}s")
+
+    async def _recv(self, size):
+        reply = await asyncio.get_running_loop().sock_recv(self.sock, size)
+        if not reply:
+            raise ConnectionError("connection closed by the DPDK application")
+        return reply
+
+    async def _connect_socket(self):
+        loop = asyncio.get_running_loop()
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self.sock.setblocking(False)
+        await loop.sock_connect(self.sock, self.sock_path)
+        data = json.loads((await self._recv(1024)).decode())
+        self.max_out_len = data["max_output_len"]
+        self.pid = data.get("pid")
+        self.unsupported_urls = set()
+        await self._refresh_ports()
+        logging.info(f"Socket successfully connected to {self.sock_path}")
+
+    async def _refresh_ports(self):
+        list_urls = list(self.indexes)
+        replies = await self._cmds(["/ethdev/list"] + list_urls)
+        port_ids = replies[0]["/ethdev/list"]
+        if self.port_ids and port_ids != self.port_ids:
+            logging.info(
+                f"{self.sock_path}: ports changed from {self.port_ids} to {port_ids}"
+            )
+        self.port_ids = port_ids
+        for url, reply in zip(list_urls, replies[1:]):
+            # null on DPDK versions without the endpoint
+            self.indexes[url] = reply.get(url) or []
+        self.ports_refreshed = time.monotonic()
+
+    async def _ensure_connected(self):
+        if self.sock is None:
+            if time.monotonic() < self.next_connect:
+                raise TelemetryBackoff(self.sock_path)
+            await self._connect_socket()
+        elif time.monotonic() - self.ports_refreshed >= self.port_refresh:
+            await self._refresh_ports()
+
+    async def _cmd(self, c):
+        return (await self._cmds([c]))[0]
+
+    async def _cmds(self, cmds):
+        """Issue cmds with up to pipeline_depth of them in flight on the socket.
+
+        The telemetry server answers the commands of a connection one by one, in
+        order, and every reply is a single SOCK_SEQPACKET message, so replies are
+        matched to commands by position.
+        """
+        loop = asyncio.get_running_loop()
+        sent_at = deque()
+        replies = []
+        rtts = []
+        while len(replies) < len(cmds):
+            while (
+                len(sent_at) < self.pipeline_depth
+                and len(replies) + len(sent_at) < len(cmds)
+            ):
+                cmd = cmds[len(replies) + len(sent_at)]
+                await loop.sock_sendall(self.sock, cmd.encode())
+                sent_at.append(time.monotonic())
+            reply = await self._recv(self.max_out_len)
+            rtts.append(time.monotonic() - sent_at.popleft())
+            replies.append(json.loads(reply))
+        self.rtt = sum(rtts) / len(cmds) if cmds else 0.0
+        AGENT_STATS.observe(
+            "command", [((c.partition(",")[0],), rtt) for c, rtt in zip(cmds, rtts)]
+        )
+        return replies
+
+    async def _query(self, urls, port_ids=None, indexed=()):
+        """Return {url: {port: data}} for the urls the application answered.
+
+        port_ids defaults to every port of the application. indexed holds
+        (list url, url) pairs, their results are keyed by the list entries, or by
+        None for a url whose list url is None.
+        """
+        async with self.lock:
+            try:
+                missing = [
+                    list_url for list_url, _ in indexed
+                    if list_url is not None and list_url not in self.indexes
+                ]
+                for list_url in missing:
+                    self.indexes[list_url] = []
+                if missing and self.sock is not None:
+                    self.ports_refreshed = 0.0
+                await self._ensure_connected()
+                if port_ids is None:
+                    port_ids = self.port_ids
+                else:
+                    port_ids = [i for i in port_ids if i in self.port_ids]
+                batches = [(url, port_ids) for url in urls]
+                batches += [
+                    (url, [None] if list_url is None else self.indexes[list_url])
+                    for list_url, url in indexed
+                    if url not in self.unsupported_urls
+                ]
+                cmds = [
+                    url if key is None else f"{url},{key}"
+                    for url, keys in batches
+                    for key in keys
+                ]
+                self.query_commands = len(cmds)
+                replies = iter(await self._cmds(cmds))
+            except asyncio.CancelledError:
+                # missed its deadline, a late reply would be taken as the answer
+                # to the next command
+                self._backoff_and_close("timeout")
+                raise
+            except (OSError, ValueError, KeyError) as e:
+                self._connection_failed(e)
+                raise
+            self.backoff = 0.0
+        results = {}
+        for url, keys in batches:
+            answered = {}
+            for key in keys:
+                data = next(replies).get(url)
+                if data is not None:
+                    answered[key] = data
+            if keys == [None] and not answered:
+                # an older DPDK without the command, not an error
+                self.unsupported_urls.add(url)
+                logging.info(
+                    f"{self.sock_path}: {url} is not supported, not sampling it"
+                )
+                continue
+            if len(answered) < len(keys):
+                # a port or a mempool went away, pick up the new lists with the
+                # next query
+                self.ports_refreshed = 0.0
+            if answered or not keys:
+                self.failed_urls.discard(url)
+                results[url] = answered
+                continue
+            AGENT_STATS.count_error(self.app, "no_data")
+            if url not in self.failed_urls:
+                self.failed_urls.add(url)
+                logging.warning(f"{self.sock_path}: no data for {url}")
+        return results
+
+    async def connect_and_get(self, url):
+        return (await self.connect_and_get_all([url]))[url]
+
+    async def connect_and_get_all(self, urls, indexed=()):
+        """Query several per-port and indexed urls in one pipelined batch."""
+        results = await self._query(urls, indexed=indexed)
+        self.stats.update(results)
+        return results
+
+    async def get_ports(self, url, port_ids):
+        """Query a per-port url for a subset of the ports, without caching it."""
+        return (await self._query([url], port_ids)).get(url, {})
+
+
+class SocketEventHandler(FileSystemEventHandler):
+    def __init__(self, sock_dict, telemetry_options):
+        self.socks = sock_dict
+        self.telemetry_options = telemetry_options
+
+    def on_created(self, event):
+        if event.is_directory:
+            app_name = os.path.basename(event.src_path)
+            logging.info(f"New DPDK application created: {app_name}")
+            AGENT_STATS.count_discovery("created")
+            self.socks[app_name] = DPDKTelemetry(
+                event.src_path + "/dpdk_telemetry.v2", **self.telemetry_options
+            )
+
+    def on_deleted(self, event):
+        if event.is_directory:
+            app_name = os.path.basename(event.src_path)
+            logging.info(f"DPDK application deleted: {app_name}")
+            AGENT_STATS.count_discovery("deleted")
+            del self.socks[app_name]
+
+
+class SocketDiscovery:
+    """Find the telemetry sockets of the DPDK applications under glob patterns.
+
+    Every directory matching one of the patterns is searched recursively for
+    dpdk_telemetry.v2 sockets, so one agent per node can cover the runtime
+    directories of every pod, for instance with
+    /var/lib/kubelet/pods/*/volumes/kubernetes.io~empty-dir/*. An application
+    is named after the path of its socket directory below the part of the
+    pattern without wildcards, which is its bare directory name for a plain
+    --sock-prefix.
+
+    The patterns are rescanned by update(), which reports the applications that
+    appeared or went away to a sampler's add_app() and remove_app().
+    """
+
+    SOCKET_NAME = "dpdk_telemetry.v2"
+
+    def __init__(self, patterns):
+        self.patterns = patterns
+        # app -> socket path
+        self.apps = {}
+
+    @staticmethod
+    def _fixed_prefix(pattern):
+        parts = []
+        for part in pattern.rstrip(os.sep).split(os.sep):
+            if glob.has_magic(part):
+                break
+            parts.append(part)
+        return os.sep.join(parts)
+
+    def scan(self):
+        """Return {app: socket path} for every socket found under the patterns."""
+        found = {}
+        for pattern in self.patterns:
+            prefix = self._fixed_prefix(pattern)
+            for root in glob.glob(pattern):
+                for directory, _, files in os.walk(root):
+                    if self.SOCKET_NAME not in files:
+                        continue
+                    sock_path = os.path.join(directory, self.SOCKET_NAME)
+                    app = os.path.relpath(directory, prefix)
+                    if app == os.curdir:
+                        app = os.path.basename(directory)
+                    if found.get(app, sock_path) != sock_path:
+                        # the same name below two patterns, fall back to the full path
+                        app = directory
+                    found[app] = sock_path
+        return found
+
+    def update(self, sampler):
+        found = self.scan()
+        for app in self.apps.keys() - found.keys():
+            logging.info(f"DPDK application deleted: {app}")
+            AGENT_STATS.count_discovery("deleted")
+            sampler.remove_app(app)
+        for app, sock_path in found.items():
+            if self.apps.get(app) != sock_path:
+                logging.info(f"New DPDK application created: {app}")
+                AGENT_STATS.count_discovery("created")
+                sampler.add_app(app, sock_path)
+        self.apps = found
+
+
+class RateTracker:
+    """Derive per-port rates from consecutive samples of the cumulative ethdev counters.
+
+    The previous sample of every application is kept together with its monotonic
+    timestamp and the pid of the DPDK process. A port whose counters went
+    backwards, or every port of an application whose pid changed, is counted as
+    a reset and re-baselined. Ports that are new since the previous sample only
+    provide a baseline, ports that disappeared are forgotten.
+    """
+
+    # rate name -> (ethdev stats counters that are summed up, scale factor)
+    RATES = {
+        "rx_pps": (("ipackets",), 1),
+        "rx_bps": (("ibytes",), 8),
+        "tx_pps": (("opackets",), 1),
+        "tx_bps": (("obytes",), 8),
+        "rx_drop_pps": (("imissed", "ierrors"), 1),
+        "tx_drop_pps": (("oerrors",), 1),
+    }
+    # drop cause -> ethdev stats counter of the packets lost for that cause
+    DROP_CAUSES = {
+        # the NIC found no free rx descriptor, the worker did not poll fast enough
+        "nic_overrun": "imissed",
+        # no mbuf could be allocated to refill the rx ring, the mempool ran dry
+        "buffer_starvation": "rx_nombuf",
+        "rx_errors": "ierrors",
+        "tx_errors": "oerrors",
+    }
+    COUNTERS = (
+        "ipackets", "ibytes", "opackets", "obytes", "imissed", "ierrors", "oerrors",
+        "rx_nombuf",
+    )
+
+    def __init__(self):
+        # app -> (pid, timestamp, {port: stats})
+        self.previous = {}
+        # app -> {port: number of counter resets seen}
+        self.resets = {}
+
+    def _is_reset(self, before, current):
+        return any(current.get(c, 0) < before.get(c, 0) for c in self.COUNTERS)
+
+    def update(self, app, pid, timestamp, stats):
+        """Record a fresh sample and return per port rates, drops and resets.
+
+        These are ({port: {rate: value}}, {port: {drop cause: pps}}, {port: resets}).
+        """
+        previous = self.previous.get(app)
+        known = self.resets.get(app, {})
+        resets = {port: known.get(port, 0) for port in stats}
+        if previous is not None and previous[0] != pid:
+            logging.info(
+                f"{app}: pid changed from {previous[0]} to {pid}, counters reset"
+            )
+            for port in previous[2]:
+                if port in stats:
+                    resets[port] += 1
+            previous = None
+        rates = {}
+        drops = {}
+        for port, current in stats.items():
+            if not isinstance(current, dict):
+                continue
+            before = previous[2].get(port) if previous is not None else None
+            if not isinstance(before, dict):
+                continue
+            if self._is_reset(before, current):
+                logging.info(
+                    f"{app}: counters of port {port} went backwards, re-baselining"
+                )
+                resets[port] += 1
+                continue
+            elapsed = timestamp - previous[1]
+            if elapsed <= 0:
+                continue
+            rates[port] = {
+                name: sum(current.get(c, 0) - before.get(c, 0) for c in counters)
+                * scale / elapsed
+                for name, (counters, scale) in self.RATES.items()
+            }
+            drops[port] = {
+                cause: (current.get(c, 0) - before.get(c, 0)) / elapsed
+                for cause, c in self.DROP_CAUSES.items()
+            }
+        self.previous[app] = (pid, timestamp, stats)
+        self.resets[app] = resets
+        return rates, drops, resets
+
+    def forget(self, app):
+        self.previous.pop(app, None)
+        self.resets.pop(app, None)
+
+
+class LcoreTracker:
+    """Derive the utilization of every lcore from consecutive /eal/lcore/usage replies.
+
+    Poll-mode lcores spin at 100% CPU, the busy cycles they report, those spent
+    on polls that returned packets, tell how loaded they really are. The
+    utilization is the share of busy cycles over the sampling interval. Like
+    RateTracker, a new pid or cycles going backwards only re-baselines.
+    """
+
+    def __init__(self):
+        # app -> (pid, {lcore: (total cycles, busy cycles)})
+        self.previous = {}
+
+    def update(self, app, pid, usage):
+        """Record a fresh /eal/lcore/usage reply and return {lcore: utilization}."""
+        if not usage:
+            self.previous.pop(app, None)
+            return {}
+        cycles = {
+            lcore: (total, busy)
+            for lcore, total, busy in zip(
+                usage.get("lcore_ids", []),
+                usage.get("total_cycles", []),
+                usage.get("busy_cycles", []),
+            )
+        }
+        previous = self.previous.get(app)
+        self.previous[app] = (pid, cycles)
+        if previous is None or previous[0] != pid:
+            return {}
+        utilization = {}
+        for lcore, (total, busy) in cycles.items():
+            before = previous[1].get(lcore)
+            if before is None or total <= before[0] or busy < before[1]:
+                continue
+            utilization[lcore] = min(1.0, (busy - before[1]) / (total - before[0]))
+        return utilization
+
+    @staticmethod
+    def headroom(utilization):
+        """Return the idle share of the busiest lcore and the idle lcores in total."""
+        if not utilization:
+            return None
+        return 1 - max(utilization.values()), sum(1 - u for u in utilization.values())
+
+    def forget(self, app):
+        self.previous.pop(app, None)
+
+
+class StatsFilter:
+    """Flatten ethdev stats and xstats into labelled values, keeping allow-listed names.
+
+    stats_pattern is matched against the /ethdev/stats field names, including the
+    per-queue q_* arrays, xstats_pattern against the /ethdev/xstats names. An
+    empty xstats_pattern disables the /ethdev/xstats query altogether.
+
+    The q_* arrays always have RTE_ETHDEV_QUEUE_STAT_CNTRS entries, most of them
+    unused. Queues are exported up to the highest index that was ever non-zero on
+    the port, so the number of series is bounded and does not flap.
+    """
+
+    def __init__(self, stats_pattern, xstats_pattern):
+        self.stats_re = re.compile(stats_pattern)
+        self.xstats_re = re.compile(xstats_pattern) if xstats_pattern else None
+        # name -> allowed, the same names come back on every sample
+        self._stats_allowed = {}
+        self._xstats_allowed = {}
+        # app -> {port: number of queues exported}
+        self._queues = {}
+
+    @property
+    def urls(self):
+        if self.xstats_re is None:
+            return ["/ethdev/stats"]
+        return ["/ethdev/stats", "/ethdev/xstats"]
+
+    def _allowed(self, cache, regex, name):
+        allowed = cache.get(name)
+        if allowed is None:
+            allowed = cache[name] = regex.search(name) is not None
+        return allowed
+
+    def flatten(self, app, stats, xstats):
+        counters = []
+        queues = []
+        app_queues = self._queues.setdefault(app, {})
+        for port, port_stats in stats.items():
+            if not isinstance(port_stats, dict):
+                continue
+            allowed = [
+                (name, value) for name, value in port_stats.items()
+                if self._allowed(self._stats_allowed, self.stats_re, name)
+            ]
+            nb_queues = app_queues.get(port, 0)
+            for name, value in allowed:
+                if isinstance(value, list):
+                    used = [i for i, v in enumerate(value) if v]
+                    if used:
+                        nb_queues = max(nb_queues, used[-1] + 1)
+            app_queues[port] = nb_queues
+            for name, value in allowed:
+                if not isinstance(value, list):
+                    counters.append((port, name, value))
+                    continue
+                stat = name[2:] if name.startswith("q_") else name
+                for queue, v in enumerate(value[:nb_queues]):
+                    queues.append((port, queue, stat, v))
+        for port in app_queues.keys() - stats.keys():
+            del app_queues[port]
+        flat_xstats = []
+        for port, port_xstats in xstats.items():
+            if not isinstance(port_xstats, dict):
+                continue
+            for name, value in port_xstats.items():
+                if self._allowed(self._xstats_allowed, self.xstats_re, name):
+                    flat_xstats.append((port, name, value))
+        return counters, queues, flat_xstats
+
+    def forget(self, app):
+        self._queues.pop(app, None)
+
+
+class RateRing:
+    """Fixed-size ring buffer of high-frequency rate samples.
+
+    Samples live in preallocated array('d') columns, a window of thousands of
+    samples costs a few tens of kilobytes per port and no per-sample objects.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.rx_pps = array("d", bytes(8 * size))
+        self.tx_pps = array("d", bytes(8 * size))
+        self.count = 0
+        self.pos = 0
+        self.rx_sum = 0.0
+
+    def append(self, rx_pps, tx_pps):
+        if self.count == self.size:
+            self.rx_sum -= self.rx_pps[self.pos]
+        else:
+            self.count += 1
+        self.rx_pps[self.pos] = rx_pps
+        self.tx_pps[self.pos] = tx_pps
+        self.rx_sum += rx_pps
+        self.pos = (self.pos + 1) % self.size
+
+    def rx_mean(self):
+        return self.rx_sum / self.count if self.count else 0.0
+
+    def window(self, column):
+        # order does not matter for most of the window statistics
+        return column[:self.count] if self.count < self.size else column
+
+    def ordered(self, column):
+        if self.count < self.size:
+            return column[:self.count]
+        return column[self.pos:] + column[:self.pos]
+
+
+class BurstDetector:
+    """Sample selected ports every few milliseconds and keep microburst statistics.
+
+    Runs as a task on the sampler's event loop, sharing the application sockets.
+    For every selected port the rx/tx pps of each high-frequency interval is kept
+    in a RateRing. A burst is a run of consecutive intervals whose rx pps exceeds
+    burst_factor times the mean rx pps of the window.
+    """
+
+    def __init__(self, interval, timeout, ports_pattern, window, buckets, burst_factor):
+        self.interval = interval
+        self.timeout = timeout
+        self.ports_re = re.compile(ports_pattern)
+        self.window = window
+        self.buckets = sorted(buckets)
+        self.burst_factor = burst_factor
+        # (app, port) -> RateRing
+        self.rings = {}
+        # (app, port) -> (pid, timestamp, ipackets, opackets)
+        self.previous = {}
+        # (app, port) -> [bursts since start, currently in a burst]
+        self.bursts = {}
+
+    def _selected(self, app, port_ids):
+        return [port for port in port_ids if self.ports_re.search(f"{app}:{port}")]
+
+    def _record(self, app, pid, timestamp, stats):
+        for port, port_stats in stats.items():
+            if not isinstance(port_stats, dict):
+                continue
+            key = (app, port)
+            current = (pid, timestamp, port_stats["ipackets"], port_stats["opackets"])
+            previous = self.previous.get(key)
+            self.previous[key] = current
+            if previous is None or previous[0] != pid:
+                continue
+            elapsed = timestamp - previous[1]
+            rx = current[2] - previous[2]
+            tx = current[3] - previous[3]
+            if elapsed <= 0 or rx < 0 or tx < 0:
+                # counter reset, the next interval starts from the new baseline
+                continue
+            ring = self.rings.get(key)
+            if ring is None:
+                ring = self.rings[key] = RateRing(self.window)
+                self.bursts[key] = [0, False]
+            rx_pps = rx / elapsed
+            ring.append(rx_pps, tx / elapsed)
+            burst = self.bursts[key]
+            above = ring.count > 1 and rx_pps > self.burst_factor * ring.rx_mean()
+            if above and not burst[1]:
+                burst[0] += 1
+            burst[1] = above
+
+    async def _sample_app(self, app, sock):
+        port_ids = self._selected(app, sock.port_ids)
+        if not port_ids:
+            return
+        try:
+            stats = await asyncio.wait_for(
+                sock.get_ports("/ethdev/stats", port_ids), self.timeout
+            )
+        except Exception:
+            # the regular sampler reports errors and staleness
+            return
+        self._record(app, sock.pid, time.monotonic(), stats)
+
+    async def run(self, socks, stop_event):
+        next_tick = time.monotonic()
+        while not stop_event.is_set():
+            apps = list(socks.items())
+            await asyncio.gather(*(self._sample_app(app, sock) for app, sock in apps))
+            next_tick += self.interval
+            delay = next_tick - time.monotonic()
+            if delay < 0:
+                # overrun, skip the missed ticks instead of bursting to catch up
+                next_tick = time.monotonic()
+                delay = 0
+            await asyncio.sleep(delay)
+
+    def summary(self, app):
+        """Return {port: BurstSummary} over the current window of the selected ports."""
+        summaries = {}
+        for (ring_app, port), ring in self.rings.items():
+            if ring_app != app or not ring.count:
+                continue
+            rx = ring.window(ring.rx_pps)
+            counts = [0] * (len(self.buckets) + 1)
+            for value in rx:
+                counts[bisect_left(self.buckets, value)] += 1
+            cumulative = []
+            total = 0
+            for bound, count in zip(self.buckets + [float("inf")], counts):
+                total += count
+                cumulative.append((bound, total))
+            # recompute the running sum to shed floating point drift
+            ring.rx_sum = sum(rx)
+            threshold = self.burst_factor * ring.rx_mean()
+            window_bursts = 0
+            above = False
+            for value in ring.ordered(ring.rx_pps):
+                if value > threshold and not above:
+                    window_bursts += 1
+                above = value > threshold
+            summaries[port] = BurstSummary(
+                cumulative, ring.rx_sum, max(rx), max(ring.window(ring.tx_pps)),
+                window_bursts, self.bursts[(app, port)][0],
+            )
+        return summaries
+
+    def forget(self, app):
+        for key in [key for key in self.rings if key[0] == app]:
+            del self.rings[key]
+            del self.bursts[key]
+        for key in [key for key in self.previous if key[0] == app]:
+            del self.previous[key]
+
+
+class AdaptiveScheduler:
+    """Pick the sampling interval of every application from how its traffic moves.
+
+    An application whose total rx + tx pps changed by at least change_threshold
+    since its previous sample, or whose name matches fast_apps, is sampled every
+    fast_interval for at least FAST_HOLD samples. An application without any
+    traffic backs off to slow_interval, and is promoted again by the first
+    sample that sees traffic. Every other application is sampled every interval.
+
+    When budget is set, the fast intervals are granted within that many
+    telemetry commands per second across all applications, to the matching
+    applications first and then by decreasing rate change.
+    """
+
+    FAST_HOLD = 10
+
+    def __init__(
+        self, interval, fast_interval, slow_interval, fast_apps, budget,
+        change_threshold,
+    ):
+        self.interval = interval
+        self.fast_interval = fast_interval
+        self.slow_interval = slow_interval
+        self.fast_apps_re = re.compile(fast_apps) if fast_apps else None
+        self.budget = budget
+        self.change_threshold = change_threshold
+        # app -> monotonic time of the last query
+        self.sampled = {}
+        # app -> telemetry commands per query
+        self.commands = {}
+        # app -> total pps of the last fresh sample
+        self.pps = {}
+        # app -> fast samples left before falling back to the normal interval
+        self.hold = {}
+        # app -> (wanted interval, priority for the fast interval)
+        self.wanted = {}
+        # app -> interval granted by plan()
+        self.intervals = {}
+
+    def due(self, apps, now):
+        """Return the applications due for a query at now, new ones are due at once."""
+        return [
+            app for app in apps
+            if now >= self.sampled.get(app, 0.0) + self.intervals.get(app, 0.0)
+        ]
+
+    def next_due(self):
+        return min(
+            (self.sampled[app] + interval for app, interval in self.intervals.items()),
+            default=time.monotonic() + self.interval,
+        )
+
+    def _classify(self, app, sample):
+        if self.fast_apps_re is not None and self.fast_apps_re.search(app):
+            return self.fast_interval, float("inf")
+        if sample.stale or not sample.rates:
+            # reconnecting or just baselined, DPDKTelemetry backs off on its own
+            return self.interval, 0.0
+        pps = sum(rates["rx_pps"] + rates["tx_pps"] for rates in sample.rates.values())
+        previous = self.pps.get(app)
+        self.pps[app] = pps
+        if previous is None:
+            return self.interval, 0.0
+        change = abs(pps - previous) / max(pps, previous) if pps or previous else 0.0
+        if change >= self.change_threshold:
+            self.hold[app] = self.FAST_HOLD
+            return self.fast_interval, change
+        if self.hold.get(app, 0) > 0:
+            self.hold[app] -= 1
+            return self.fast_interval, change
+        if pps == 0:
+            return self.slow_interval, 0.0
+        return self.interval, 0.0
+
+    def record(self, app, sample, started, commands):
+        """Account for a query of app that started at the monotonic time started."""
+        self.sampled[app] = started
+        self.commands[app] = commands
+        self.wanted[app] = self._classify(app, sample)
+
+    def plan(self):
+        intervals = {app: interval for app, (interval, _) in self.wanted.items()}
+        if self.budget > 0:
+            cost = sum(
+                self.commands.get(app, 0) / interval
+                for app, interval in intervals.items()
+            )
+            candidates = sorted(
+                (priority, app) for app, (interval, priority) in self.wanted.items()
+                if interval == self.fast_interval
+            )
+            for _, app in candidates:
+                if cost <= self.budget:
+                    break
+                commands = self.commands.get(app, 0)
+                cost -= commands / self.fast_interval - commands / self.interval
+                intervals[app] = self.interval
+        self.intervals = intervals
+
+    def forget(self, app):
+        for state in (
+            self.sampled, self.commands, self.pps, self.hold, self.wanted,
+            self.intervals,
+        ):
+            state.pop(app, None)
+
+
+class SampleRecorder:
+    """Append every fresh sample to a compact binary time series file per application.
+
+    A recording file is an 8 byte magic, the little-endian uint32 length of a JSON
+    header describing the columns, the header padded with spaces to a multiple of
+    8 bytes, then fixed-width records of little-endian uint64: the wall clock
+    timestamp in nanoseconds followed by one value per column. The data section is
+    8 byte aligned and can be memory mapped as a (records, columns + 1) uint64
+    array, recording_reader.py loads a whole file with a single read.
+
+    A new file is started when the columns of an application change, for instance
+    when a port is hotplugged, or when the current file reaches rotate_bytes. The
+    oldest files of an application are removed to keep its recordings under
+    max_bytes.
+    """
+
+    MAGIC = b"DPDKREC1"
+    # labels the failures of the recorder in the agent's own metrics
+    name = "recorder"
+
+    def __init__(self, directory, rotate_bytes, max_bytes):
+        self.directory = directory
+        self.rotate_bytes = rotate_bytes
+        self.max_bytes = max_bytes
+        # app -> (file object, columns, bytes written)
+        self.files = {}
+        # app -> timestamp of the last recorded sample, stale samples repeat it
+        self.recorded = {}
+
+    @staticmethod
+    def columns(sample):
+        names = [f"{port}.{stat}" for port, stat, _ in sample.counters]
+        names += [f"{port}.q{queue}.{stat}" for port, queue, stat, _ in sample.queues]
+        names += [f"{port}.x.{stat}" for port, stat, _ in sample.xstats]
+        return names
+
+    @staticmethod
+    def values(sample):
+        values = [value for _, _, value in sample.counters]
+        values += [value for _, _, _, value in sample.queues]
+        values += [value for _, _, value in sample.xstats]
+        return values
+
+    def _app_dir(self, app):
+        return os.path.join(self.directory, app.replace(os.sep, "_"))
+
+    def _open(self, app, columns):
+        app_dir = self._app_dir(app)
+        os.makedirs(app_dir, exist_ok=True)
+        created = time.time()
+        name = (
+            time.strftime("%Y%m%dT%H%M%S", time.gmtime(created))
+            + f"-{int(created * 1e6) % 1000000:06d}.rec"
+        )
+        header = json.dumps(
+            {"app": app, "created": created, "columns": columns}
+        ).encode()
+        header += b" " * (-(len(self.MAGIC) + 4 + len(header)) % 8)
+        f = open(os.path.join(app_dir, name), "wb", buffering=0)
+        f.write(self.MAGIC + struct.pack("<I", len(header)) + header)
+        logging.info(f"{app}: recording to {f.name}")
+        self._enforce_cap(app_dir)
+        return f, columns, len(self.MAGIC) + 4 + len(header)
+
+    def _enforce_cap(self, app_dir):
+        recordings = sorted(
+            os.path.join(app_dir, name)
+            for name in os.listdir(app_dir)
+            if name.endswith(".rec")
+        )
+        total = sum(os.path.getsize(path) for path in recordings)
+        # never remove the file that was just opened
+        for path in recordings[:-1]:
+            if total <= self.max_bytes:
+                break
+            total -= os.path.getsize(path)
+            os.remove(path)
+
+    def _close(self, app):
+        f, _, _ = self.files.pop(app)
+        f.close()
+
+    def __call__(self, snapshot):
+        wall_offset = time.time() - time.monotonic()
+        for app, sample in snapshot.apps.items():
+            if sample.stale or self.recorded.get(app) == sample.timestamp:
+                continue
+            self.recorded[app] = sample.timestamp
+            columns = self.columns(sample)
+            record = struct.pack(
+                f"<{len(columns) + 1}Q",
+                int((sample.timestamp + wall_offset) * 1e9),
+                *self.values(sample),
+            )
+            current = self.files.get(app)
+            if current is not None and (
+                current[1] != columns or current[2] + len(record) > self.rotate_bytes
+            ):
+                self._close(app)
+                current = None
+            if current is None:
+                current = self._open(app, columns)
+            f, _, size = current
+            f.write(record)
+            self.files[app] = (f, columns, size + len(record))
+        for app in self.files.keys() - snapshot.apps.keys():
+            self._close(app)
+            self.recorded.pop(app, None)
+
+    def close(self):
+        for app in list(self.files):
+            self._close(app)
+
+
+class RollupRing:
+    """Aggregates of one series at one resolution, oldest buckets overwritten first.
+
+    Bucket b covers the wall clock seconds [b * resolution, (b + 1) * resolution).
+    The columns are array('d') rings that grow up to slots entries, so a series
+    only costs memory for the history it actually has, about 48 bytes per bucket.
+    """
+
+    def __init__(self, resolution, slots):
+        self.resolution = resolution
+        self.slots = slots
+        self.bucket = array("q")
+        self.min = array("d")
+        self.max = array("d")
+        self.sum = array("d")
+        self.count = array("d")
+        self.last = array("d")
+        # position of the newest bucket
+        self.head = -1
+
+    def add(self, timestamp, value):
+        bucket = int(timestamp // self.resolution)
+        head = self.head
+        if head >= 0 and self.bucket[head] == bucket:
+            self.min[head] = min(self.min[head], value)
+            self.max[head] = max(self.max[head], value)
+            self.sum[head] += value
+            self.count[head] += 1
+            self.last[head] = value
+            return
+        if head >= 0 and bucket < self.bucket[head]:
+            # the wall clock went backwards, keep the history ordered
+            return
+        head = (head + 1) % self.slots
+        if head == len(self.bucket):
+            for column, initial in (
+                (self.bucket, bucket), (self.min, value), (self.max, value),
+                (self.sum, value), (self.count, 1), (self.last, value),
+            ):
+                column.append(initial)
+        else:
+            self.bucket[head] = bucket
+            self.min[head] = self.max[head] = self.sum[head] = self.last[head] = value
+            self.count[head] = 1
+        self.head = head
+
+    def ordered(self):
+        """Yield the positions of the buckets from the oldest to the newest."""
+        size = len(self.bucket)
+        start = (self.head + 1) % size if size == self.slots else 0
+        for i in range(size):
+            yield (start + i) % size
+
+    def query(self, start, end):
+        """Return the buckets overlapping [start, end) as compact columns.
+
+        The columns are aligned on the first bucket and hold one entry per
+        resolution step, null where the series has no sample.
+        """
+        first = int(start // self.resolution)
+        last = int(math.ceil(end / self.resolution))
+        selected = [
+            i for i in self.ordered() if first <= self.bucket[i] < last
+        ]
+        result = {
+            "start": None, "step": self.resolution,
+            "min": [], "max": [], "avg": [], "last": [],
+        }
+        if not selected:
+            return result
+        origin = self.bucket[selected[0]]
+        width = self.bucket[selected[-1]] - origin + 1
+        columns = {name: [None] * width for name in ("min", "max", "avg", "last")}
+        for i in selected:
+            offset = self.bucket[i] - origin
+            # millisecond precision is plenty for rates and keeps the reply small
+            columns["min"][offset] = round(self.min[i], 3)
+            columns["max"][offset] = round(self.max[i], 3)
+            columns["avg"][offset] = round(self.sum[i] / self.count[i], 3)
+            columns["last"][offset] = round(self.last[i], 3)
+        result.update(columns, start=origin * self.resolution)
+        return result
+
+
+class RollupStore:
+    """Keep bounded multi-resolution roll-ups of every application, port and stat.
+
+    Registered as a sampler listener, every fresh sample adds its derived rates,
+    drop causes and allow-listed counters whose name matches stats_filter to a
+    RollupRing per resolution. resolutions is a list of (seconds, buckets), for
+    instance [(1, 600), (10, 2160), (60, 2880)] keeps 10 minutes of 1 second
+    buckets, 6 hours of 10 second buckets and 2 days of 1 minute buckets.
+
+    A series that has not been updated for the longest retention is dropped, the
+    history of an application that went away is kept until then. Queries come
+    from the threads of the HTTP endpoint, see start_rollup_server().
+    """
+
+    name = "rollups"
+
+    def __init__(self, resolutions, stats_filter):
+        self.resolutions = sorted(resolutions)
+        self.retention = max(
+            resolution * slots for resolution, slots in self.resolutions
+        )
+        self.stats_re = re.compile(stats_filter)
+        self.lock = threading.Lock()
+        # (app, port, stat) -> ([RollupRing per resolution], wall clock of the
+        # last update)
+        self.series = {}
+        # app -> timestamp of the last sample added, stale samples repeat it
+        self.recorded = {}
+
+    @staticmethod
+    def parse(spec):
+        """Parse a "seconds:buckets,..." --rollups value.
+
+        Returns a list of (seconds, buckets).
+        """
+        resolutions = []
+        for item in spec.split(","):
+            resolution, _, slots = item.partition(":")
+            try:
+                resolutions.append((float(resolution), int(slots)))
+            except ValueError:
+                raise argparse.ArgumentTypeError(f"invalid roll-up resolution: {item}")
+            if resolutions[-1][0] <= 0 or resolutions[-1][1] <= 0:
+                raise argparse.ArgumentTypeError(f"invalid roll-up resolution: {item}")
+        return resolutions
+
+    @staticmethod
+    def values(sample):
+        """Yield the (port, stat, value) of a sample that can be rolled up."""
+        for port, rates in sample.rates.items():
+            yield from ((port, name, value) for name, value in rates.items())
+        for port, drops in sample.drops.items():
+            yield from ((port, f"{cause}_pps", value) for cause, value in drops.items())
+        yield from sample.counters
+
+    def _add(self, key, timestamp, value):
+        entry = self.series.get(key)
+        if entry is None:
+            entry = self.series[key] = [
+                [RollupRing(*r) for r in self.resolutions], timestamp
+            ]
+        for ring in entry[0]:
+            ring.add(timestamp, value)
+        entry[1] = timestamp
+
+    def __call__(self, snapshot):
+        wall_offset = time.time() - time.monotonic()
+        with self.lock:
+            for app, sample in snapshot.apps.items():
+                if sample.stale or self.recorded.get(app) == sample.timestamp:
+                    continue
+                self.recorded[app] = sample.timestamp
+                timestamp = sample.timestamp + wall_offset
+                for port, stat, value in self.values(sample):
+                    if self.stats_re.search(stat):
+                        self._add((app, str(port), stat), timestamp, value)
+            expired = time.time() - self.retention
+            for key in [
+                key for key, (_, updated) in self.series.items() if updated < expired
+            ]:
+                del self.series[key]
+            for app in self.recorded.keys() - snapshot.apps.keys():
+                del self.recorded[app]
+
+    def list(self):
+        with self.lock:
+            return sorted(self.series)
+
+    def query(self, start, end, resolution=None, app=None, port=None, stat=None):
+        """Return the resolution used and the roll-ups of the matching series.
+
+        The roll-ups cover [start, end).
+
+        Without a resolution the finest one whose retention covers start is used.
+        """
+        if resolution is None:
+            now = time.time()
+            resolution = next(
+                (r for r, slots in self.resolutions if now - r * slots <= start),
+                self.resolutions[-1][0],
+            )
+        index = [r for r, _ in self.resolutions].index(resolution)
+        results = []
+        with self.lock:
+            for key in sorted(self.series):
+                if any(
+                    f is not None and f != k for f, k in zip((app, port, stat), key)
+                ):
+                    continue
+                result = self.series[key][0][index].query(start, end)
+                results.append(dict(zip(("app", "port", "stat"), key), **result))
+        return resolution, results
+
+
+def mempool_usage(infos):
+    """Return the MempoolUsage of /mempool/info replies keyed by mempool name."""
+    usage = []
+    for name, info in infos.items():
+        size = info.get("size", 0)
+        if not size:
+            continue
+        in_use = (
+            size
+            - info.get("common_pool_count", 0)
+            - info.get("total_cache_count", 0)
+        )
+        usage.append(MempoolUsage(name, size, in_use, in_use / size))
+    return usage
+
+
+def heap_usage(infos):
+    """Return the HeapUsage of /eal/heap_info replies keyed by heap id."""
+    usage = []
+    for heap_id, info in infos.items():
+        size = info.get("Heap_size", 0)
+        if not size:
+            continue
+        free = info.get("Free_size", 0)
+        usage.append(
+            HeapUsage(
+                info.get("Name", str(heap_id)), size, free,
+                info.get("Greatest_free_size", 0), (size - free) / size,
+            )
+        )
+    return usage
+
+
+class TelemetrySampler(threading.Thread):
+    """Poll every DPDK application on a fixed cadence into an immutable snapshot.
+
+    The backends only ever read the latest snapshot, so a scrape or an OTLP
+    export never touches the telemetry sockets and costs the same regardless of
+    how many applications and ports are being monitored.
+
+    All applications are queried concurrently from an asyncio event loop owned
+    by this thread. Every query is bounded by query_timeout, an application that
+    misses it is reported as stale instead of holding back the others.
+    """
+
+    # (list url, url) pairs of the per-application resources sampled with the ports
+    RESOURCE_URLS = (
+        ("/mempool/list", "/mempool/info"),
+        ("/eal/heap_list", "/eal/heap_info"),
+        (None, "/eal/lcore/usage"),
+    )
+
+    def __init__(
+        self, sock_dict, interval, query_timeout, stats_filter, burst_detector=None,
+        resources=True, telemetry_options=None, scheduler=None,
+    ):
+        super().__init__(name="dpdk-telemetry-sampler", daemon=True)
+        self.socks = sock_dict
+        # keyword arguments of the DPDKTelemetry created by add_app()
+        self.telemetry_options = telemetry_options or {}
+        self.interval = interval
+        self.query_timeout = query_timeout
+        self.stats_filter = stats_filter
+        self.resource_urls = self.RESOURCE_URLS if resources else ()
+        # AdaptiveScheduler, or None to query every application every interval
+        self.scheduler = scheduler
+        self.burst_detector = burst_detector
+        self.snapshot = Snapshot(time.monotonic(), {})
+        # called with every new snapshot from the sampler thread, for consumers
+        # that need every sample rather than the latest one
+        self.listeners = []
+        self.rate_tracker = RateTracker()
+        self.lcore_tracker = LcoreTracker()
+        self.ready = threading.Event()
+        self._loop = None
+        self._stop_event = None
+
+    async def _sample_app(self, app, sock, previous):
+        start = time.monotonic()
+        sample = await self._query_app(app, sock, previous, start)
+        AGENT_STATS.observe("collection", [((app,), sample.duration)])
+        return sample
+
+    async def _query_app(self, app, sock, previous, start):
+        try:
+            data = await asyncio.wait_for(
+                sock.connect_and_get_all(self.stats_filter.urls, self.resource_urls),
+                self.query_timeout,
+            )
+            now = time.monotonic()
+            stats = data["/ethdev/stats"]
+            rates, drops, resets = self.rate_tracker.update(app, sock.pid, now, stats)
+            counters, queues, xstats = self.stats_filter.flatten(
+                app, stats, data.get("/ethdev/xstats", {})
+            )
+            return AppSample(
+                stats, now, False, now - start, sock.rtt, rates, drops, resets,
+                counters, queues, xstats, self._bursts(app),
+                mempool_usage(data.get("/mempool/info", {})),
+                heap_usage(data.get("/eal/heap_info", {})),
+                self.lcore_tracker.update(
+                    app, sock.pid, data.get("/eal/lcore/usage", {}).get(None)
+                ),
+            )
+        except asyncio.TimeoutError:
+            logging.warning(
+                f"{app}: no reply within {self.query_timeout}s, reporting as stale"
+            )
+        except TelemetryBackoff:
+            pass
+        except (OSError, ValueError, KeyError):
+            # already logged and counted by DPDKTelemetry
+            pass
+        except Exception as e:
+            logging.warning(f"{app}: failed to process DPDK telemetry sample: {e}")
+            AGENT_STATS.count_error(app, "sample")
+        now = time.monotonic()
+        if previous is None:
+            return AppSample(
+                {}, now, True, now - start, 0.0, {}, {}, {}, [], [], [], {}, [], [], {}
+            )
+        return previous._replace(
+            stale=True, duration=now - start, bursts=self._bursts(app)
+        )
+
+    def _bursts(self, app):
+        if self.burst_detector is None:
+            return {}
+        return self.burst_detector.summary(app)
+
+    async def sample(self):
+        previous = self.snapshot.apps
+        # sock_dict is modified by the watchdog thread, iterate over a copy
+        socks = list(self.socks.items())
+        started = time.monotonic()
+        due = socks
+        if self.scheduler is not None:
+            due_apps = set(self.scheduler.due([app for app, _ in socks], started))
+            due = [(app, sock) for app, sock in socks if app in due_apps]
+        samples = await asyncio.gather(
+            *(self._sample_app(app, sock, previous.get(app)) for app, sock in due)
+        )
+        # applications that were not due keep their previous sample
+        apps = {app: previous[app] for app, _ in socks if app in previous}
+        apps.update((app, sample) for (app, _), sample in zip(due, samples))
+        for app in previous.keys() - apps.keys():
+            if self.scheduler is not None:
+                self.scheduler.forget(app)
+            self.rate_tracker.forget(app)
+            self.lcore_tracker.forget(app)
+            self.stats_filter.forget(app)
+            AGENT_STATS.forget(app)
+            if self.burst_detector is not None:
+                self.burst_detector.forget(app)
+        if self.scheduler is not None:
+            for (app, sock), sample in zip(due, samples):
+                self.scheduler.record(app, sample, started, sock.query_commands)
+            self.scheduler.plan()
+        # publishing is a single reference swap, readers never see a partial sample
+        self.snapshot = Snapshot(time.monotonic(), apps)
+        for listener in self.listeners:
+            try:
+                listener(self.snapshot)
+            except Exception as e:
+                logging.warning(f"Failed to process DPDK telemetry sample: {e}")
+                AGENT_STATS.count_export_error(getattr(listener, "name", "listener"))
+
+    def sample_age(self):
+        return time.monotonic() - self.snapshot.timestamp
+
+    def add_app(self, app, sock_path):
+        self.socks[app] = DPDKTelemetry(sock_path, app=app, **self.telemetry_options)
+
+    def remove_app(self, app):
+        self.socks.pop(app, None)
+
+    def socket_states(self):
+        """Return the number of tracked telemetry sockets by connection state."""
+        socks = list(self.socks.values())
+        connected = sum(sock.sock is not None for sock in socks)
+        return {"connected": connected, "disconnected": len(socks) - connected}
+
+    async def _run(self):
+        self._loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        if self.burst_detector is not None:
+            burst_task = asyncio.create_task(
+                self.burst_detector.run(self.socks, self._stop_event)
+            )
+        while not self._stop_event.is_set():
+            start = time.monotonic()
+            try:
+                await self.sample()
+            except Exception as e:
+                logging.warning(f"Failed to sample DPDK telemetry: {e}")
+            self.ready.set()
+            wait = self.interval - (time.monotonic() - start)
+            if self.scheduler is not None:
+                # wake up for the next due application, and at least every
+                # interval to pick up new applications
+                wait = min(self.interval, self.scheduler.next_due() - time.monotonic())
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), max(0, wait))
+            except asyncio.TimeoutError:
+                pass
+        if self.burst_detector is not None:
+            await burst_task
+        for sock in list(self.socks.values()):
+            sock._close_sock()
+
+    def run(self):
+        asyncio.run(self._run())
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stop_event.set)
+
+
+def telemetry_options(args):
+    """Return the keyword arguments of every DPDKTelemetry."""
+    return {
+        "pipeline_depth": args.pipeline_depth,
+        "port_refresh": args.port_refresh_interval,
+        "backoff_min": args.reconnect_backoff,
+        "backoff_max": args.reconnect_backoff_max,
+    }
+
+
+def create_burst_detector(args):
+    if args.hf_interval <= 0:
+        return None
+    return BurstDetector(
+        args.hf_interval / 1000,
+        args.query_timeout,
+        args.hf_ports,
+        args.hf_window,
+        [float(b) for b in args.hf_buckets.split(",")],
+        args.hf_burst_factor,
+    )
+
+
+def create_scheduler(args):
+    if not args.adaptive_sampling:
+        return None
+    return AdaptiveScheduler(
+        args.interval,
+        args.fast_interval,
+        args.slow_interval,
+        args.fast_apps,
+        # every worker process gets its share of the budget
+        args.query_budget / max(1, args.workers),
+        args.fast_change,
+    )
+
+
+def create_sampler(args, sock_dict):
+    return TelemetrySampler(
+        sock_dict,
+        args.interval,
+        args.query_timeout,
+        StatsFilter(args.stats_filter, args.xstats_filter),
+        create_burst_detector(args),
+        args.resource_stats,
+        telemetry_options(args),
+        create_scheduler(args),
+    )
+
+
+def run_worker(args, conn, apps):
+    """Sample apps, then the applications assigned by a ShardedSampler.
+
+    Runs until told to stop.
+    """
+    # Ctrl-C reaches the whole process group, the main process stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(format='%(asctime)s - %(message)s', level=logging.INFO)
+    AGENT_STATS.journal = []
+    sampler = create_sampler(args, {})
+    for app, sock_path in apps.items():
+        sampler.add_app(app, sock_path)
+
+    def send(snapshot):
+        # the raw stats only feed the trackers of this process, keep them off the pipe
+        apps = {app: sample._replace(stats={}) for app, sample in snapshot.apps.items()}
+        conn.send(
+            (
+                Snapshot(snapshot.timestamp, apps),
+                sampler.socket_states(),
+                AGENT_STATS.take_journal(),
+            )
+        )
+
+    sampler.listeners.append(send)
+    sampler.start()
+    try:
+        while True:
+            command, *params = conn.recv()
+            if command == "add":
+                sampler.add_app(*params)
+            elif command == "remove":
+                sampler.remove_app(*params)
+            else:
+                break
+    except EOFError:
+        # the main process went away
+        pass
+    sampler.stop()
+    sampler.join()
+
+
+class ShardedSampler:
+    """Spread the DPDK applications over worker processes.
+
+    Every worker runs a TelemetrySampler.
+
+    An application is assigned to a worker by a stable hash of its name. Every
+    worker sends its snapshot, its socket states and the journal of its
+    AgentStats after each sampling pass. The main process merges them into the
+    snapshot read by the backends and the listeners, so these work the same as
+    with a TelemetrySampler. A worker that dies is restarted with its
+    applications.
+    """
+
+    def __init__(self, args, workers):
+        self.args = args
+        self.stats_filter = StatsFilter(args.stats_filter, args.xstats_filter)
+        # only tells the backends whether the burst metrics are exported
+        self.burst_detector = create_burst_detector(args)
+        self.resource_urls = (
+            TelemetrySampler.RESOURCE_URLS if args.resource_stats else ()
+        )
+        self.snapshot = Snapshot(time.monotonic(), {})
+        self.listeners = []
+        self.ready = threading.Event()
+        self.lock = threading.Lock()
+        self.context = multiprocessing.get_context("spawn")
+        # app -> socket path of every application, for restarting a worker
+        self.apps = {}
+        # per worker (process, connection), snapshot and socket states
+        self.workers = [None] * workers
+        self.snapshots = [None] * workers
+        self.states = [{} for _ in range(workers)]
+        self._stopping = False
+        self._thread = threading.Thread(
+            target=self._receive, name="dpdk-telemetry-shards", daemon=True
+        )
+
+    def _shard(self, app):
+        return zlib.crc32(app.encode()) % len(self.workers)
+
+    def _start_worker(self, shard):
+        conn, worker_conn = self.context.Pipe()
+        apps = {
+            app: sock_path
+            for app, sock_path in self.apps.items()
+            if self._shard(app) == shard
+        }
+        process = self.context.Process(
+            target=run_worker,
+            args=(self.args, worker_conn, apps),
+            name=f"dpdk-telemetry-worker-{shard}",
+            daemon=True,
+        )
+        process.start()
+        worker_conn.close()
+        self.workers[shard] = (process, conn)
+
+    def start(self):
+        for shard in range(len(self.workers)):
+            self._start_worker(shard)
+        self._thread.start()
+
+    def _send(self, app, command):
+        # applications added before start() are handed to the workers as they start
+        worker = self.workers[self._shard(app)]
+        if worker is not None:
+            worker[1].send(command)
+
+    def add_app(self, app, sock_path):
+        with self.lock:
+            self.apps[app] = sock_path
+            self._send(app, ("add", app, sock_path))
+
+    def remove_app(self, app):
+        with self.lock:
+            self.apps.pop(app, None)
+            self._send(app, ("remove", app))
+
+    def _merge(self):
+        apps = {}
+        for snapshot in self.snapshots:
+            if snapshot is not None:
+                apps.update(snapshot.apps)
+        # the age of the oldest shard, a stuck worker shows up as an old sample
+        timestamp = min(
+            (snapshot.timestamp for snapshot in self.snapshots if snapshot is not None),
+            default=time.monotonic(),
+        )
+        self.snapshot = Snapshot(timestamp, apps)
+        if all(snapshot is not None for snapshot in self.snapshots):
+            self.ready.set()
+        for listener in self.listeners:
+            try:
+                listener(self.snapshot)
+            except Exception as e:
+                logging.warning(f"Failed to process DPDK telemetry sample: {e}")
+                AGENT_STATS.count_export_error(getattr(listener, "name", "listener"))
+
+    def _receive(self):
+        while not self._stopping:
+            conns = {conn: shard for shard, (_, conn) in enumerate(self.workers)}
+            for conn in multiprocessing.connection.wait(list(conns), timeout=1):
+                shard = conns[conn]
+                try:
+                    snapshot, states, journal = conn.recv()
+                except (EOFError, OSError):
+                    if self._stopping:
+                        return
+                    logging.warning(
+                        f"DPDK telemetry worker {shard} died, restarting it"
+                    )
+                    AGENT_STATS.count_error(f"worker-{shard}", "worker_died")
+                    with self.lock:
+                        conn.close()
+                        self.snapshots[shard] = None
+                        self.states[shard] = {}
+                        self._start_worker(shard)
+                    continue
+                AGENT_STATS.replay(journal)
+                self.snapshots[shard] = snapshot
+                self.states[shard] = states
+                self._merge()
+
+    def sample_age(self):
+        return time.monotonic() - self.snapshot.timestamp
+
+    def socket_states(self):
+        states = defaultdict(int)
+        for worker_states in self.states:
+            for state, count in worker_states.items():
+                states[state] += count
+        return {
+            "connected": states["connected"],
+            "disconnected": states["disconnected"],
+        }
+
+    def stop(self):
+        self._stopping = True
+        with self.lock:
+            for _, conn in self.workers:
+                try:
+                    conn.send(("stop",))
+                except OSError:
+                    pass
+
+    def join(self):
+        for process, conn in self.workers:
+            process.join(self.args.interval + self.args.query_timeout + 1)
+            if process.is_alive():
+                process.terminate()
+            conn.close()
+        self._thread.join()
+
+
+class PrometheusCollector(object):
+    def __init__(self, sampler):
+        self.sampler = sampler
+
+    def collect(self):
+        start = time.monotonic()
+        try:
+            yield from self._collect()
+            yield from self._agent_metrics()
+        except Exception as e:
+            logging.warning(f"Failed to collect DPDK telemetry for prometheus: {e}")
+            AGENT_STATS.count_export_error("prometheus")
+            raise
+        AGENT_STATS.observe("export", [(("prometheus",), time.monotonic() - start)])
+
+    def _collect(self):
+        from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+        snapshot = self.sampler.snapshot
+        stale = GaugeMetricFamily(
+            "dpdk_telemetry_app_stale",
+            "1 if the application missed its last query deadline or failed",
+            labels=["app"],
+        )
+        duration = GaugeMetricFamily(
+            "dpdk_telemetry_collection_seconds",
+            "Wall time of the last telemetry query of the application",
+            labels=["app"],
+        )
+        rtt = GaugeMetricFamily(
+            "dpdk_telemetry_command_rtt_seconds",
+            "Mean telemetry command round trip of the last query of the application",
+            labels=["app"],
+        )
+        rates = {
+            name: GaugeMetricFamily(
+                "dpdk_ethdev_" + name,
+                f"{name} of the port over the last sampling interval",
+                labels=["app", "port"],
+            )
+            for name in RateTracker.RATES
+        }
+        resets = CounterMetricFamily(
+            "dpdk_ethdev_counter_resets",
+            "Number of times the ethdev counters of the port were reset",
+            labels=["app", "port"],
+        )
+        ethdev_stats = CounterMetricFamily(
+            "dpdk_ethdev_stats",
+            "DPDK ethdev stats",
+            labels=["app", "port", "stat"],
+        )
+        queue_stats = CounterMetricFamily(
+            "dpdk_ethdev_queue_stats",
+            "DPDK ethdev per-queue stats",
+            labels=["app", "port", "queue", "stat"],
+        )
+        xstats = CounterMetricFamily(
+            "dpdk_ethdev_xstats",
+            "DPDK ethdev extended stats",
+            labels=["app", "port", "stat"],
+        )
+        for app, sample in snapshot.apps.items():
+            stale.add_metric([app], int(sample.stale))
+            duration.add_metric([app], sample.duration)
+            rtt.add_metric([app], sample.rtt)
+            for port, port_rates in sample.rates.items():
+                for name, value in port_rates.items():
+                    rates[name].add_metric([app, str(port)], value)
+            for port, count in sample.resets.items():
+                resets.add_metric([app, str(port)], count)
+            for port, stat, value in sample.counters:
+                ethdev_stats.add_metric([app, str(port), stat], value)
+            for port, queue, stat, value in sample.queues:
+                queue_stats.add_metric([app, str(port), str(queue), stat], value)
+            for port, stat, value in sample.xstats:
+                xstats.add_metric([app, str(port), stat], value)
+        yield ethdev_stats
+        yield queue_stats
+        if self.sampler.stats_filter.xstats_re is not None:
+            yield xstats
+        age = GaugeMetricFamily(
+            "dpdk_telemetry_sample_age_seconds",
+            "Seconds since the exported DPDK telemetry sample was taken",
+        )
+        age.add_metric([], time.monotonic() - snapshot.timestamp)
+        yield age
+        yield stale
+        yield duration
+        yield rtt
+        yield from rates.values()
+        yield resets
+        yield from self._drop_metrics(snapshot)
+        if self.sampler.burst_detector is not None:
+            yield from self._burst_metrics(snapshot)
+
+    def _drop_metrics(self, snapshot):
+        from prometheus_client.core import GaugeMetricFamily
+
+        drops = GaugeMetricFamily(
+            "dpdk_ethdev_drop_pps",
+            "Packets lost per second over the last sampling interval, by cause",
+            labels=["app", "port", "cause"],
+        )
+        mempool = {
+            field: GaugeMetricFamily(
+                f"dpdk_mempool_{field}",
+                documentation,
+                labels=["app", "mempool"],
+            )
+            for field, documentation in (
+                ("size", "Number of objects of the mempool"),
+                (
+                    "in_use",
+                    "Number of objects neither in the mempool nor in a per-lcore cache",
+                ),
+                ("utilization", "Fraction of the objects of the mempool in use"),
+            )
+        }
+        heap = {
+            field: GaugeMetricFamily(
+                f"dpdk_heap_{field}" if field == "utilization"
+                else f"dpdk_heap_{field}_bytes",
+                documentation,
+                labels=["app", "heap"],
+            )
+            for field, documentation in (
+                ("size", "Size of the EAL malloc heap"),
+                ("free", "Free bytes of the EAL malloc heap"),
+                ("greatest_free", "Largest free block of the EAL malloc heap"),
+                ("utilization", "Fraction of the EAL malloc heap allocated"),
+            )
+        }
+        lcore = GaugeMetricFamily(
+            "dpdk_lcore_utilization",
+            "Share of busy cycles of the lcore over the last sampling interval",
+            labels=["app", "lcore"],
+        )
+        headroom = GaugeMetricFamily(
+            "dpdk_app_lcore_headroom",
+            "Share of idle cycles of the busiest lcore of the application",
+            labels=["app"],
+        )
+        spare = GaugeMetricFamily(
+            "dpdk_app_lcore_spare",
+            "Idle cycles of all the lcores of the application, in lcores",
+            labels=["app"],
+        )
+        for app, sample in snapshot.apps.items():
+            for lcore_id, utilization in sample.lcores.items():
+                lcore.add_metric([app, str(lcore_id)], utilization)
+            app_headroom = LcoreTracker.headroom(sample.lcores)
+            if app_headroom is not None:
+                headroom.add_metric([app], app_headroom[0])
+                spare.add_metric([app], app_headroom[1])
+            for port, causes in sample.drops.items():
+                for cause, value in causes.items():
+                    drops.add_metric([app, str(port), cause], value)
+            for usage in sample.mempools:
+                for field, family in mempool.items():
+                    family.add_metric([app, usage.name], getattr(usage, field))
+            for usage in sample.heaps:
+                for field, family in heap.items():
+                    family.add_metric([app, usage.name], getattr(usage, field))
+        yield drops
+        if self.sampler.resource_urls:
+            yield from mempool.values()
+            yield from heap.values()
+            yield lcore
+            yield headroom
+            yield spare
+
+    def _burst_metrics(self, snapshot):
+        from prometheus_client.core import (
+            CounterMetricFamily,
+            GaugeHistogramMetricFamily,
+            GaugeMetricFamily,
+        )
+        from prometheus_client.utils import floatToGoString
+
+        histogram = GaugeHistogramMetricFamily(
+            "dpdk_ethdev_hf_rx_pps",
+            "Distribution of the high-frequency rx pps samples in the current window",
+            labels=["app", "port"],
+        )
+        rx_max = GaugeMetricFamily(
+            "dpdk_ethdev_hf_rx_pps_max",
+            "Highest high-frequency rx pps in the current window",
+            labels=["app", "port"],
+        )
+        tx_max = GaugeMetricFamily(
+            "dpdk_ethdev_hf_tx_pps_max",
+            "Highest high-frequency tx pps in the current window",
+            labels=["app", "port"],
+        )
+        window_bursts = GaugeMetricFamily(
+            "dpdk_ethdev_hf_window_bursts",
+            "Number of rx bursts in the current window",
+            labels=["app", "port"],
+        )
+        bursts = CounterMetricFamily(
+            "dpdk_ethdev_hf_bursts",
+            "Number of rx bursts detected",
+            labels=["app", "port"],
+        )
+        for app, sample in snapshot.apps.items():
+            for port, summary in sample.bursts.items():
+                labels = [app, str(port)]
+                histogram.add_metric(
+                    labels,
+                    [
+                        (floatToGoString(bound), count)
+                        for bound, count in summary.buckets
+                    ],
+                    summary.rx_pps_sum,
+                )
+                rx_max.add_metric(labels, summary.rx_pps_max)
+                tx_max.add_metric(labels, summary.tx_pps_max)
+                window_bursts.add_metric(labels, summary.window_bursts)
+                bursts.add_metric(labels, summary.bursts)
+        yield histogram
+        yield rx_max
+        yield tx_max
+        yield window_bursts
+        yield bursts
+
+    # the agent's own histograms, see AgentStats
+    HISTOGRAMS = {
+        "collection": (
+            "dpdk_telemetry_collection_duration_seconds",
+            "Wall time of the telemetry queries of the application",
+            ["app"],
+        ),
+        "command": (
+            "dpdk_telemetry_command_duration_seconds",
+            "Round trip of the telemetry commands sent to the endpoint",
+            ["endpoint"],
+        ),
+        "export": (
+            "dpdk_telemetry_export_duration_seconds",
+            "Time taken to export one snapshot with the backend",
+            ["backend"],
+        ),
+    }
+
+    def _agent_metrics(self):
+        from prometheus_client.core import (
+            CounterMetricFamily,
+            GaugeMetricFamily,
+            HistogramMetricFamily,
+        )
+        from prometheus_client.utils import floatToGoString
+
+        histograms, errors, reconnects, export_errors, discovery = AGENT_STATS.view()
+        for name, (metric, documentation, labels) in self.HISTOGRAMS.items():
+            family = HistogramMetricFamily(metric, documentation, labels=labels)
+            for values, (buckets, total) in histograms[name].items():
+                family.add_metric(
+                    list(values),
+                    [(floatToGoString(bound), count) for bound, count in buckets],
+                    total,
+                )
+            yield family
+        for metric, documentation, counts in (
+            (
+                "dpdk_telemetry_errors",
+                "Number of failed telemetry queries by reason",
+                errors,
+            ),
+            (
+                "dpdk_telemetry_reconnects",
+                "Number of telemetry connections dropped by reason",
+                reconnects,
+            ),
+        ):
+            family = CounterMetricFamily(
+                metric, documentation, labels=["app", "reason"]
+            )
+            for (app, reason), count in counts.items():
+                family.add_metric([app, reason], count)
+            yield family
+        family = CounterMetricFamily(
+            "dpdk_telemetry_export_errors",
+            "Number of failed exports by backend",
+            labels=["backend"],
+        )
+        for backend, count in export_errors.items():
+            family.add_metric([backend], count)
+        yield family
+        family = CounterMetricFamily(
+            "dpdk_telemetry_discovery_events",
+            "Number of DPDK applications discovered or removed by the socket "
+            "directory watch",
+            labels=["event"],
+        )
+        for event, count in discovery.items():
+            family.add_metric([event], count)
+        yield family
+        family = GaugeMetricFamily(
+            "dpdk_telemetry_sockets",
+            "Number of tracked DPDK telemetry sockets by connection state",
+            labels=["state"],
+        )
+        for state, count in self.sampler.socket_states().items():
+            family.add_metric([state], count)
+        yield family
+
+
+class OtlpCollector(object):
+    """Export the sampler's snapshot through OpenTelemetry instruments.
+
+    The per-series callbacks run over every application and series at each
+    export. Their Observation objects are cached per instrument and attribute
+    values: an unchanged value reuses the previous Observation, a changed one
+    reuses its attribute set. The cache entries of an application are dropped
+    when it goes away or when its topology changes, such as a hotplugged port,
+    and built again from the next sample.
+
+    The derived rates of every fresh sample are also recorded into the
+    dpdk.ethdev.rate histogram, aggregated by the SDK, see otlp_views().
+    """
+
+    # attribute names of the cached instruments, in the order of their cache keys,
+    # the utilization instruments only use the leading ones
+    STATS_ATTRIBUTES = ("app", "port", "stats")
+    QUEUE_ATTRIBUTES = ("app", "port", "queue", "stats")
+    RATE_ATTRIBUTES = ("app", "port", "rate")
+    DROP_ATTRIBUTES = ("app", "port", "cause")
+    PORT_ATTRIBUTES = ("app", "port")
+    BUCKET_ATTRIBUTES = ("app", "port", "le")
+    MEMPOOL_ATTRIBUTES = ("app", "mempool", "state")
+    HEAP_ATTRIBUTES = ("app", "heap", "state")
+    LCORE_ATTRIBUTES = ("app", "lcore")
+    HEADROOM_ATTRIBUTES = ("app", "scope")
+
+    def __init__(self, sampler):
+        from opentelemetry import metrics
+
+        self.sampler = sampler
+        self.Observation = metrics.Observation
+        # (instrument, attribute values...) -> last Observation
+        self.observations = {}
+        # app -> (sample, topology) the cached observations were built from
+        self.apps = {}
+        self.rate_histogram = None
+        # app -> timestamp of the last sample recorded into rate_histogram
+        self.recorded = {}
+        # (app, port, rate) -> attribute set of rate_histogram, owned by the
+        # sampler thread like recorded
+        self.rate_attributes = {}
+        # app -> ports the attribute sets of rate_attributes were built for
+        self.rate_ports = {}
+        # histogram bound -> its "le" attribute value
+        self.bucket_labels = {}
+
+    @staticmethod
+    def _topology(sample):
+        """Return what the set of cached series of an application depends on."""
+        return (
+            tuple(sample.stats), len(sample.queues), len(sample.xstats),
+            tuple(sample.bursts), tuple(sample.lcores),
+            tuple(usage.name for usage in sample.mempools),
+            tuple(usage.name for usage in sample.heaps),
+        )
+
+    def _apps(self):
+        """Return the applications of the snapshot.
+
+        The cached observations of the applications that left, or whose topology
+        changed, are dropped. The topology is only computed again for a new
+        sample, once per sampling interval rather than once per callback.
+        """
+        apps = self.sampler.snapshot.apps
+        dropped = self.apps.keys() - apps.keys()
+        for app in dropped:
+            del self.apps[app]
+        for app, sample in apps.items():
+            seen = self.apps.get(app)
+            if seen is not None and seen[0] is sample:
+                continue
+            topology = self._topology(sample)
+            if seen is not None and seen[1] != topology:
+                dropped.add(app)
+            self.apps[app] = (sample, topology)
+        if dropped:
+            self.observations = {
+                key: observation for key, observation in self.observations.items()
+                if key[1] not in dropped
+            }
+        return apps.items()
+
+    def _observation(self, key, names, value):
+        """Return an Observation of value for key.
+
+        The key is the instrument followed by the values of names.
+        """
+        observation = self.observations.get(key)
+        if observation is not None and observation.value == value:
+            return observation
+        if observation is None:
+            attributes = dict(zip(names, key[1:]))
+        else:
+            attributes = observation.attributes
+        observation = self.observations[key] = self.Observation(value, attributes)
+        return observation
+
+    def dpdk_telemetry_callback(
+        self, options: metrics.CallbackOptions
+    ) -> Iterable[metrics.Observation]:
+        return [
+            self._observation(
+                ("stats", app, port, stat), self.STATS_ATTRIBUTES, int(value)
+            )
+            for app, sample in self._apps()
+            for port, stat, value in sample.counters
+        ]
+
+    def queue_stats_callback(
+        self, options: metrics.CallbackOptions
+    ) -> Iterable[metrics.Observation]:
+        return [
+            self._observation(
+                ("queue", app, port, queue, stat), self.QUEUE_ATTRIBUTES, int(value)
+            )
+            for app, sample in self._apps()
+            for port, queue, stat, value in sample.queues
+        ]
+
+    def xstats_callback(
+        self, options: metrics.CallbackOptions
+    ) -> Iterable[metrics.Observation]:
+        return [
+            self._observation(
+                ("xstats", app, port, stat), self.STATS_ATTRIBUTES, int(value)
+            )
+            for app, sample in self._apps()
+            for port, stat, value in sample.xstats
+        ]
+
+    def record_rates(self, snapshot):
+        """Sampler listener recording the rates of every fresh sample.
+
+        The rates go into the rate histogram.
+        """
+        for app, sample in snapshot.apps.items():
+            if sample.stale or self.recorded.get(app) == sample.timestamp:
+                continue
+            self.recorded[app] = sample.timestamp
+            ports = tuple(sample.stats)
+            if self.rate_ports.setdefault(app, ports) != ports:
+                self.rate_ports[app] = ports
+                self._drop_rate_attributes({app})
+            for port, port_rates in sample.rates.items():
+                for name, value in port_rates.items():
+                    key = (app, port, name)
+                    attributes = self.rate_attributes.get(key)
+                    if attributes is None:
+                        attributes = self.rate_attributes[key] = dict(
+                            zip(self.RATE_ATTRIBUTES, key)
+                        )
+                    self.rate_histogram.record(value, attributes)
+        gone = self.recorded.keys() - snapshot.apps.keys()
+        if gone:
+            for app in gone:
+                del self.recorded[app]
+                self.rate_ports.pop(app, None)
+            self._drop_rate_attributes(gone)
+
+    def _drop_rate_attributes(self, apps):
+        self.rate_attributes = {
+            key: attributes for key, attributes in self.rate_attributes.items()
+            if key[0] not in apps
+        }
+
+    def sample_age_callback(
+        self, options: metrics.CallbackOptions
+    ) -> Iterable[metrics.Observation]:
+        return [self.Observation(self.sampler.sample_age())]
+
+    def app_stale_callback(
+        self, options: metrics.CallbackOptions
+    ) -> Iterable[metrics.Observation]:
+        return [
+            self.Observation(int(sample.stale), {"app": app})
+            for app, sample in self.sampler.snapshot.apps.items()
+        ]
+
+    def rates_callback(
+        self, options: metrics.CallbackOptions
+    ) -> Iterable[metrics.Observation]:
+        return [
+            self._observation(("rate", app, port, name), self.RATE_ATTRIBUTES, value)
+            for app, sample in self._apps()
+            for port, port_rates in sample.rates.items()
+            for name, value in port_rates.items()
+        ]
+
+    def counter_resets_callback(
+        self, options: metrics.CallbackOptions
+    ) -> Iterable[metrics.Observation]:
+        return [
+            self.Observation(count, {"app": app, "port": port})
+            for app, sample in self.sampler.snapshot.apps.items()
+            for port, count in sample.resets.items()
+        ]
+
+    def drops_callback(
+        self, options: metrics.CallbackOptions
+    ) -> Iterable[metrics.Observation]:
+        return [
+            self._observation(("drop", app, port, cause), self.DROP_ATTRIBUTES, value)
+            for app, sample in self._apps()
+            for port, causes in sample.drops.items()
+            for cause, value in causes.items()
+        ]
+
+    def mempool_callback(
+        self, options: metrics.CallbackOptions
+    ) -> Iterable[metrics.Observation]:
+        return [
+            self._observation(
+                ("mempool", app, usage.name, state),
+                self.MEMPOOL_ATTRIBUTES,
+                getattr(usage, state),
+            )
+            for app, sample in self._apps()
+            for usage in sample.mempools
+            for state in ("size", "in_use")
+        ]
+
+    def mempool_utilization_callback(
+        self, options: metrics.CallbackOptions
+    ) -> Iterable[metrics.Observation]:
+        return [
+            self._observation(
+                ("mempool_utilization", app, usage.name),
+                self.MEMPOOL_ATTRIBUTES,
+                usage.utilization,
+            )
+            for app, sample in self._apps()
+            for usage in sample.mempools
+        ]
+
+    def heap_callback(
+        self, options: metrics.CallbackOptions
+    ) -> Iterable[metrics.Observation]:
+        return [
+            self._observation(
+                ("heap", app, usage.name, state),
+                self.HEAP_ATTRIBUTES,
+                getattr(usage, state),
+            )
+            for app, sample in self._apps()
+            for usage in sample.heaps
+            for state in ("size", "free", "greatest_free")
+        ]
+
+    def heap_utilization_callback(
+        self, options: metrics.CallbackOptions
+    ) -> Iterable[metrics.Observation]:
+        return [
+            self._observation(
+                ("heap_utilization", app, usage.name),
+                self.HEAP_ATTRIBUTES,
+                usage.utilization,
+            )
+            for app, sample in self._apps()
+            for usage in sample.heaps
+        ]
+
+    def lcore_utilization_callback(
+        self, options: metrics.CallbackOptions
+    ) -> Iterable[metrics.Observation]:
+        return [
+            self._observation(("lcore", app, lcore), self.LCORE_ATTRIBUTES, utilization)
+            for app, sample in self._apps()
+            for lcore, utilization in sample.lcores.items()
+        ]
+
+    def lcore_headroom_callback(
+        self, options: metrics.CallbackOptions
+    ) -> Iterable[metrics.Observation]:
+        observations = []
+        for app, sample in self._apps():
+            headroom = LcoreTracker.headroom(sample.lcores)
+            if headroom is not None:
+                for scope, value in zip(("busiest", "total"), headroom):
+                    observations.append(self._observation(
+                        ("headroom", app, scope), self.HEADROOM_ATTRIBUTES, value
+                    ))
+        return observations
+
+    def hf_max_rate_callback(
+        self, options: metrics.CallbackOptions
+    ) -> Iterable[metrics.Observation]:
+        observations = []
+        for app, sample in self._apps():
+            for port, summary in sample.bursts.items():
+                observations.append(self._observation(
+                    ("hf_max", app, port, "rx_pps"),
+                    self.RATE_ATTRIBUTES,
+                    summary.rx_pps_max,
+                ))
+                observations.append(self._observation(
+                    ("hf_max", app, port, "tx_pps"),
+                    self.RATE_ATTRIBUTES,
+                    summary.tx_pps_max,
+                ))
+        return observations
+
+    def hf_rx_pps_buckets_callback(
+        self, options: metrics.CallbackOptions
+    ) -> Iterable[metrics.Observation]:
+        return [
+            self._observation(
+                ("hf_bucket", app, port, self._bucket_label(bound)),
+                self.BUCKET_ATTRIBUTES,
+                count,
+            )
+            for app, sample in self._apps()
+            for port, summary in sample.bursts.items()
+            for bound, count in summary.buckets
+        ]
+
+    def _bucket_label(self, bound):
+        label = self.bucket_labels.get(bound)
+        if label is None:
+            label = self.bucket_labels[bound] = str(bound)
+        return label
+
+    def hf_window_bursts_callback(
+        self, options: metrics.CallbackOptions
+    ) -> Iterable[metrics.Observation]:
+        return [
+            self._observation(
+                ("hf_window_bursts", app, port),
+                self.PORT_ATTRIBUTES,
+                summary.window_bursts,
+            )
+            for app, sample in self._apps()
+            for port, summary in sample.bursts.items()
+        ]
+
+    def hf_bursts_callback(
+        self, options: metrics.CallbackOptions
+    ) -> Iterable[metrics.Observation]:
+        return [
+            self._observation(
+                ("hf_bursts", app, port), self.PORT_ATTRIBUTES, summary.bursts
+            )
+            for app, sample in self._apps()
+            for port, summary in sample.bursts.items()
+        ]
+
+    def collection_callback(
+        self, options: metrics.CallbackOptions
+    ) -> Iterable[metrics.Observation]:
+        return [
+            self.Observation(sample.duration, {"app": app})
+            for app, sample in self.sampler.snapshot.apps.items()
+        ]
+
+    def command_rtt_callback(
+        self, options: metrics.CallbackOptions
+    ) -> Iterable[metrics.Observation]:
+        return [
+            self.Observation(sample.rtt, {"app": app})
+            for app, sample in self.sampler.snapshot.apps.items()
+        ]
+
+    def errors_callback(
+        self, options: metrics.CallbackOptions
+    ) -> Iterable[metrics.Observation]:
+        return [
+            self.Observation(count, {"app": app, "reason": reason})
+            for (app, reason), count in AGENT_STATS.view()[1].items()
+        ]
+
+    def reconnects_callback(
+        self, options: metrics.CallbackOptions
+    ) -> Iterable[metrics.Observation]:
+        return [
+            self.Observation(count, {"app": app, "reason": reason})
+            for (app, reason), count in AGENT_STATS.view()[2].items()
+        ]
+
+    def export_errors_callback(
+        self, options: metrics.CallbackOptions
+    ) -> Iterable[metrics.Observation]:
+        return [
+            self.Observation(count, {"backend": backend})
+            for backend, count in AGENT_STATS.view()[3].items()
+        ]
+
+    def discovery_callback(
+        self, options: metrics.CallbackOptions
+    ) -> Iterable[metrics.Observation]:
+        return [
+            self.Observation(count, {"event": event})
+            for event, count in AGENT_STATS.view()[4].items()
+        ]
+
+    def sockets_callback(
+        self, options: metrics.CallbackOptions
+    ) -> Iterable[metrics.Observation]:
+        return [
+            self.Observation(count, {"state": state})
+            for state, count in self.sampler.socket_states().items()
+        ]
+
+    # the agent's own histograms, see AgentStats, and the attribute of their labels
+    HISTOGRAMS = {
+        "collection": (
+            "dpdk.telemetry.collection.duration",
+            "Wall time of the telemetry queries of the application",
+            "app",
+        ),
+        "command": (
+            "dpdk.telemetry.command.duration",
+            "Round trip of the telemetry commands sent to the endpoint",
+            "endpoint",
+        ),
+        "export": (
+            "dpdk.telemetry.export.duration",
+            "Time taken to export one snapshot with the backend",
+            "backend",
+        ),
+    }
+
+    def _record_histogram(self, histogram, value, labels):
+        instrument, attribute = self.histograms[histogram]
+        instrument.record(value, {attribute: labels[0]})
+
+    def register(self, meter):
+        # OTLP histograms are aggregated by the SDK, feed it every observed value
+        self.histograms = {
+            name: (
+                meter.create_histogram(
+                    instrument,
+                    unit="s",
+                    description=description,
+                    explicit_bucket_boundaries_advisory=AgentStats.DURATION_BUCKETS,
+                ),
+                attribute,
+            )
+            for name, (instrument, description, attribute) in self.HISTOGRAMS.items()
+        }
+        AGENT_STATS.listeners.append(self._record_histogram)
+        meter.create_observable_counter(
+            "dpdk.telemetry.errors",
+            callbacks=[self.errors_callback],
+            description="Number of failed telemetry queries by reason"
+        )
+        meter.create_observable_counter(
+            "dpdk.telemetry.reconnects",
+            callbacks=[self.reconnects_callback],
+            description="Number of telemetry connections dropped by reason"
+        )
+        meter.create_observable_counter(
+            "dpdk.telemetry.export_errors",
+            callbacks=[self.export_errors_callback],
+            description="Number of failed exports by backend"
+        )
+        meter.create_observable_counter(
+            "dpdk.telemetry.discovery_events",
+            callbacks=[self.discovery_callback],
+            description="Number of DPDK applications discovered or removed by the "
+            "socket directory watch"
+        )
+        meter.create_observable_gauge(
+            "dpdk.telemetry.sockets",
+            callbacks=[self.sockets_callback],
+            description="Number of tracked DPDK telemetry sockets by connection state"
+        )
+        meter.create_observable_counter(
+            "dpdk.stats",
+            callbacks=[self.dpdk_telemetry_callback],
+            description="DPDK Telemetry"
+        )
+        meter.create_observable_counter(
+            "dpdk.stats.queue",
+            callbacks=[self.queue_stats_callback],
+            description="DPDK ethdev per-queue stats"
+        )
+        if self.sampler.stats_filter.xstats_re is not None:
+            meter.create_observable_counter(
+                "dpdk.xstats",
+                callbacks=[self.xstats_callback],
+                description="DPDK ethdev extended stats"
+            )
+        meter.create_observable_gauge(
+            "dpdk.ethdev.rates",
+            callbacks=[self.rates_callback],
+            description="DPDK ethdev rates over the last sampling interval"
+        )
+        self.rate_histogram = meter.create_histogram(
+            "dpdk.ethdev.rate",
+            description="Distribution of the DPDK ethdev rates over the sampling "
+            "intervals"
+        )
+        self.sampler.listeners.append(self.record_rates)
+        meter.create_observable_counter(
+            "dpdk.ethdev.counter_resets",
+            callbacks=[self.counter_resets_callback],
+            description="Number of times the ethdev counters of the port were reset"
+        )
+        meter.create_observable_gauge(
+            "dpdk.ethdev.drops",
+            callbacks=[self.drops_callback],
+            description="Packets lost per second over the last sampling interval, "
+            "by cause"
+        )
+        if self.sampler.resource_urls:
+            meter.create_observable_gauge(
+                "dpdk.mempool.usage",
+                callbacks=[self.mempool_callback],
+                description="Number of objects of the mempool, and of the ones in use"
+            )
+            meter.create_observable_gauge(
+                "dpdk.mempool.utilization",
+                callbacks=[self.mempool_utilization_callback],
+                description="Fraction of the objects of the mempool in use"
+            )
+            meter.create_observable_gauge(
+                "dpdk.heap.usage",
+                callbacks=[self.heap_callback],
+                unit="By",
+                description="Size, free bytes and largest free block of the EAL "
+                "malloc heap"
+            )
+            meter.create_observable_gauge(
+                "dpdk.heap.utilization",
+                callbacks=[self.heap_utilization_callback],
+                description="Fraction of the EAL malloc heap allocated"
+            )
+            meter.create_observable_gauge(
+                "dpdk.lcore.utilization",
+                callbacks=[self.lcore_utilization_callback],
+                description="Share of busy cycles of the lcore over the last "
+                "sampling interval"
+            )
+            meter.create_observable_gauge(
+                "dpdk.lcore.headroom",
+                callbacks=[self.lcore_headroom_callback],
+                description="Idle share of the busiest lcore, or idle lcores in "
+                "total, of the application"
+            )
+        if self.sampler.burst_detector is not None:
+            meter.create_observable_gauge(
+                "dpdk.ethdev.hf.max_rate",
+                callbacks=[self.hf_max_rate_callback],
+                description="Highest high-frequency rate in the current window"
+            )
+            meter.create_observable_gauge(
+                "dpdk.ethdev.hf.rx_pps.buckets",
+                callbacks=[self.hf_rx_pps_buckets_callback],
+                description="Cumulative count of high-frequency rx pps samples in "
+                "the current window at or below le"
+            )
+            meter.create_observable_gauge(
+                "dpdk.ethdev.hf.window_bursts",
+                callbacks=[self.hf_window_bursts_callback],
+                description="Number of rx bursts in the current window"
+            )
+            meter.create_observable_counter(
+                "dpdk.ethdev.hf.bursts",
+                callbacks=[self.hf_bursts_callback],
+                description="Number of rx bursts detected"
+            )
+        meter.create_observable_gauge(
+            "dpdk.telemetry.sample_age",
+            callbacks=[self.sample_age_callback],
+            unit="s",
+            description="Seconds since the exported DPDK telemetry sample was taken"
+        )
+        meter.create_observable_gauge(
+            "dpdk.telemetry.app_stale",
+            callbacks=[self.app_stale_callback],
+            description="1 if the application missed its last query deadline or failed"
+        )
+        meter.create_observable_gauge(
+            "dpdk.telemetry.collection",
+            callbacks=[self.collection_callback],
+            unit="s",
+            description="Wall time of the last telemetry query of the application"
+        )
+        meter.create_observable_gauge(
+            "dpdk.telemetry.command_rtt",
+            callbacks=[self.command_rtt_callback],
+            unit="s",
+            description="Mean telemetry command round trip of the last query of "
+            "the application"
+        )
 
 
-class DPDKTelemetry:
-    def __init__(self, sock_path):
-        self.sock_path = sock_path
-        self.sock = None
-        self.max_out_len = 0
-        self.port_ids = []
-        self.stats = defaultdict(dict)
+def start_prometheus_backend(args, sampler):
+    from prometheus_client import start_http_server
+    from prometheus_client.core import REGISTRY
 
-    def __del__(self):
-        self._close_sock()
+    start_http_server(args.port)
+    REGISTRY.register(PrometheusCollector(sampler))
+    return lambda: None
 
-    def _close_sock(self):
-        if self.sock is not None:
-            try:
-                self.sock.close()
-            except Exception as e:
-                e = f"{self.sock_path}: {e}"
-                logging.warning(f"Failed to close socket: {e}")
-            finally:
-                self.sock = None
 
-    def _connect_socket(self):
-        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
-        self.sock.connect(self.sock_path)
-        logging.info(f"Socket successfully connected to {self.sock_path}")
-        data = json.loads(self.sock.recv(1024).decode())
-        self.max_out_len = data["max_output_len"]
-        self.port_ids = self._cmd("/ethdev/list")["/ethdev/list"]
+def otlp_views():
+    """Return the views of the OTLP meter provider."""
+    from opentelemetry.sdk.metrics.view import (
+        ExponentialBucketHistogramAggregation,
+        View,
+    )
 
-    def _cmd(self, c):
-        self.sock.send(c.encode())
-        return json.loads(self.sock.recv(self.max_out_len))
+    # rates span from a few pps to hundreds of Gbps, let the buckets follow them
+    return [
+        View(
+            instrument_name="dpdk.ethdev.rate",
+            aggregation=ExponentialBucketHistogramAggregation(),
+        )
+    ]
 
-    def _assemble_from_ports(self, url):
-        assembled_info = {}
-        for i in self.port_ids:
-            data = self._cmd(f"{url},{i}")
-            assembled_info[i] = data[url]
-        return assembled_info
 
-    def connect_and_get(self, url):
-        try:
-            if self.sock is None:
-                self._connect_socket()
-            self.stats[url] = self._assemble_from_ports(url)
-        except Exception as e:
-            e = f"{self.sock_path}: {e}"
-            logging.warning(e)
-            self.stats = defaultdict(dict)
-            self._close_sock()
-        return self.stats[url]
+def otlp_temporality(name):
+    """Return the preferred_temporality of the OTLP exporter.
 
-class SocketEventHandler(FileSystemEventHandler):
-    def __init__(self, sock_dict):
-        self.socks = sock_dict
-    def on_created(self, event):
-        if event.is_directory:
-            app_name = os.path.basename(event.src_path)
-            logging.info(f"New DPDK application created: {app_name}")
-            self.socks[app_name] = DPDKTelemetry(event.src_path + "/dpdk_telemetry.v2")
-    def on_deleted(self, event):
-        if event.is_directory:
-            app_name = os.path.basename(event.src_path)
-            logging.info(f"DPDK application deleted: {app_name}")
-            del self.socks[app_name]
+    The temporality is given by a --otlp-temporality value.
+    """
+    from opentelemetry.sdk.metrics import Counter, Histogram, ObservableCounter
+    from opentelemetry.sdk.metrics.export import AggregationTemporality
 
-class PrometheusCollector(object):
-    def __init__(self, sock_dict):
-        self.socks = sock_dict
+    if name == "cumulative":
+        return {}
+    # up-down counters and gauges stay cumulative, as with the collector's
+    # cumulativetodelta
+    return {
+        Counter: AggregationTemporality.DELTA,
+        ObservableCounter: AggregationTemporality.DELTA,
+        Histogram: AggregationTemporality.DELTA,
+    }
 
-    def collect(self):
-        for app, sock in self.socks.items():
-            try:
-                count = CounterMetricFamily(app, "ethdev stats", labels=[app])
-                ethdev_stats = sock.connect_and_get("/ethdev/stats")
-                for port, stats in ethdev_stats.items():
-                    count.add_metric(['ibytes_' + str(port)], stats["ibytes"])
-                    count.add_metric(['ipackets_' + str(port)], stats["ipackets"])
-                    count.add_metric(['obytes_' + str(port)], stats["obytes"])
-                    count.add_metric(['opackets_' + str(port)], stats["opackets"])
-                yield count
-            except Exception as e:
-                e = f"{app}: {e}"
-                logging.warning(e)
 
-class OtlpCollector(object):
-    def __init__(self, sock_dict):
-        self.socks = sock_dict
+def start_otlp_backend(args, sampler):
+    from opentelemetry import metrics
+    from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import (
+        OTLPMetricExporter,
+    )
+    from opentelemetry.sdk.metrics import MeterProvider
+    from opentelemetry.sdk.metrics.export import (
+        MetricExportResult,
+        PeriodicExportingMetricReader,
+    )
+    from opentelemetry.sdk.resources import SERVICE_NAME, Resource
 
-    def dpdk_telemetry_callback(self, options: metrics.CallbackOptions) -> Iterable[metrics.Observation]:
-        observations = []
-        for app, sock in self.socks.items():
-            ethdev_stats = sock.connect_and_get("/ethdev/stats")
-            for port, stats in ethdev_stats.items():
-                observations.append(metrics.Observation(int(stats["ibytes"]), {"app": app, "port": port, "stats": "ibytes"}))
-                observations.append(metrics.Observation(int(stats["ipackets"]), {"app": app, "port": port, "stats": "ipackets"}))
-                observations.append(metrics.Observation(int(stats["obytes"]), {"app": app, "port": port, "stats": "obytes"}))
-                observations.append(metrics.Observation(int(stats["opackets"]), {"app": app, "port": port, "stats": "opackets"}))
-        return observations
+    resource = Resource(attributes={
+        SERVICE_NAME: "dpdk-telemetry"
+    })
+    insecure = False
+    if args.otlp_url.startswith("http://"):
+        insecure = True
+
+    class InstrumentedExporter(OTLPMetricExporter):
+        def export(self, metrics_data, *args, **kwargs):
+            start = time.monotonic()
+            result = super().export(metrics_data, *args, **kwargs)
+            AGENT_STATS.observe("export", [(("otlp",), time.monotonic() - start)])
+            if result != MetricExportResult.SUCCESS:
+                AGENT_STATS.count_export_error("otlp")
+            return result
+
+    reader = PeriodicExportingMetricReader(
+        InstrumentedExporter(
+            endpoint=args.otlp_url,
+            insecure=insecure,
+            preferred_temporality=otlp_temporality(args.otlp_temporality),
+        ),
+        export_interval_millis=args.interval * 1000
+    )
+    provider = MeterProvider(
+        resource=resource, metric_readers=[reader], views=otlp_views()
+    )
+    metrics.set_meter_provider(provider)
+    meter = metrics.get_meter("dpdk.stats")
+    OtlpCollector(sampler).register(meter)
+    return provider.shutdown
+
+
+def start_rollup_server(args, store):
+    """Serve the roll-ups of store over HTTP, return a callable stopping the server.
+
+    GET /series lists the [app, port, stat] of the series and the resolutions.
+    GET /query returns the series matching the optional app, port and stat
+    parameters between start and end, epoch seconds or, when not positive,
+    seconds relative to now. resolution picks one of the --rollups resolutions.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs, urlsplit
+
+    resolutions = [r for r, _ in store.resolutions]
+
+    class RollupHandler(BaseHTTPRequestHandler):
+        def _reply(self, status, body):
+            data = json.dumps(body, separators=(",", ":")).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _query(self, params):
+            now = time.time()
 
-def initialize_sock_dict(dir, socks):
+            def when(name, default):
+                value = float(params.get(name, [default])[0])
+                return value if value > 0 else now + value
+
+            start = when("start", -3600)
+            end = when("end", 0)
+            resolution = params.get("resolution", [None])[0]
+            if resolution is not None:
+                resolution = float(resolution)
+                if resolution not in resolutions:
+                    raise ValueError(f"resolution must be one of {resolutions}")
+            filters = {
+                name: params[name][0]
+                for name in ("app", "port", "stat")
+                if name in params
+            }
+            resolution, series = store.query(start, end, resolution, **filters)
+            return {"resolution": resolution, "series": series}
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            params = parse_qs(url.query)
+            if url.path == "/series":
+                self._reply(
+                    200, {"resolutions": store.resolutions, "series": store.list()}
+                )
+            elif url.path == "/query":
+                try:
+                    self._reply(200, self._query(params))
+                except ValueError as e:
+                    self._reply(400, {"error": str(e)})
+            else:
+                self._reply(404, {"error": f"unknown path {url.path}"})
+
+        def log_message(self, format, *args):
+            logging.debug(f"rollup query: {format % args}")
+
+    server = ThreadingHTTPServer(("", args.rollup_port), RollupHandler)
+    server.daemon_threads = True
+    threading.Thread(
+        target=server.serve_forever, name="dpdk-telemetry-rollups", daemon=True
+    ).start()
+    logging.info(f"Serving roll-up queries on port {args.rollup_port}")
+
+    def shutdown():
+        server.shutdown()
+        server.server_close()
+
+    return shutdown
+
+
+# --backend values, the numeric ones are kept for compatibility
+BACKENDS = {
+    "1": start_prometheus_backend,
+    "prometheus": start_prometheus_backend,
+    "2": start_otlp_backend,
+    "otlp": start_otlp_backend,
+}
+
+
+def parse_backends(value):
+    backends = []
+    for name in value.split(","):
+        name = name.strip().lower()
+        if name not in BACKENDS:
+            raise argparse.ArgumentTypeError(f"unknown backend: {name}")
+        if BACKENDS[name] not in backends:
+            backends.append(BACKENDS[name])
+    return backends
+
+
+def initialize_sock_dict(dir, socks, telemetry_options):
     for d in os.listdir(dir):
         full_path = os.path.join(dir, d)
         # make sure full_path is a directory
         if os.path.isdir(full_path):
-            socks[d] = DPDKTelemetry(full_path + "/dpdk_telemetry.v2")
+            socks[d] = DPDKTelemetry(
+                full_path + "/dpdk_telemetry.v2", **telemetry_options
+            )
 
-def main():
-    logging.basicConfig(format='%(asctime)s - %(message)s', level=logging.INFO)
-    logging.basicConfig(format='%(asctime)s - %(message)s', level=logging.WARNING)
-    sock_dict = dict()
+
+def parse_args():
+    """Return the command line arguments, the backends and the roll-up resolutions."""
     parser = argparse.ArgumentParser(
         description=__doc__,
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
@@ -147,13 +2902,235 @@ def main():
         Path to the directory which contains the DPDK telemetry sub folders.
         """,
     )
+    parser.add_argument(
+        "--sock-root",
+        action="append",
+        default=[],
+        help="""
+        Glob pattern of directories searched recursively for DPDK telemetry sockets, can
+        be repeated. Replaces --sock-prefix, for one agent per node covering the runtime
+        directories of every pod.
+        """,
+    )
+    parser.add_argument(
+        "--discovery-interval",
+        type=float,
+        default=5.0,
+        help="""
+        Time interval in seconds between rescans of the --sock-root patterns, or of
+        --sock-prefix with --workers.
+        """,
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="""
+        Number of worker processes the DPDK applications are sharded across, 0 samples
+        them in the agent process.
+        """,
+    )
     parser.add_argument(
         "-i",
         "--interval",
         type=int,
         default=1,
         help="""
-        Time interval between each statistics sample, not used for pull model backend.
+        Time interval between each statistics sample, also the OTLP export interval.
+        """,
+    )
+    parser.add_argument(
+        "-t",
+        "--query-timeout",
+        type=float,
+        default=0.5,
+        help="""
+        Deadline in seconds for querying one DPDK application, a slower application is
+        reported as stale.
+        """,
+    )
+    parser.add_argument(
+        "--port-refresh-interval",
+        type=float,
+        default=10,
+        help="""
+        Time interval in seconds between refreshes of the port list of a connected DPDK
+        application.
+        """,
+    )
+    parser.add_argument(
+        "--reconnect-backoff",
+        type=float,
+        default=1,
+        help="""
+        Delay in seconds before reconnecting to a failed DPDK application, doubled on
+        every further failure.
+        """,
+    )
+    parser.add_argument(
+        "--reconnect-backoff-max",
+        type=float,
+        default=30,
+        help="""
+        Upper bound in seconds of the reconnect delay.
+        """,
+    )
+    parser.add_argument(
+        "--pipeline-depth",
+        type=int,
+        default=8,
+        help="""
+        Maximum number of telemetry commands in flight on one socket, 1 issues them in
+        lock-step.
+        """,
+    )
+    parser.add_argument(
+        "--stats-filter",
+        type=str,
+        default=".*",
+        help="""
+        Regular expression allow-list of /ethdev/stats fields to export, per-queue
+        fields are named q_*.
+        """,
+    )
+    parser.add_argument(
+        "--xstats-filter",
+        type=str,
+        default="missed|errors|dropped|discard|nombuf",
+        help="""
+        Regular expression allow-list of /ethdev/xstats names to export, an empty string
+        disables xstats collection.
+        """,
+    )
+    parser.add_argument(
+        "--adaptive-sampling",
+        action="store_true",
+        help="""
+        Adapt the sampling interval of every DPDK application to how its traffic moves,
+        see --fast-interval and --slow-interval.
+        """,
+    )
+    parser.add_argument(
+        "--fast-interval",
+        type=float,
+        default=0.25,
+        help="""
+        Sampling interval in seconds of the applications whose rates change or that
+        match --fast-apps, with --adaptive-sampling.
+        """,
+    )
+    parser.add_argument(
+        "--slow-interval",
+        type=float,
+        default=10.0,
+        help="""
+        Sampling interval in seconds of the applications without traffic, with
+        --adaptive-sampling.
+        """,
+    )
+    parser.add_argument(
+        "--fast-apps",
+        type=str,
+        default="",
+        help="""
+        Regular expression of the applications always sampled every --fast-interval, for
+        instance the ones under test.
+        """,
+    )
+    parser.add_argument(
+        "--fast-change",
+        type=float,
+        default=0.1,
+        help="""
+        Relative change of the rx + tx pps of an application between two samples that
+        promotes it to --fast-interval.
+        """,
+    )
+    parser.add_argument(
+        "--query-budget",
+        type=float,
+        default=0,
+        help="""
+        Upper bound of the telemetry commands per second that --fast-interval is granted
+        within, 0 means no bound.
+        """,
+    )
+    parser.add_argument(
+        "--resource-stats",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="""
+        Sample the mempools, the EAL malloc heaps and the lcore usage of every DPDK
+        application along with the port stats.
+        """,
+    )
+    parser.add_argument(
+        "--hf-interval",
+        type=int,
+        default=0,
+        help="""
+        High-frequency sampling interval in milliseconds for microburst detection, 0
+        disables it.
+        """,
+    )
+    parser.add_argument(
+        "--hf-ports",
+        type=str,
+        default=".*",
+        help="""
+        Regular expression selecting the <app>:<port> pairs sampled at high frequency.
+        """,
+    )
+    parser.add_argument(
+        "--hf-window",
+        type=int,
+        default=1000,
+        help="""
+        Number of high-frequency samples kept per port, the window of the burst
+        statistics.
+        """,
+    )
+    parser.add_argument(
+        "--hf-buckets",
+        type=str,
+        default="100000,1000000,5000000,10000000,14880000,30000000",
+        help="""
+        Comma separated upper bounds in pps of the high-frequency rx pps histogram.
+        """,
+    )
+    parser.add_argument(
+        "--hf-burst-factor",
+        type=float,
+        default=2.0,
+        help="""
+        A burst is a run of high-frequency intervals above this multiple of the window
+        mean rx pps.
+        """,
+    )
+    parser.add_argument(
+        "--record-dir",
+        type=str,
+        default="",
+        help="""
+        Directory to record every sample to, in a compact binary file per application,
+        empty disables recording.
+        """,
+    )
+    parser.add_argument(
+        "--record-rotate-mb",
+        type=int,
+        default=64,
+        help="""
+        Size in MiB at which a recording file is rotated.
+        """,
+    )
+    parser.add_argument(
+        "--record-max-mb",
+        type=int,
+        default=1024,
+        help="""
+        Upper bound in MiB of the recordings kept per application, the oldest files are
+        removed first.
         """,
     )
     parser.add_argument(
@@ -168,10 +3145,11 @@ def main():
     parser.add_argument(
         "-b",
         "--backend",
-        type=int,
-        default=1,
+        type=str,
+        default="1",
         help="""
-        Collector backend choices, 1: prometheus, 2: otlp.
+        Comma separated collector backends, 1 or prometheus, 2 or otlp, e.g.
+        prometheus,otlp exports every sample to both.
         """
     )
     parser.add_argument(
@@ -182,47 +3160,116 @@ def main():
         OTLP URL, required for OTLP backend, default to http://localhost:4317.
         """
     )
+    parser.add_argument(
+        "--rollups",
+        type=str,
+        default="",
+        help="""
+        Comma separated seconds:buckets resolutions of the in-memory roll-ups, e.g.
+        1:600,10:2160,60:2880 keeps 10 minutes at 1s, 6 hours at 10s and 2 days at 1min,
+        empty disables the roll-ups.
+        """,
+    )
+    parser.add_argument(
+        "--rollup-stats",
+        type=str,
+        default="pps$|bps$",
+        help="""
+        Regular expression of the rates, drop causes and counters kept in the roll-ups.
+        """,
+    )
+    parser.add_argument(
+        "--rollup-port",
+        type=int,
+        default=9002,
+        help="""
+        Listening port of the roll-up query endpoint.
+        """,
+    )
+    parser.add_argument(
+        "--otlp-temporality",
+        choices=["cumulative", "delta"],
+        default="cumulative",
+        help="""
+        Aggregation temporality of the OTLP counters and histograms.
+        """,
+    )
     args = parser.parse_args()
+    try:
+        backends = parse_backends(args.backend)
+        rollups = RollupStore.parse(args.rollups) if args.rollups else None
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    return args, backends, rollups
 
-    if not os.path.exists(args.sock_prefix):
-        print("Please provide a valid --sock-prefix option")
-        # sock_path = sock_prefix + <app name> + "/dpdk_telemetry.v2"
-        raise SystemExit
 
-    initialize_sock_dict(args.sock_prefix, sock_dict)
-
-    if args.backend == 1:
-        start_http_server(args.port)
-        REGISTRY.register(PrometheusCollector(sock_dict))
-    elif args.backend == 2:
-        resource = Resource(attributes={
-            SERVICE_NAME: "dpdk-telemetry"
-        })
-        insecure = False
-        if args.otlp_url.startswith("http://"):
-            insecure = True
-        reader = PeriodicExportingMetricReader(
-            OTLPMetricExporter(endpoint=args.otlp_url, insecure=insecure),
-            export_interval_millis=args.interval*1000
-        )
-        provider = MeterProvider(resource=resource, metric_readers=[reader])
-        metrics.set_meter_provider(provider)
-        meter = metrics.get_meter("dpdk.stats")
-        otlp = OtlpCollector(sock_dict)
-        meter.create_observable_counter(
-            "dpdk.stats",
-            callbacks=[otlp.dpdk_telemetry_callback],
-            description="DPDK Telemetry"
+def add_listeners(args, sampler, rollups):
+    """Attach the sample recorder and the roll-up store, return them or None."""
+    recorder = None
+    if args.record_dir:
+        recorder = SampleRecorder(
+            args.record_dir, args.record_rotate_mb << 20, args.record_max_mb << 20
         )
+        sampler.listeners.append(recorder)
+    rollup_store = None
+    if rollups:
+        rollup_store = RollupStore(rollups, args.rollup_stats)
+        sampler.listeners.append(rollup_store)
+    return recorder, rollup_store
 
-    # watch for sub-dir creation/deletion under sock_prefix
+
+def start_observer(sock_prefix, sock_dict, sampler):
+    """Watch for sub-dir creation/deletion under sock_prefix."""
     # Create an observer and attach the event handler
-    event_handler = SocketEventHandler(sock_dict)
+    event_handler = SocketEventHandler(sock_dict, sampler.telemetry_options)
     observer = Observer()
-    observer.schedule(event_handler, args.sock_prefix, recursive=False)
+    observer.schedule(event_handler, sock_prefix, recursive=False)
 
     # Start the observer
     observer.start()
+    return observer
+
+
+def socket_discovery(args):
+    """Return the SocketDiscovery rescanning the sockets, None for the watchdog."""
+    # the watchdog follows a single --sock-prefix directory, everything else is
+    # rescanned
+    if args.sock_root or args.workers > 0:
+        return SocketDiscovery(args.sock_root or [args.sock_prefix])
+    if not os.path.exists(args.sock_prefix):
+        print("Please provide a valid --sock-prefix option")
+        # sock_path = sock_prefix + <app name> + "/dpdk_telemetry.v2"
+        raise SystemExit
+    return None
+
+
+def main():
+    logging.basicConfig(format='%(asctime)s - %(message)s', level=logging.INFO)
+    logging.basicConfig(format='%(asctime)s - %(message)s', level=logging.WARNING)
+    sock_dict = dict()
+    args, backends, rollups = parse_args()
+
+    discovery = socket_discovery(args)
+    if args.workers > 0:
+        sampler = ShardedSampler(args, args.workers)
+    else:
+        sampler = create_sampler(args, sock_dict)
+    if discovery is None:
+        initialize_sock_dict(args.sock_prefix, sock_dict, sampler.telemetry_options)
+    recorder, rollup_store = add_listeners(args, sampler, rollups)
+    if discovery is not None:
+        discovery.update(sampler)
+    sampler.start()
+    # wait for the first sample so the backends never serve an empty snapshot
+    sampler.ready.wait(args.interval + args.query_timeout)
+
+    shutdown = [start_backend(args, sampler) for start_backend in backends]
+    if rollup_store is not None:
+        shutdown.append(start_rollup_server(args, rollup_store))
+
+    observer = None
+    if discovery is None:
+        observer = start_observer(args.sock_prefix, sock_dict, sampler)
 
     def term_handler(signum, frame):
         logging.info("SIGTERM detected, raise KeyboardInterrupt")
@@ -233,12 +3280,24 @@ def main():
 
     try:
         while True:
-            time.sleep(1)
+            if discovery is None:
+                time.sleep(1)
+                continue
+            time.sleep(args.discovery_interval)
+            discovery.update(sampler)
     except KeyboardInterrupt:
         logging.info("Keyboardinterrupt detected")
-        observer.stop()
+        if observer is not None:
+            observer.stop()
+        sampler.stop()
 
-    observer.join()
+    if observer is not None:
+        observer.join()
+    sampler.join()
+    if recorder is not None:
+        recorder.close()
+    for shutdown_backend in shutdown:
+        shutdown_backend()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+"""
+Read the binary recordings written by dpdk-telemetry.py --record-dir
+"""
+
+import argparse
+import json
+import struct
+import sys
+
+MAGIC = b"DPDKREC1"
+
+
+class Recording:
+    """One recording file loaded in memory.
+
+    timestamps is the wall clock time of every sample in nanoseconds, columns
+    the "<port>.<stat>" names of the recorded counters and values a sequence of
+    rows, one per sample, in column order. With numpy installed timestamps and
+    values are zero-copy views of a single (samples, columns + 1) uint64 array.
+    """
+
+    def __init__(self, header, timestamps, values):
+        self.app = header["app"]
+        self.created = header["created"]
+        self.columns = header["columns"]
+        self.timestamps = timestamps
+        self.values = values
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def column(self, name):
+        index = self.columns.index(name)
+        if hasattr(self.values, "shape"):
+            return self.values[:, index]
+        return [row[index] for row in self.values]
+
+
+def load_recording(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[: len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a DPDK telemetry recording")
+    (header_len,) = struct.unpack_from("<I", data, len(MAGIC))
+    offset = len(MAGIC) + 4 + header_len
+    header = json.loads(data[len(MAGIC) + 4:offset])
+    width = len(header["columns"]) + 1
+    # the agent may have been stopped in the middle of a record, drop it
+    samples = (len(data) - offset) // (width * 8)
+    end = offset + samples * width * 8
+    try:
+        import numpy
+
+        table = numpy.frombuffer(
+            data, dtype="<u8", count=samples * width, offset=offset
+        )
+        table = table.reshape(samples, width)
+        return Recording(header, table[:, 0], table[:, 1:])
+    except ImportError:
+        pass
+    words = memoryview(data)[offset:end].cast("Q")
+    if sys.byteorder != "little":
+        words = struct.unpack(f"<{samples * width}Q", data[offset:end])
+    rows = [words[i:i + width] for i in range(0, samples * width, width)]
+    return Recording(header, [row[0] for row in rows], [row[1:] for row in rows])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("files", nargs="+", help="Recording files to read.")
+    parser.add_argument(
+        "--csv",
+        action="store_true",
+        help="Print every sample as CSV instead of a summary.",
+    )
+    args = parser.parse_args()
+
+    for path in args.files:
+        recording = load_recording(path)
+        if args.csv:
+            print(",".join(["timestamp_ns"] + recording.columns))
+            for timestamp, row in zip(recording.timestamps, recording.values):
+                print(",".join(str(int(v)) for v in [timestamp, *row]))
+            continue
+        print(
+            f"{path}: {recording.app}, {len(recording)} samples, "
+            f"{len(recording.columns)} columns"
+        )
+        if len(recording):
+            span = (int(recording.timestamps[-1]) - int(recording.timestamps[0])) / 1e9
+            print(f"  {span:.3f}s from {int(recording.timestamps[0]) / 1e9:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -231,7 +231,8 @@ async def start_trafficgen(
     runtime_tolerance: Optional[int] = 10,
     no_promisc: Optional[bool] = True,
     binary_search_extra_args: Optional[List[str]] = None,
-    dst_macs: Optional[str] = None
+    dst_macs: Optional[str] = None,
+    search_strategy: Optional[str] = None
 ) -> str:
     """Start the RFC2544 traffic generator with specified parameters.
     
@@ -267,6 +268,8 @@ async def start_trafficgen(
         no_promisc: Disable promiscuous mode (optional)
         binary_search_extra_args: Extra arguments for binary search (optional)
         dst_macs: Destination MAC addresses (required for L3 mode)
+        search_strategy: Throughput search algorithm, "binary" (default),
+            "exp-bisect" or "mlr" (optional)
     
     Returns:
         Success or failure message
@@ -306,7 +309,8 @@ async def start_trafficgen(
         "rate_tolerance": rate_tolerance,
         "runtime_tolerance": runtime_tolerance,
         "no_promisc": no_promisc,
-        "binary_search_extra_args": binary_search_extra_args
+        "binary_search_extra_args": binary_search_extra_args,
+        "search_strategy": search_strategy
     }
     
     # Add optional parameters that are not None
@@ -4,9 +4,23 @@ import argparse
 import requests
 import json
 import datetime
-import time
 
-CLIENT_ARGS = ["server_addr", "server_port", "action", "timeout"]
+CLIENT_ARGS = [
+    "server_addr",
+    "server_port",
+    "action",
+    "timeout",
+    "frame_sizes",
+    "flow_counts",
+    "loss_pcts",
+    "history_filters",
+]
+# sweep option -> (start field, type of its comma separated values)
+SWEEP_ARGS = {
+    "frame_sizes": ("frame_size", int),
+    "flow_counts": ("num_flows", int),
+    "loss_pcts": ("max_loss_pct", float),
+}
 
 
 def actionGetResult(args, returnResults=False):
@@ -49,6 +63,82 @@ def actionStartTrafficgen(args, returnResults=False):
         return response.json()
 
 
+def actionSweep(args, returnResults=False):
+    json_data = {}
+    for arg in vars(args):
+        val = getattr(args, arg)
+        if (val is not None) and (arg not in CLIENT_ARGS):
+            json_data[arg] = val
+    for arg, (field, field_type) in SWEEP_ARGS.items():
+        values = getattr(args, arg)
+        if values:
+            json_data[field] = [field_type(v) for v in values.split(",")]
+        else:
+            json_data[field] = [json_data[field]]
+
+    response = requests.post(
+        "http://"
+        + args.server_addr
+        + ":"
+        + str(args.server_port)
+        + "/trafficgen/sweep",
+        json=json_data,
+    )
+    if not returnResults:
+        print("sweep %s queued jobs:" % response.json()["sweep"])
+        for job in response.json()["jobs"]:
+            print(job)
+    else:
+        return response.json()
+
+
+def actionJobs(args, returnResults=False):
+    response = requests.get(
+        "http://" + args.server_addr + ":" + str(args.server_port) + "/jobs"
+    )
+    if not returnResults:
+        for job in response.json():
+            print(
+                "%s %-9s frame_size %s num_flows %s max_loss_pct %s"
+                % (
+                    job["id"],
+                    job["state"],
+                    job["config"]["frame_size"],
+                    job["config"]["num_flows"],
+                    job["config"]["max_loss_pct"],
+                )
+            )
+    else:
+        return response.json()
+
+
+def actionHistory(args, returnResults=False):
+    params = {}
+    for field in ["frame_size", "num_flows", "device_pairs", "max_loss_pct"]:
+        if field in args.history_filters:
+            params[field] = getattr(args, field)
+    response = requests.get(
+        "http://" + args.server_addr + ":" + str(args.server_port) + "/history",
+        params=params,
+    )
+    if not returnResults:
+        for run in response.json():
+            print(
+                "%s %-9s frame_size %s num_flows %s start %s"
+                % (
+                    run["id"],
+                    run["state"],
+                    run["frame_size"],
+                    run["num_flows"],
+                    datetime.datetime.fromtimestamp(run["start_time"]).isoformat(),
+                )
+            )
+            for port, result in sorted(run["result"].items()):
+                print("  port %s rx_pps: %.2f" % (port, result["rx_pps"]))
+    else:
+        return response.json()
+
+
 def actionStopTrafficgen(args, returnResults=False):
     response = requests.get(
         "http://" + args.server_addr + ":" + str(args.server_port) + "/trafficgen/stop"
@@ -95,6 +185,52 @@ def actionGetMac(args, returnResults=False):
         return response.json()
 
 
+def followProgress(args, timeout_time=None, quiet=False):
+    """Print the trials of the running trafficgen as they complete.
+
+    Returns the final done event, None if timeout_time was reached first.
+    """
+    response = requests.get(
+        "http://"
+        + args.server_addr
+        + ":"
+        + str(args.server_port)
+        + "/trafficgen/progress",
+        stream=True,
+    )
+    with response:
+        for line in response.iter_lines():
+            if not line:
+                continue
+            event = json.loads(line)
+            if event["event"] == "done":
+                return event
+            if event["event"] == "trial" and not quiet:
+                print(
+                    "trial %d rate %s%s: %s"
+                    % (
+                        event["trial"],
+                        event["rate"],
+                        event["rate_unit"],
+                        event["result"],
+                    )
+                )
+                for port, stats in sorted(event["ports"].items()):
+                    print(
+                        "  port %s rx_pps: %.2f loss: %s%%"
+                        % (port, stats["rx_pps"] or 0, stats["rx_lost_packets_pct"])
+                    )
+            if timeout_time is not None and datetime.datetime.now() > timeout_time:
+                return None
+    return None
+
+
+def actionWatch(args):
+    done = followProgress(args)
+    if done is not None:
+        print("trafficgen exited with code %s" % done["exit_code"])
+
+
 def actionAuto(args):
     json_data = {}
     if args.config:
@@ -110,14 +246,10 @@ def actionAuto(args):
     # Loop until timeout, checking for results
     timeout_time = datetime.datetime.now() + datetime.timedelta(0, 60 * args.timeout)
 
-    while True:
-        if datetime.datetime.now() > timeout_time:
-            print("Timed out waiting for results")
-            exit(1)
-        time.sleep(5)
-        status = actionStatus(args, returnResults=True)
-        if status["available"] and not status["running"]:
-            break
+    # the progress stream ends as soon as the search exits
+    if followProgress(args, timeout_time, quiet=True) is None:
+        print("Timed out waiting for results")
+        exit(1)
 
     results = actionGetResult(args, returnResults=True)
     print(json.dumps(results))
@@ -141,6 +273,14 @@ def run(args):
         actionGetResult(args)
     elif args.action == "get-mac":
         actionGetMac(args)
+    elif args.action == "sweep":
+        actionSweep(args)
+    elif args.action == "jobs":
+        actionJobs(args)
+    elif args.action == "history":
+        actionHistory(args)
+    elif args.action == "watch":
+        actionWatch(args)
     elif args.action == "auto":
         actionAuto(args)
     else:
@@ -153,7 +293,18 @@ if __name__ == "__main__":
     parser.add_argument(
         "action",
         help="specify what action the server will take",
-        choices=["start", "stop", "status", "get-result", "get-mac", "auto"],
+        choices=[
+            "start",
+            "stop",
+            "status",
+            "get-result",
+            "get-mac",
+            "sweep",
+            "jobs",
+            "history",
+            "watch",
+            "auto",
+        ],
     )
     parser.add_argument(
         "--l3",
@@ -328,12 +479,47 @@ if __name__ == "__main__":
         help="no promiscuous mode",
     )
     parser.add_argument("--dst-macs", dest="dst_macs", type=str, help="dst macs")
+    parser.add_argument(
+        "--search-strategy",
+        dest="search_strategy",
+        choices=["binary", "exp-bisect", "mlr"],
+        help="throughput search algorithm, binary-search.py by default, exp-bisect "
+        "probes exponentially then bisects, mlr starts with short trials",
+    )
     parser.add_argument(
         "--binary-search-extra-args",
         dest="binary_search_extra_args",
         type=str,
         help="binary search extra args (list in string)",
     )
+    # Sweep mode arguments
+    parser.add_argument(
+        "--frame-sizes",
+        dest="frame_sizes",
+        type=str,
+        help="comma separated frame sizes of a sweep, default to --frame-size",
+    )
+    parser.add_argument(
+        "--flow-counts",
+        dest="flow_counts",
+        type=str,
+        help="comma separated flow counts of a sweep, default to --num-flows",
+    )
+    parser.add_argument(
+        "--loss-pcts",
+        dest="loss_pcts",
+        type=str,
+        help="comma separated loss percentages of a sweep, default to --max-loss-pct",
+    )
+    # History mode arguments
+    parser.add_argument(
+        "--history-filters",
+        dest="history_filters",
+        type=str,
+        default="",
+        help="comma separated fields among frame_size, num_flows, device_pairs and "
+        "max_loss_pct the history is filtered on, with the value of their option",
+    )
     # Auto mode arguments
     parser.add_argument(
         "--config", dest="config", type=str, help="path to the config yaml"
@@ -0,0 +1,150 @@
+"""
+|------------------------------------------------------------------------------|
+|                                                                              |
+|    Filename: job_manager.py                                                  |
+| Description: Ownership of the binary-search process started by the REST      |
+|              API.                                                            |
+|                                                                              |
+|------------------------------------------------------------------------------|
+"""
+
+import os
+import signal
+import subprocess
+import threading
+import time
+
+
+class JobManager:
+    """Run at most one trafficgen job and keep track of it.
+
+    The job is started in its own process group, so that stopping it also stops
+    the trex-txrx.py processes binary-search.py starts, and nothing outside of it
+    is ever signalled. A waiter thread reaps the job as soon as it exits and
+    records its exit code and end time, status queries never walk the process
+    table.
+    """
+
+    def __init__(self, stop_timeout: float = 10.0):
+        self.stop_timeout = stop_timeout
+        self.lock = threading.Lock()
+        # serializes start() and stop(), so concurrent requests never leave an
+        # untracked job behind
+        self.control_lock = threading.RLock()
+        self.process = None
+        self.command = None
+        self.start_time = None
+        self.end_time = None
+        self.exit_code = None
+
+    def _wait(self, process: subprocess.Popen) -> None:
+        exit_code = process.wait()
+        with self.lock:
+            if process is self.process:
+                self.exit_code = exit_code
+                self.end_time = time.time()
+
+    def is_running(self) -> bool:
+        """Check if the current job is still running.
+
+        Returns:
+            Boolean: True if running, False otherwise
+        """
+        with self.lock:
+            return self.process is not None and self.exit_code is None
+
+    def start(self, command: list, **kwargs) -> bool:
+        """Start a new job, stopping the current one first.
+
+        Args:
+            command(List): The command line of the job
+            kwargs: Extra subprocess.Popen arguments
+
+        Returns:
+            Boolean: True on success, False otherwise
+        """
+        with self.control_lock:
+            if not self.stop():
+                return False
+            try:
+                process = subprocess.Popen(command, start_new_session=True, **kwargs)
+            except OSError as e:
+                print("failed to start %s: %s" % (command, e))
+                return False
+            with self.lock:
+                self.process = process
+                self.command = command
+                self.start_time = time.time()
+                self.end_time = None
+                self.exit_code = None
+            threading.Thread(target=self._wait, args=(process,), daemon=True).start()
+            return True
+
+    def wait(self) -> int:
+        """Wait for the current job to exit.
+
+        Returns:
+            Integer: the exit code of the job, None if no job was started
+        """
+        with self.lock:
+            process = self.process
+        if process is None:
+            return None
+        return process.wait()
+
+    def stop(self, pid: int = None) -> bool:
+        """Stop the current job, SIGTERM first then SIGKILL after stop_timeout.
+
+        Args:
+            pid(Integer): Only stop the current job if it is this process
+
+        Returns:
+            Boolean: True once the job is not running, False otherwise
+        """
+        with self.control_lock:
+            return self._stop(pid)
+
+    def _stop(self, pid: int = None) -> bool:
+        with self.lock:
+            process = self.process
+            if process is None or self.exit_code is not None:
+                return True
+            if pid is not None and process.pid != pid:
+                return True
+        for sig in (signal.SIGTERM, signal.SIGKILL):
+            try:
+                os.killpg(process.pid, sig)
+            except ProcessLookupError:
+                pass
+            except PermissionError:
+                return False
+            try:
+                process.wait(self.stop_timeout)
+                break
+            except subprocess.TimeoutExpired:
+                continue
+        else:
+            return False
+        # the waiter thread may not have recorded the exit yet
+        with self.lock:
+            if self.exit_code is None:
+                self.exit_code = process.returncode
+                self.end_time = time.time()
+        return True
+
+    def status(self) -> dict:
+        """Describe the current or last job.
+
+        Returns:
+            dict: running, pid, command, exit_code, start_time and end_time, the
+            times are in seconds since the epoch and None when not applicable
+        """
+        with self.lock:
+            return {
+                "running": self.process is not None and self.exit_code is None,
+                "pid": self.process.pid if self.process is not None else None,
+                "command": self.command,
+                "exit_code": self.exit_code,
+                "start_time": self.start_time,
+                "end_time": self.end_time,
+            }
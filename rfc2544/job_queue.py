@@ -0,0 +1,223 @@
+"""
+|------------------------------------------------------------------------------|
+|                                                                              |
+|    Filename: job_queue.py                                                    |
+| Description: Queue of trafficgen jobs run back to back against the running   |
+|              TRex server.                                                    |
+|                                                                              |
+|------------------------------------------------------------------------------|
+"""
+
+import collections
+import threading
+import time
+import uuid
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class Job:
+    """One binary search run and its outcome."""
+
+    def __init__(self, config: dict, sweep: str = None):
+        self.id = uuid.uuid4().hex
+        self.sweep = sweep
+        self.config = config
+        self.state = QUEUED
+        self.submit_time = time.time()
+        self.start_time = None
+        self.end_time = None
+        self.exit_code = None
+        self.pid = None
+        self.result = None
+        # set once the job left the queued state
+        self.started = threading.Event()
+        self.cancel_requested = False
+
+    def to_dict(self, result: bool = True) -> dict:
+        """Describe the job.
+
+        Args:
+            result(Boolean): Include the per port result
+
+        Returns:
+            dict: the job fields, times in seconds since the epoch
+        """
+        job = {
+            "id": self.id,
+            "sweep": self.sweep,
+            "state": self.state,
+            "config": self.config,
+            "submit_time": self.submit_time,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "exit_code": self.exit_code,
+        }
+        if result:
+            job["result"] = self.result
+        return job
+
+
+class JobQueue:
+    """Run the submitted jobs one at a time, in submission order.
+
+    A runner thread is the only one starting jobs through the JobManager, it
+    starts the next queued job as soon as the previous one exits, without any
+    client round trip in between. Finished jobs are kept, with their result,
+    until there are more than history of them.
+    """
+
+    def __init__(self, job_manager, build_command, collect_result, history=1000):
+        """
+        Args:
+            job_manager(JobManager): Runs the job processes
+            build_command(Function): Called with the config of a job, returns
+                its command line
+            collect_result(Function): Called with a finished job, returns its
+                result
+            history(Integer): Number of finished jobs kept
+        """
+        self.job_manager = job_manager
+        self.build_command = build_command
+        self.collect_result = collect_result
+        self.history = history
+        self.condition = threading.Condition()
+        self.queued = collections.deque()
+        self.running = None
+        # id -> Job, in submission order
+        self.jobs = collections.OrderedDict()
+        # called with every job that finished running, from the runner thread
+        self.listeners = []
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _add(self, job: Job) -> None:
+        self.jobs[job.id] = job
+        finished = [j.id for j in self.jobs.values() if j.end_time is not None]
+        for job_id in finished[: max(0, len(finished) - self.history)]:
+            del self.jobs[job_id]
+
+    def _finish(self, job: Job, state: str) -> None:
+        job.state = state
+        job.end_time = time.time()
+        job.started.set()
+
+    def _run(self) -> None:
+        while True:
+            with self.condition:
+                while not self.queued:
+                    self.condition.wait()
+                job = self.queued.popleft()
+                self.running = job
+                job.state = RUNNING
+                job.start_time = time.time()
+                started = self.job_manager.start(self.build_command(job.config))
+                job.pid = self.job_manager.status()["pid"] if started else None
+                job.started.set()
+            exit_code = self.job_manager.wait() if started else None
+            result = self.collect_result(job) if started else None
+            with self.condition:
+                job.exit_code = exit_code
+                job.result = result
+                if job.cancel_requested:
+                    self._finish(job, CANCELLED)
+                else:
+                    self._finish(job, DONE if exit_code == 0 else FAILED)
+                self.running = None
+                self.condition.notify_all()
+            for listener in self.listeners:
+                try:
+                    listener(job)
+                except Exception as e:
+                    print("failed to process finished job %s: %s" % (job.id, e))
+
+    def submit(self, configs: list, sweep: str = None) -> list:
+        """Queue a job per config.
+
+        Args:
+            configs(List): The configs of the jobs, in run order
+            sweep(String): Groups the jobs of one sweep request
+
+        Returns:
+            list: the queued jobs
+        """
+        jobs = [Job(config, sweep) for config in configs]
+        with self.condition:
+            for job in jobs:
+                self._add(job)
+                self.queued.append(job)
+            self.condition.notify_all()
+        return jobs
+
+    def run_now(self, config: dict, timeout: float = None) -> Job:
+        """Cancel the queued jobs, stop the running one and run config next.
+
+        Args:
+            config(dict): The config of the job
+            timeout(Float): Seconds to wait for the job to be started
+
+        Returns:
+            Job: the job, cancelled if it was not started within timeout
+        """
+        job = Job(config)
+        with self.condition:
+            self._cancel_queued()
+            self._add(job)
+            self.queued.appendleft(job)
+            running = self.running
+            if running is not None:
+                running.cancel_requested = True
+            self.condition.notify_all()
+        if running is not None:
+            self.job_manager.stop(running.pid)
+        if not job.started.wait(timeout):
+            with self.condition:
+                # the caller gives up on the job, it must not start later on
+                if job.state == QUEUED:
+                    self.queued.remove(job)
+                    self._finish(job, CANCELLED)
+        return job
+
+    def _cancel_queued(self) -> None:
+        while self.queued:
+            self._finish(self.queued.popleft(), CANCELLED)
+
+    def cancel(self, job_id: str = None) -> bool:
+        """Cancel a job, or every queued and running job.
+
+        Args:
+            job_id(String): The job to cancel, None for all of them
+
+        Returns:
+            Boolean: True if the job is not running anymore, False otherwise
+        """
+        with self.condition:
+            if job_id is None:
+                self._cancel_queued()
+                running = self.running
+            else:
+                job = self.jobs.get(job_id)
+                if job is None:
+                    return False
+                if job.state == QUEUED:
+                    self.queued.remove(job)
+                    self._finish(job, CANCELLED)
+                    return True
+                running = job if job is self.running else None
+            if running is not None:
+                running.cancel_requested = True
+        if running is None:
+            return True
+        return self.job_manager.stop(running.pid)
+
+    def get(self, job_id: str) -> Job:
+        with self.condition:
+            return self.jobs.get(job_id)
+
+    def list(self) -> list:
+        with self.condition:
+            return list(self.jobs.values())
@@ -10,69 +10,182 @@
 |------------------------------------------------------------------------------|
 """
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
+import gzip
+import itertools
 import json
-from marshmallow import EXCLUDE
-import os.path
-import psutil
-import re
-from rest_schema import ResultSchema, StartSchema, StartSchemal3, PortSchema
-import subprocess
+import os
+import sqlite3
+from marshmallow import EXCLUDE, ValidationError
+from job_manager import JobManager
+from job_queue import Job, JobQueue
+from rest_schema import (
+    ResultSchema,
+    StartSchema,
+    StartSchemal3,
+    SweepSchema,
+    SweepSchemal3,
+    PortSchema,
+)
+from run_history import RunHistory, parse_filters
+from trial_log import TrialLog, port_stats, trial_page
 import sys
+import uuid
 
 sys.path.append("/opt/trex/current/automation/trex_control_plane/interactive")
-from trex.stl.api import *  # noqa: E402, F403
-from trex_tg_lib import *  # noqa: E402, F403
+from trex_connection import TRexConnection  # noqa: E402
 
 
 app = Flask(__name__)
+# the binary-search job started by /trafficgen/start
+job_manager = JobManager()
+trial_log = TrialLog()
+# serves /maclist and /stats/live
+trex_connection = TRexConnection()
+# smaller result bodies are not worth compressing
+GZIP_MIN_SIZE = 512
+# same output as jsonify()
+JSON_FORMAT = {"sort_keys": True, "separators": (",", ":")}
+# default location of the run history, mount a volume there to keep it
+HISTORY_DB = "/var/lib/tgen/history.db"
+# a start waits for the running job to be stopped, SIGKILL included
+START_TIMEOUT = 2 * job_manager.stop_timeout + 5
+
+
+def last_trial_passed(trials: list) -> bool:
+    """Check if the last trial passed, results are only available then.
+
+    Args:
+        trials(List): The trials of the binary search log
+
+    Returns:
+        Boolean: True if the last trial passed, False otherwise
+    """
+    return bool(trials) and trials[-1].get("result") == "pass"
 
 
-def checkIfProcessRunning(processName: str) -> bool:
-    """Check if there is any running process that contains the given name processName.
+def final_result(trials: list) -> dict:
+    """Validate the per port stats of the last trial.
 
     Args:
-        processName(String): The name of the process
+        trials(List): The trials of the binary search log
 
     Returns:
-        Boolean: True if running, False otherwise
+        dict: port number -> ResultSchema fields, empty upon exception
     """
-    # Iterate over the all the running processes.
-    for proc in psutil.process_iter():
-        try:
-            pinfo = proc.as_dict(attrs=["pid", "name", "status"])
-            # Check if process name contains the given name string.
-            if processName.lower() in pinfo["name"].lower():
-                if "zombie" in pinfo["status"].lower():
-                    os.waitpid(pinfo["pid"], os.WNOHANG)
-                    continue
-                return True
-        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+    result = {}
+    try:
+        stats = port_stats(trials[-1])
+        for port in stats:
+            result_schema = ResultSchema()
+            result[port] = result_schema.load(stats[port], unknown=EXCLUDE)
+    except Exception:
+        # return an empty dict upon exception
+        result = {}
+    return result
+
+
+def search_command(config: dict) -> list:
+    """Build the search command line of a start config.
+
+    The binary search_strategy, the default, runs binary-search.py, the others
+    run throughput-search.py, which takes the same options.
+
+    Args:
+        config(dict): StartSchema or StartSchemal3 fields
+
+    Returns:
+        list: the command line
+    """
+    strategy = config.get("search_strategy", "binary")
+    if strategy == "binary":
+        command = ["./binary-search.py", "--traffic-generator=trex-txrx"]
+    else:
+        command = ["./throughput-search.py", "--search-strategy=" + strategy]
+    for field in config:
+        if field in [
+            "send_teaching_warmup",
+            "no_promisc",
+        ]:
+            if config[field]:
+                command.append("--" + field.replace("_", "-"))
+        elif field in [
+            "use_src_ip_flows",
+            "use_dst_ip_flows",
+            "use_src_mac_flows",
+            "use_dst_mac_flows",
+        ]:
+            command.append(
+                "--"
+                + field.replace("_", "-")
+                + "="
+                + str(int(config[field] == True))  # noqa: E712
+            )
+        elif field == "binary_search_extra_args":
+            for extra_arg in config[field]:
+                if extra_arg[0:2] != "--":
+                    extra_arg = "--" + extra_arg
+                command.append(extra_arg)
+        elif field in ["l3", "search_strategy"]:
             pass
+        else:
+            command.append(
+                "--" + field.replace("_", "-") + "=" + str(config[field])
+            )
+    print(command)
+    return command
+
+
+def job_result(job: Job) -> dict:
+    """Collect the result of a finished job from the trial log.
+
+    Args:
+        job(Job): The finished job
+
+    Returns:
+        dict: port number -> ResultSchema fields, empty if the job wrote no log
+    """
+    identity = trial_log.identity()
+    if identity is None or identity[2] < job.start_time * 1e9:
+        return {}
+    return trial_log.cached("final_result", final_result)[1]
 
-    return False
 
+def cached_json(name: str, build) -> Response:
+    """Serve a value derived from the trial log, built once per log version.
 
-def killProcessByName(processName: str) -> bool:
-    """Kill all PIDs whose name contains the given processName.
+    The ETag is derived from the identity of the log, a client sending it back
+    in If-None-Match gets a 304 until the log changes. Bodies larger than
+    GZIP_MIN_SIZE are gzip compressed for clients accepting it, the compressed
+    body is cached as well.
 
     Args:
-        processName(String): The name of the process
+        name(String): The name the body is cached under
+        build(Function): Called with the trials to derive the value
 
     Returns:
-        Boolean: True on success, False otherwise
+        Response: the json body, compressed or not, or a 304
     """
-    # Iterate over the all the running process
-    for proc in psutil.process_iter():
-        try:
-            pinfo = proc.as_dict(attrs=["pid", "name"])
-            # Check if process name contains the given name string.
-            if processName.lower() in pinfo["name"].lower():
-                p = psutil.Process(pinfo["pid"])
-                p.terminate()
-        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-            return False
-    return True
+    identity, body = trial_log.cached(
+        name, lambda trials: (json.dumps(build(trials), **JSON_FORMAT) + "\n").encode()
+    )
+    encoding = None
+    if len(body) >= GZIP_MIN_SIZE and "gzip" in request.accept_encodings:
+        encoding = "gzip"
+        _, body = trial_log.cached(
+            name + ".gz", lambda trials: gzip.compress(body, compresslevel=6)
+        )
+    response = Response(body, mimetype="application/json")
+    response.vary.add("Accept-Encoding")
+    if encoding is not None:
+        response.content_encoding = encoding
+    if identity is not None:
+        # the compressed body is a different representation with its own tag
+        etag = "%x-%x-%x" % identity + ("-gz" if encoding else "")
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        response.make_conditional(request)
+    return response
 
 
 class RestApi:
@@ -86,7 +199,20 @@ class RestApi:
         Returns:
             dict: json wrapped boolean result of process running
         """
-        return jsonify(checkIfProcessRunning("binary-search"))
+        return jsonify(job_manager.is_running())
+
+    @app.route("/trafficgen/status", methods=["GET"])
+    def get_trafficgen_status() -> dict:
+        """Endpoint to describe the current or last trafficgen job via GET.
+
+        Args:
+            None
+
+        Returns:
+            dict: json wrapped running state, pid, command, exit code, start and
+            end times of the job
+        """
+        return jsonify(job_manager.status())
 
     @app.route("/trafficgen/start", methods=["POST"])
     def start_trafficgen() -> dict:
@@ -99,54 +225,14 @@ class RestApi:
             dict: json wrapped boolean result of starting trafficgen
         """
         request_data = request.get_json()
-        # If an instance is already running, kill it first
-        if checkIfProcessRunning("binary-search"):
-            if not killProcessByName("binary-search"):
-                return jsonify(False)
 
         start_schema = StartSchema()
         if request_data["l3"]:
             start_schema = StartSchemal3()
         result = start_schema.load(request_data)
 
-        binary_search_command = ["./binary-search.py", "--traffic-generator=trex-txrx"]
-        for field in result:
-            if field in [
-                "send_teaching_warmup",
-                "no_promisc",
-            ]:
-                if result[field]:
-                    binary_search_command.append("--" + field.replace("_", "-"))
-            elif field in [
-                "use_src_ip_flows",
-                "use_dst_ip_flows",
-                "use_src_mac_flows",
-                "use_dst_mac_flows",
-            ]:
-                binary_search_command.append(
-                    "--"
-                    + field.replace("_", "-")
-                    + "="
-                    + str(int(result[field] == True))  # noqa: E712
-                )
-            elif field == "binary_search_extra_args":
-                for extra_arg in result[field]:
-                    if extra_arg[0:2] != "--":
-                        extra_arg = "--" + extra_arg
-                    binary_search_command.append(extra_arg)
-            elif field == "l3":
-                pass
-            else:
-                binary_search_command.append(
-                    "--" + field.replace("_", "-") + "=" + str(result[field])
-                )
-        print(binary_search_command)
-        subprocess.Popen(binary_search_command)
-
-        if checkIfProcessRunning("binary-search"):
-            return jsonify(True)
-        else:
-            return jsonify(False)
+        job = job_queue.run_now(result, timeout=START_TIMEOUT)
+        return jsonify(job.pid is not None)
 
     @app.route("/trafficgen/stop", methods=["GET"])
     def stop_trafficgen() -> dict:
@@ -158,58 +244,199 @@ class RestApi:
         Returns:
             dict: json wrapped boolean result of stopping trafficgen
         """
-        return jsonify(killProcessByName("binary-search"))
+        return jsonify(job_queue.cancel())
+
+    @app.route("/trafficgen/sweep", methods=["POST"])
+    def start_sweep() -> dict:
+        """Endpoint to queue a run per frame size, flow count and loss via POST.
+
+        Args:
+            None, POST requires SweepSchema or SweepSchemal3 JSON
+
+        Returns:
+            dict: json wrapped sweep id and ids of the queued jobs, in run order
+        """
+        request_data = request.get_json()
+        sweep_schema = SweepSchema()
+        if request_data["l3"]:
+            sweep_schema = SweepSchemal3()
+        result = sweep_schema.load(request_data)
+
+        configs = []
+        for frame_size, num_flows, max_loss_pct in itertools.product(
+            result["frame_size"], result["num_flows"], result["max_loss_pct"]
+        ):
+            config = dict(result)
+            config.update(
+                frame_size=frame_size, num_flows=num_flows, max_loss_pct=max_loss_pct
+            )
+            configs.append(config)
+        sweep = uuid.uuid4().hex
+        jobs = job_queue.submit(configs, sweep)
+        return jsonify({"sweep": sweep, "jobs": [job.id for job in jobs]})
+
+    @app.route("/jobs", methods=["GET"])
+    def list_jobs() -> dict:
+        """Endpoint to list the jobs via GET.
+
+        Args:
+            None, the optional sweep and state query parameters filter the jobs
+
+        Returns:
+            dict: json wrapped list of jobs, without their results
+        """
+        sweep = request.args.get("sweep")
+        state = request.args.get("state")
+        return jsonify(
+            [
+                job.to_dict(result=False)
+                for job in job_queue.list()
+                if (sweep is None or job.sweep == sweep)
+                and (state is None or job.state == state)
+            ]
+        )
+
+    @app.route("/jobs/<job_id>", methods=["GET"])
+    def get_job(job_id: str) -> dict:
+        """Endpoint to fetch a job and its result via GET.
+
+        Args:
+            job_id(String): The job id
+
+        Returns:
+            dict: json wrapped job, 404 if unknown
+        """
+        job = job_queue.get(job_id)
+        if job is None:
+            return jsonify({}), 404
+        return jsonify(job.to_dict())
+
+    @app.route("/jobs/<job_id>", methods=["DELETE"])
+    def cancel_job(job_id: str) -> dict:
+        """Endpoint to cancel a queued or running job via DELETE.
+
+        Args:
+            job_id(String): The job id
+
+        Returns:
+            dict: json wrapped boolean result of cancelling the job, 404 if unknown
+        """
+        if job_queue.get(job_id) is None:
+            return jsonify(False), 404
+        return jsonify(job_queue.cancel(job_id))
+
+    @app.route("/history", methods=["GET"])
+    def get_history() -> dict:
+        """Endpoint to query the run history via GET.
+
+        Args:
+            None, the optional frame_size, num_flows, device_pairs, max_loss_pct,
+            state, sweep, since and until query parameters filter the runs,
+            limit (default 100) and offset page through them
+
+        Returns:
+            dict: json wrapped list of runs with their config, timing and per
+            port result, most recent first
+        """
+        if run_history is None:
+            return jsonify([]), 503
+        try:
+            filters = parse_filters(request.args)
+            limit = int(request.args.get("limit", 100))
+            offset = int(request.args.get("offset", 0))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify(run_history.query(filters, limit, offset))
+
+    @app.route("/history/export", methods=["GET"])
+    def export_history() -> Response:
+        """Endpoint to export the run history via GET.
+
+        Args:
+            None, takes the filters of /history
+
+        Returns:
+            Response: newline delimited JSON, one run per line, most recent first
+        """
+        if run_history is None:
+            return jsonify([]), 503
+        try:
+            filters = parse_filters(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        runs = run_history.export(filters)
+        return Response(
+            stream_with_context(json.dumps(run) + "\n" for run in runs),
+            mimetype="application/x-ndjson",
+        )
+
+    @app.route("/trafficgen/progress", methods=["GET"])
+    def stream_trafficgen_progress() -> Response:
+        """Endpoint to follow the running trafficgen via GET.
+
+        Args:
+            None
+
+        Returns:
+            Response: newline delimited JSON events, one per completed trial with
+            its rate, result and per port rx_pps and loss, heartbeats while the
+            search runs, and a final done event with the job status
+        """
+        events = trial_log.follow(job_manager)
+        return Response(
+            stream_with_context(json.dumps(event) + "\n" for event in events),
+            mimetype="application/x-ndjson",
+        )
 
     @app.route("/result/available", methods=["GET"])
-    def isResultAvailable() -> dict:
+    def isResultAvailable() -> Response:
         """Check if results are available via GET.
 
         Args:
             None
 
         Returns:
-            dict: json wrapped boolean result
+            Response: json wrapped boolean result
         """
-        # If the result file is not present or the last trial did not pass,
-        # then results are not available
-        try:
-            with open("binary-search.json") as f:
-                data = json.load(f)
-            result = data["trials"][-1]["result"]
-            if result == "pass":
-                return jsonify(True)
-            else:
-                return jsonify(False)
-        except Exception:
-            return jsonify(False)
+        return cached_json("available", last_trial_passed)
 
     @app.route("/result", methods=["GET"])
-    def get_result() -> dict:
+    def get_result() -> Response:
         """Endpoint to fetch results via GET.
 
         Args:
             None
 
         Returns:
-            dict: json wrapped dict result
+            Response: json wrapped dict result
+        """
+        return cached_json("result", final_result)
+
+    @app.route("/result/trials", methods=["GET"])
+    def get_trials() -> Response:
+        """Endpoint to fetch the trials of the binary search log via GET.
+
+        Args:
+            None, the offset (default 0) and limit (default 100) query
+            parameters page through the trials, fields is a comma separated
+            list of trial fields, ports.<stat> selects a stat of every port
+
+        Returns:
+            Response: json wrapped total number of trials, offset and trials
         """
-        pattern = re.compile("^[0-9]+$")
-        result = {}
         try:
-            with open("binary-search.json") as f:
-                data = json.load(f)
-            stats = data["trials"][-1]["stats"]
-            for port in stats:
-                if not pattern.match(port):
-                    continue
-                result_schema = ResultSchema()
-                results = result_schema.load(stats[port], unknown=EXCLUDE)
-                result[port] = results
-        except Exception:
-            # return an empty dict upon exception
-            result = {}
-
-        return jsonify(result)
+            offset = max(0, int(request.args.get("offset", 0)))
+            limit = max(0, int(request.args.get("limit", 100)))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        fields = request.args.get("fields")
+        if fields is not None:
+            fields = [field for field in fields.split(",") if field]
+        # the page is cached per query, until the log changes
+        name = "trials:%d:%d:%s" % (offset, limit, fields)
+        return cached_json(
+            name, lambda trials: trial_page(trials, offset, limit, fields)
+        )
 
     @app.route("/maclist", methods=["GET"])
     def getMacList():
@@ -222,19 +449,41 @@ class RestApi:
             dict: json wrapped string list of macs
         """
         macList = ""
+        port_info = trex_connection.get_port_info()
         try:
-            c = STLClient(server="localhost")  # noqa: F405
-            c.connect()
-            port_info = c.get_port_info(ports=[0, 1])
             port_schema = PortSchema()
             port_0 = port_schema.load(port_info[0], unknown=EXCLUDE)
             port_1 = port_schema.load(port_info[1], unknown=EXCLUDE)
             macList = port_0["hw_mac"] + "," + port_1["hw_mac"]
-        except TRexError:  # noqa: F405
+        except (IndexError, ValidationError):
             macList = ""
-        finally:
-            c.disconnect()
-            return jsonify(macList)
+        return jsonify(macList)
+
+    @app.route("/stats/live", methods=["GET"])
+    def get_live_stats() -> dict:
+        """Endpoint to get the current TRex port stats via GET.
+
+        Args:
+            None
+
+        Returns:
+            dict: json wrapped timestamp and per port tx/rx pps, bps, L1 bps and
+            latency, 503 if the TRex server cannot be reached
+        """
+        stats = trex_connection.live_stats()
+        if stats is None:
+            return jsonify({}), 503
+        return jsonify(stats)
+
+
+# created once the functions it calls are defined
+job_queue = JobQueue(job_manager, search_command, job_result)
+try:
+    run_history = RunHistory(os.environ.get("HISTORY_DB", HISTORY_DB))
+    job_queue.listeners.append(run_history.record)
+except (OSError, sqlite3.Error) as e:
+    print("run history is disabled: %s" % e)
+    run_history = None
 
 
 def create_app():
@@ -1,4 +1,5 @@
-from marshmallow import fields, Schema
+from marshmallow import fields, Schema, validate
+from search_strategy import STRATEGIES
 
 
 class ResultSchema(Schema):
@@ -133,6 +134,9 @@ class StartSchema(Schema):
     runtime_tolerance = fields.Int(required=False)
     no_promisc = fields.Boolean(required=False)
     binary_search_extra_args = fields.List(fields.String(), required=False)
+    search_strategy = fields.String(
+        required=False, validate=validate.OneOf(["binary"] + STRATEGIES)
+    )
 
 
 class StartSchemal3(StartSchema):
@@ -141,6 +145,35 @@ class StartSchemal3(StartSchema):
     )
 
 
+class SweepSchema(StartSchema):
+    """A StartSchema run for every frame_size, num_flows and max_loss_pct."""
+
+    num_flows = fields.List(
+        fields.Int(),
+        required=True,
+        validate=validate.Length(min=1),
+        error_messages={"required": "num_flows is required."},
+    )
+    frame_size = fields.List(
+        fields.Int(),
+        required=True,
+        validate=validate.Length(min=1),
+        error_messages={"required": "frame_size is required."},
+    )
+    max_loss_pct = fields.List(
+        fields.Float(),
+        required=True,
+        validate=validate.Length(min=1),
+        error_messages={"required": "max_loss_pct is required."},
+    )
+
+
+class SweepSchemal3(SweepSchema):
+    dst_macs = fields.String(
+        required=True, error_messages={"required": "dst_macs is required."}
+    )
+
+
 class PortSchema(Schema):
     hw_mac = fields.String(
         required=True, error_messages={"required": "hw_mac is required."}
@@ -0,0 +1,243 @@
+"""
+|------------------------------------------------------------------------------|
+|                                                                              |
+|    Filename: run_history.py                                                  |
+| Description: Persistent history of the trafficgen runs in SQLite.            |
+|                                                                              |
+|------------------------------------------------------------------------------|
+"""
+
+import json
+import os
+import sqlite3
+import threading
+
+from marshmallow import fields
+from rest_schema import ResultSchema
+
+# run column -> SQL type, the config fields the history is filtered on have
+# their own indexed column, the whole config is kept as JSON
+RUN_COLUMNS = {
+    "id": "TEXT PRIMARY KEY",
+    "sweep": "TEXT",
+    "state": "TEXT",
+    "frame_size": "INTEGER",
+    "num_flows": "INTEGER",
+    "device_pairs": "TEXT",
+    "max_loss_pct": "REAL",
+    "submit_time": "REAL",
+    "start_time": "REAL",
+    "end_time": "REAL",
+    "exit_code": "INTEGER",
+    "config": "TEXT",
+}
+INDEXED_COLUMNS = ["frame_size", "num_flows", "device_pairs", "start_time"]
+# the history filters, query parameter -> (SQL condition, type of the value)
+FILTERS = {
+    "frame_size": ("frame_size = ?", int),
+    "num_flows": ("num_flows = ?", int),
+    "device_pairs": ("device_pairs = ?", str),
+    "max_loss_pct": ("max_loss_pct = ?", float),
+    "state": ("state = ?", str),
+    "sweep": ("sweep = ?", str),
+    "since": ("start_time >= ?", float),
+    "until": ("start_time < ?", float),
+}
+
+
+def parse_filters(args: dict) -> dict:
+    """Pick and convert the FILTERS among query parameters.
+
+    Args:
+        args(dict): The query parameters
+
+    Returns:
+        dict: FILTERS name -> value, raises ValueError on an invalid value
+    """
+    filters = {}
+    for name, (_, value_type) in FILTERS.items():
+        if name in args:
+            try:
+                filters[name] = value_type(args[name])
+            except ValueError:
+                raise ValueError("invalid %s: %s" % (name, args[name]))
+    return filters
+
+
+def result_columns() -> dict:
+    """Return the port_results column -> SQL type of every ResultSchema field."""
+    columns = {}
+    for name, field in ResultSchema().fields.items():
+        if isinstance(field, (fields.Int, fields.Boolean)):
+            columns[name] = "INTEGER"
+        else:
+            columns[name] = "REAL"
+    return columns
+
+
+class RunHistory:
+    """Every finished run with its config, timing and per port results.
+
+    A run is a row of the runs table, its per port results rows of the
+    port_results table with a column per ResultSchema field, so runs can be
+    compared in SQL as well. Writes go through a single connection, queries
+    open their own so a long export does not hold back the writer.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.result_columns = result_columns()
+        self.booleans = [
+            name
+            for name, field in ResultSchema().fields.items()
+            if isinstance(field, fields.Boolean)
+        ]
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self._create()
+
+    def _create(self) -> None:
+        with self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS runs (%s)"
+                % ", ".join("%s %s" % column for column in RUN_COLUMNS.items())
+            )
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS port_results ("
+                "run_id TEXT NOT NULL REFERENCES runs(id), "
+                "port TEXT NOT NULL, PRIMARY KEY (run_id, port))"
+            )
+            # ResultSchema fields added since the database was created
+            existing = [
+                row[1] for row in self.db.execute("PRAGMA table_info(port_results)")
+            ]
+            for name, sql_type in self.result_columns.items():
+                if name not in existing:
+                    self.db.execute(
+                        "ALTER TABLE port_results ADD COLUMN %s %s" % (name, sql_type)
+                    )
+            for column in INDEXED_COLUMNS:
+                self.db.execute(
+                    "CREATE INDEX IF NOT EXISTS runs_%s ON runs (%s)" % (column, column)
+                )
+
+    def record(self, job) -> None:
+        """Save a finished job, called by the JobQueue.
+
+        Args:
+            job(Job): The finished job, jobs cancelled before they started are
+                not runs and are skipped
+        """
+        if job.start_time is None:
+            return
+        run = job.to_dict(result=False)
+        row = [
+            json.dumps(job.config) if name == "config"
+            else run.get(name, job.config.get(name))
+            for name in RUN_COLUMNS
+        ]
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO runs (%s) VALUES (%s)"
+                % (", ".join(RUN_COLUMNS), ", ".join("?" * len(RUN_COLUMNS))),
+                row,
+            )
+            for port, stats in (job.result or {}).items():
+                names = ["run_id", "port"] + list(self.result_columns)
+                self.db.execute(
+                    "INSERT OR REPLACE INTO port_results (%s) VALUES (%s)"
+                    % (", ".join(names), ", ".join("?" * len(names))),
+                    [job.id, port] + [stats.get(name) for name in self.result_columns],
+                )
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def _results(self, db: sqlite3.Connection, runs: list) -> None:
+        by_id = {run["id"]: run for run in runs}
+        if not by_id:
+            return
+        rows = db.execute(
+            "SELECT * FROM port_results WHERE run_id IN (%s)"
+            % ", ".join("?" * len(by_id)),
+            list(by_id),
+        )
+        for row in rows:
+            stats = {name: row[name] for name in self.result_columns}
+            for name in self.booleans:
+                if stats[name] is not None:
+                    stats[name] = bool(stats[name])
+            by_id[row["run_id"]]["result"][row["port"]] = stats
+
+    @staticmethod
+    def _run(row: sqlite3.Row) -> dict:
+        run = {name: row[name] for name in RUN_COLUMNS}
+        run["config"] = json.loads(run["config"])
+        run["result"] = {}
+        return run
+
+    def _select(self, filters: dict, limit: int = None, offset: int = 0) -> tuple:
+        conditions = []
+        values = []
+        for name, value in filters.items():
+            conditions.append(FILTERS[name][0])
+            values.append(value)
+        sql = "SELECT * FROM runs"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY start_time DESC"
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            values += [limit, offset]
+        return sql, values
+
+    def query(self, filters: dict, limit: int = 100, offset: int = 0) -> list:
+        """Return the runs matching filters, most recent first.
+
+        Args:
+            filters(dict): FILTERS name -> value
+            limit(Integer): Maximum number of runs returned
+            offset(Integer): Number of matching runs skipped
+
+        Returns:
+            list: the runs with their config and per port result
+        """
+        db = self._connect()
+        try:
+            rows = db.execute(*self._select(filters, limit, offset))
+            runs = [self._run(row) for row in rows]
+            self._results(db, runs)
+            return runs
+        finally:
+            db.close()
+
+    def export(self, filters: dict, batch: int = 500):
+        """Yield every run matching filters, most recent first.
+
+        The runs are read batch at a time, an export of the whole history
+        never holds it in memory.
+
+        Args:
+            filters(dict): FILTERS name -> value
+            batch(Integer): Number of runs read at once
+
+        Yields:
+            dict: the runs with their config and per port result
+        """
+        db = self._connect()
+        try:
+            cursor = db.execute(*self._select(filters))
+            while True:
+                runs = [self._run(row) for row in cursor.fetchmany(batch)]
+                if not runs:
+                    return
+                self._results(db, runs)
+                yield from runs
+        finally:
+            db.close()
@@ -0,0 +1,212 @@
+"""
+|------------------------------------------------------------------------------|
+|                                                                              |
+|    Filename: search_strategy.py                                              |
+| Description: Throughput search algorithms converging in fewer full length    |
+|              trials than the plain binary search.                            |
+|                                                                              |
+|------------------------------------------------------------------------------|
+"""
+
+# search strategies run by throughput-search.py, "binary" stays the
+# binary-search.py of bench-trafficgen
+STRATEGIES = ["exp-bisect", "mlr"]
+SEARCH = "search"
+VALIDATION = "validation"
+
+
+class ThroughputSearch:
+    """Find the highest rate passing a trial, with the rate unknown at first.
+
+    A trial is run by the measure function, called with the rate, the runtime
+    and the kind of trial (SEARCH or VALIDATION) and returning whether the
+    trial passed and the rate the device under test actually forwarded. Rates
+    are in whatever unit measure() takes. The search stops once a passing and
+    a failing rate are within granularity percent of the failing one, and
+    validates the passing one at the validation runtime.
+
+    A trial failing at a rate also fails at that rate with a longer runtime,
+    only passing rates are measured again when the runtime grows.
+    """
+
+    def __init__(
+        self,
+        measure,
+        max_rate: float,
+        granularity: float,
+        min_rate: float = None,
+        max_validations: int = 3,
+    ):
+        """
+        Args:
+            measure(Function): Runs a trial, see above
+            max_rate(Float): The highest rate tried, also the first one
+            granularity(Float): Width of the final search interval, in percent
+                of its upper end
+            min_rate(Float): Rate below which the search gives up, default to
+                a thousandth of max_rate
+            max_validations(Integer): Number of failed validations after which
+                the search gives up
+        """
+        self.measure = measure
+        self.max_rate = max_rate
+        self.granularity = granularity
+        self.min_rate = min_rate if min_rate is not None else max_rate / 1000
+        self.max_validations = max_validations
+
+    def _width(self, rate: float, scale: float) -> float:
+        return max(rate * self.granularity * scale / 100, self.min_rate)
+
+    def _find_lower(self, runtime: int, upper: float, estimate: float,
+                    scale: float) -> tuple:
+        # step down from the failing rate with a doubling step, or straight to
+        # the rate the device forwarded when that is lower
+        step = self._width(upper, scale)
+        rate = upper - step
+        while True:
+            if estimate is not None:
+                rate = min(rate, estimate)
+            rate = max(rate, self.min_rate)
+            passed, estimate = self.measure(rate, runtime, SEARCH)
+            if passed:
+                return rate, upper
+            upper = rate
+            if rate <= self.min_rate:
+                return None, upper
+            step *= 2
+            rate = upper - step
+
+    def _find_upper(self, runtime: int, lower: float, upper: float,
+                    scale: float) -> tuple:
+        # step up from the passing rate with a doubling step, as long as it
+        # stays below the failing rate, or max_rate if there is none
+        ceiling = upper if upper is not None else self.max_rate
+        step = self._width(lower, scale)
+        while lower + step < ceiling:
+            rate = lower + step
+            passed, _ = self.measure(rate, runtime, SEARCH)
+            if not passed:
+                return lower, rate
+            lower = rate
+            step *= 2
+        if upper is None and lower < self.max_rate:
+            passed, _ = self.measure(self.max_rate, runtime, SEARCH)
+            if passed:
+                lower = self.max_rate
+            else:
+                upper = self.max_rate
+        return lower, upper
+
+    def _bisect(self, runtime: int, lower: float, upper: float,
+                scale: float) -> tuple:
+        while upper - lower > self._width(upper, scale):
+            rate = (lower + upper) / 2
+            passed, _ = self.measure(rate, runtime, SEARCH)
+            if passed:
+                lower = rate
+            else:
+                upper = rate
+        return lower, upper
+
+    def narrow(self, runtime: int, lower: float = None, upper: float = None,
+               scale: float = 1) -> tuple:
+        """Bracket the throughput at runtime, within scale times granularity.
+
+        The passing rate is measured again first, since it may not pass with
+        this runtime. Without any rate known yet the search starts at max_rate.
+
+        Args:
+            runtime(Integer): Runtime of the trials, in seconds
+            lower(Float): A rate that passed at a shorter runtime, or None
+            upper(Float): A rate that failed, or None
+            scale(Float): Multiplies the granularity
+
+        Returns:
+            tuple: the highest passing rate, None if even min_rate fails, and
+            the lowest failing rate, None if max_rate passes
+        """
+        estimate = None
+        if lower is None and upper is None:
+            lower = self.max_rate
+        if lower is not None:
+            passed, estimate = self.measure(lower, runtime, SEARCH)
+            if not passed:
+                lower, upper = None, lower
+        if lower is None:
+            lower, upper = self._find_lower(runtime, upper, estimate, scale)
+            if lower is None:
+                return None, upper
+        lower, upper = self._find_upper(runtime, lower, upper, scale)
+        if upper is None:
+            return lower, None
+        return self._bisect(runtime, lower, upper, scale)
+
+    def validate(self, validation_runtime: int, lower: float) -> float:
+        """Validate the throughput, stepping down when it fails.
+
+        The rate that failed the validation passed the shorter search trials,
+        the next validation is one granularity below it, the step doubling
+        with every failure, or at the rate the device forwarded if lower.
+
+        Args:
+            validation_runtime(Integer): Runtime of the validation trials
+            lower(Float): The throughput found, or None
+
+        Returns:
+            Float: the validated throughput, None if there is none
+        """
+        if lower is None:
+            return None
+        step = self._width(lower, 1)
+        rate = lower
+        for _ in range(self.max_validations):
+            passed, estimate = self.measure(rate, validation_runtime, VALIDATION)
+            if passed:
+                return rate
+            if rate <= self.min_rate:
+                break
+            rate = max(min(rate - step, estimate), self.min_rate)
+            step *= 2
+        return None
+
+    def exp_bisect(self, search_runtime: int, validation_runtime: int) -> float:
+        """Exponential probing then bisection, every trial of search_runtime.
+
+        The first trial at max_rate tells the rate the device forwards, the
+        probing starts there with a step of one granularity that doubles until
+        the throughput is bracketed, so a throughput far below max_rate costs
+        a few trials instead of a bisection of the whole range.
+
+        Returns:
+            Float: the validated throughput, None if there is none
+        """
+        lower, _ = self.narrow(search_runtime)
+        return self.validate(validation_runtime, lower)
+
+    def mlr(self, short_runtime: int, search_runtime: int,
+            validation_runtime: int, phases: int = 3) -> float:
+        """Multiple loss ratio search style: short trials first.
+
+        Every phase brackets the throughput starting from the previous one,
+        the first with short_runtime trials and a bracket 2^(phases-1) times
+        granularity wide, the runtime growing geometrically and the width
+        halving up to search_runtime and granularity at the last phase. Most
+        trials are short, only the ones close to the throughput run long.
+
+        Returns:
+            Float: the validated throughput, None if there is none
+        """
+        short_runtime = max(1, min(short_runtime, search_runtime))
+        lower = upper = None
+        for phase in range(phases):
+            if phases > 1:
+                ratio = float(search_runtime) / short_runtime
+                runtime = round(short_runtime * ratio ** (phase / (phases - 1.0)))
+            else:
+                runtime = search_runtime
+            lower, upper = self.narrow(
+                runtime, lower, upper, 2 ** (phases - 1 - phase)
+            )
+            if lower is None:
+                return None
+        return self.validate(validation_runtime, lower)
@@ -0,0 +1,506 @@
+#!/usr/bin/python3
+"""
+|------------------------------------------------------------------------------|
+|                                                                              |
+|    Filename: throughput-search.py                                            |
+| Description: Throughput search of the search_strategy.py strategies, with    |
+|              the trials run through the TRex STL API.                        |
+|                                                                              |
+|------------------------------------------------------------------------------|
+"""
+
+import argparse
+import json
+import os
+import signal
+import sys
+import time
+
+sys.path.append("/opt/trex/current/automation/trex_control_plane/interactive")
+from trex.stl.api import (  # noqa: E402
+    STLClient,
+    STLFlowLatencyStats,
+    STLPktBuilder,
+    STLScVmRaw,
+    STLStream,
+    STLStreamDstMAC_PKT,
+    STLTXCont,
+    STLTXSingleBurst,
+    STLVmFixIpv4,
+    STLVmFlowVar,
+    STLVmWrFlowVar,
+    TRexError,
+)
+from scapy.layers.inet import IP, UDP  # noqa: E402
+from scapy.layers.l2 import Ether  # noqa: E402
+from search_strategy import STRATEGIES, ThroughputSearch, VALIDATION  # noqa: E402
+
+# same log as binary-search.py, read by the REST API
+RESULT_FILE = "binary-search.json"
+# bytes of preamble, start of frame delimiter and inter frame gap of a frame
+L1_OVERHEAD = 20
+# seconds left for the packets in flight to arrive once a trial stopped
+RX_DELAY = 1.0
+# base addresses of the flows of device pair i, swapped for the reverse way
+SRC_IP = "16.%d.0.1"
+DST_IP = "48.%d.0.1"
+
+
+class Direction:
+    """The traffic sent from one port of a device pair to the other."""
+
+    def __init__(self, tx: int, rx: int, pair: int, reverse: bool):
+        self.tx = tx
+        self.rx = rx
+        self.pair = pair
+        self.reverse = reverse
+        # packet group id of the latency stream
+        self.pg_id = pair * 2 + int(reverse)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Throughput search with TRex, faster than binary-search.py"
+    )
+    parser.add_argument("--search-strategy", choices=STRATEGIES, default="mlr")
+    parser.add_argument("--device-pairs", default="0:1")
+    parser.add_argument("--active-device-pairs", default=None)
+    parser.add_argument(
+        "--traffic-direction",
+        choices=["bidirectional", "unidirectional", "revunidirectional"],
+        default="bidirectional",
+    )
+    parser.add_argument("--frame-size", type=int, default=64)
+    parser.add_argument("--num-flows", type=int, default=1024)
+    parser.add_argument("--search-runtime", type=int, default=30)
+    parser.add_argument("--validation-runtime", type=int, default=60)
+    parser.add_argument(
+        "--sniff-runtime",
+        type=int,
+        default=0,
+        help="runtime of the first trials of the mlr strategy, default to a sixth "
+        "of --search-runtime",
+    )
+    parser.add_argument("--search-phases", type=int, default=3)
+    parser.add_argument("--max-loss-pct", type=float, default=0.002)
+    parser.add_argument("--search-granularity", type=float, default=5.0)
+    parser.add_argument("--rate-unit", choices=["%", "mpps"], default="%")
+    parser.add_argument(
+        "--rate", type=float, default=100.0, help="highest rate searched"
+    )
+    parser.add_argument("--min-rate", type=float, default=None)
+    parser.add_argument("--one-shot", type=int, default=0)
+    parser.add_argument("--rate-tolerance", type=float, default=10)
+    parser.add_argument(
+        "--rate-tolerance-failure", choices=["fail", "quit"], default="fail"
+    )
+    parser.add_argument("--negative-packet-loss", default="fail")
+    parser.add_argument("--latency-rate", type=int, default=1000)
+    parser.add_argument("--send-teaching-warmup", action="store_true")
+    parser.add_argument("--teaching-warmup-packet-rate", type=int, default=1000)
+    parser.add_argument("--use-src-ip-flows", type=int, default=1)
+    parser.add_argument("--use-dst-ip-flows", type=int, default=1)
+    parser.add_argument("--use-src-mac-flows", type=int, default=0)
+    parser.add_argument("--use-dst-mac-flows", type=int, default=0)
+    parser.add_argument("--dst-macs", default=None)
+    parser.add_argument("--no-promisc", action="store_true")
+    parser.add_argument("--trex-host", default="localhost")
+    # the REST API passes the binary-search.py options of a start config,
+    # the ones without an equivalent here are ignored
+    args, ignored = parser.parse_known_args()
+    if ignored:
+        print("ignoring unsupported options: %s" % " ".join(ignored))
+    return args
+
+
+def directions(args: argparse.Namespace) -> list:
+    """Return the Directions of the active device pairs."""
+    pairs = args.active_device_pairs or args.device_pairs
+    result = []
+    for index, pair in enumerate(pairs.split(",")):
+        a, b = [int(port) for port in pair.split(":")]
+        if args.traffic_direction != "revunidirectional":
+            result.append(Direction(a, b, index, False))
+        if args.traffic_direction != "unidirectional":
+            result.append(Direction(b, a, index, True))
+    return result
+
+
+def mac_value(mac: str) -> int:
+    """Return the last four bytes of a MAC address as an integer."""
+    return int("".join(mac.split(":")[2:]), 16)
+
+
+def ip_value(ip: str) -> int:
+    """Return an IPv4 address as an integer."""
+    value = 0
+    for byte in ip.split("."):
+        value = value * 256 + int(byte)
+    return value
+
+
+def flow_var(name: str, base: int, count: int, offset) -> list:
+    # the variables of a stream all step by one per packet, so the addresses
+    # of a flow change in tandem
+    base = min(base, 0xFFFFFFFF - count + 1)
+    return [
+        STLVmFlowVar(
+            name=name,
+            min_value=base,
+            max_value=base + count - 1,
+            size=4,
+            op="inc",
+        ),
+        STLVmWrFlowVar(fv_name=name, pkt_offset=offset),
+    ]
+
+
+def packet(args: argparse.Namespace, direction: Direction, macs: dict,
+           flows: bool) -> STLPktBuilder:
+    """Build the packet of a direction, with the flows unless flows is False."""
+    src_ip, dst_ip = SRC_IP % direction.pair, DST_IP % direction.pair
+    if direction.reverse:
+        src_ip, dst_ip = dst_ip, src_ip
+    src_mac, dst_mac = macs[direction.tx]
+    base = (
+        Ether(src=src_mac, dst=dst_mac)
+        / IP(src=src_ip, dst=dst_ip)
+        / UDP(sport=1234, dport=5678)
+    )
+    # frame_size counts the 4 bytes of the FCS added by the NIC
+    pad = max(0, args.frame_size - 4 - len(base)) * "x"
+    if not flows or args.num_flows <= 1:
+        return STLPktBuilder(pkt=base / pad)
+    # the MAC flows vary the last four bytes of the address
+    fields = [
+        (args.use_src_ip_flows, "src_ip", ip_value(src_ip), "IP.src"),
+        (args.use_dst_ip_flows, "dst_ip", ip_value(dst_ip), "IP.dst"),
+        (args.use_src_mac_flows, "src_mac", mac_value(src_mac), 8),
+        (args.use_dst_mac_flows, "dst_mac", mac_value(dst_mac), 2),
+    ]
+    instructions = []
+    for enabled, name, value, offset in fields:
+        if enabled:
+            instructions += flow_var(name, value, args.num_flows, offset)
+    if instructions:
+        instructions.append(STLVmFixIpv4(offset="IP"))
+    return STLPktBuilder(pkt=base / pad, vm=STLScVmRaw(instructions))
+
+
+def streams(args: argparse.Namespace, direction: Direction, macs: dict,
+            pps: float) -> list:
+    """Return the streams sending pps packets per second for a direction.
+
+    A latency stream of args.latency_rate packets per second is part of pps.
+    """
+    latency_pps = min(args.latency_rate, pps / 2)
+    result = [
+        STLStream(
+            packet=packet(args, direction, macs, False),
+            mode=STLTXCont(pps=latency_pps),
+            flow_stats=STLFlowLatencyStats(pg_id=direction.pg_id),
+            mac_src_override_by_pkt=True,
+            mac_dst_override_mode=STLStreamDstMAC_PKT,
+        )
+    ]
+    if pps > latency_pps:
+        result.append(
+            STLStream(
+                packet=packet(args, direction, macs, True),
+                mode=STLTXCont(pps=pps - latency_pps),
+                mac_src_override_by_pkt=True,
+                mac_dst_override_mode=STLStreamDstMAC_PKT,
+            )
+        )
+    return result
+
+
+class TrialRunner:
+    """Run the trials of a search on the TRex server and log them."""
+
+    def __init__(self, args: argparse.Namespace, client: STLClient):
+        self.args = args
+        self.client = client
+        self.directions = directions(args)
+        self.ports = sorted(
+            set(d.tx for d in self.directions) | set(d.rx for d in self.directions)
+        )
+        self.trials = []
+        info = {
+            port: port_info
+            for port, port_info in zip(self.ports, client.get_port_info(self.ports))
+        }
+        dst_macs = args.dst_macs.split(",") if args.dst_macs else []
+        # port -> (source MAC, destination MAC) of the packets it sends, the
+        # destination defaults to the peer port for back to back and L2 setups.
+        # Both ways of a pair are known, the teaching warmup goes backwards.
+        self.macs = {}
+        for d in self.directions:
+            for tx, rx in [(d.tx, d.rx), (d.rx, d.tx)]:
+                dst_mac = dst_macs[tx] if tx < len(dst_macs) else info[rx]["hw_mac"]
+                self.macs[tx] = (info[tx]["hw_mac"], dst_mac)
+        # port -> line rate in packets per second at args.frame_size
+        self.line_pps = {
+            port: float(info[port]["speed"]) * 1e9
+            / ((args.frame_size + L1_OVERHEAD) * 8)
+            for port in self.ports
+        }
+
+    def target_pps(self, port: int, rate: float) -> float:
+        if self.args.rate_unit == "mpps":
+            return rate * 1e6
+        return self.line_pps[port] * rate / 100
+
+    def setup(self) -> None:
+        self.client.reset(ports=self.ports)
+        if not self.args.no_promisc:
+            self.client.set_port_attr(ports=self.ports, promiscuous=True)
+        self.write_log()
+
+    def teach(self) -> None:
+        """Send a burst of every flow the reverse way, for switches to learn."""
+        ports = []
+        for d in self.directions:
+            reverse = Direction(d.rx, d.tx, d.pair, not d.reverse)
+            self.client.add_streams(
+                STLStream(
+                    packet=packet(self.args, reverse, self.macs, True),
+                    mode=STLTXSingleBurst(
+                        total_pkts=self.args.num_flows,
+                        pps=self.args.teaching_warmup_packet_rate,
+                    ),
+                    mac_src_override_by_pkt=True,
+                    mac_dst_override_mode=STLStreamDstMAC_PKT,
+                ),
+                ports=[reverse.tx],
+            )
+            ports.append(reverse.tx)
+        if ports:
+            self.client.start(ports=ports, force=True)
+            self.client.wait_on_traffic(ports=ports)
+            self.client.remove_all_streams(ports=self.ports)
+
+    def write_log(self) -> None:
+        # replaced at once, readers never see a partially written log
+        tmp = RESULT_FILE + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"trials": self.trials}, f, indent=2)
+        os.replace(tmp, RESULT_FILE)
+
+    def run(self, rate: float, runtime: int, kind: str) -> tuple:
+        """Run a trial, the measure function of ThroughputSearch."""
+        tx_ports = sorted(set(d.tx for d in self.directions))
+        targets = {port: self.target_pps(port, rate) for port in tx_ports}
+        self.client.remove_all_streams(ports=self.ports)
+        for d in self.directions:
+            self.client.add_streams(
+                streams(self.args, d, self.macs, targets[d.tx]), ports=[d.tx]
+            )
+        self.client.clear_stats(ports=self.ports)
+        print(
+            "trial %d: %s %s for %ds"
+            % (len(self.trials), rate, self.args.rate_unit, runtime)
+        )
+        self.client.start(ports=tx_ports, mult="1", duration=runtime, force=True)
+        self.client.wait_on_traffic(ports=tx_ports, timeout=runtime + 60)
+        time.sleep(RX_DELAY)
+        stats = self.client.get_stats(ports=self.ports)
+        pgid_stats = self.client.get_pgid_stats([d.pg_id for d in self.directions])
+        results = self.port_results(runtime, targets, stats, pgid_stats)
+        failures = self.failures(results)
+        forwarded = rate * min(
+            results[str(d.rx)]["rx_packets"]
+            / max(1.0, results[str(d.tx)]["tx_pps_target"] * runtime)
+            for d in self.directions
+        )
+        results["global"] = {
+            "runtime": runtime,
+            "tx_packets": sum(r["tx_packets"] for r in results.values()),
+            "rx_packets": sum(r["rx_packets"] for r in results.values()),
+        }
+        self.trials.append(
+            {
+                "rate": rate,
+                "rate_unit": self.args.rate_unit,
+                "result": "fail" if failures else "pass",
+                "failures": failures,
+                "stats": results,
+                "trial_params": {
+                    "trial": len(self.trials) + 1,
+                    "trial_mode": kind,
+                    "runtime": runtime,
+                    "rate": rate,
+                    "rate_unit": self.args.rate_unit,
+                    "search_strategy": self.args.search_strategy,
+                    "frame_size": self.args.frame_size,
+                    "num_flows": self.args.num_flows,
+                    "max_loss_pct": self.args.max_loss_pct,
+                },
+            }
+        )
+        self.write_log()
+        if "tx_rate" in failures and self.args.rate_tolerance_failure == "quit":
+            print("the requested rate was not sent, quitting")
+            sys.exit(1)
+        return not failures, forwarded
+
+    def port_results(self, runtime: int, targets: dict, stats: dict,
+                     pgid_stats: dict) -> dict:
+        """Return port -> ResultSchema fields of a trial."""
+        results = {str(port): empty_result() for port in self.ports}
+        flow_stats = pgid_stats.get("flow_stats", {})
+        latency = pgid_stats.get("latency", {})
+        tolerance = self.args.rate_tolerance / 100
+        for d in self.directions:
+            tx = results[str(d.tx)]
+            rx = results[str(d.rx)]
+            group = flow_stats.get(d.pg_id, {})
+            tx.update(
+                rates(
+                    "tx_", stats[d.tx]["opackets"], runtime, self.args.frame_size
+                ),
+                tx_active=True,
+                tx_pps_target=targets[d.tx],
+                tx_tolerance_min=targets[d.tx] * (1 - tolerance),
+                tx_tolerance_max=targets[d.tx] * (1 + tolerance),
+            )
+            tx.update(
+                rates(
+                    "tx_latency_",
+                    group.get("tx_pkts", {}).get(d.tx, 0),
+                    runtime,
+                    self.args.frame_size,
+                )
+            )
+            rx.update(
+                rates("rx_", stats[d.rx]["ipackets"], runtime, self.args.frame_size),
+                rx_active=True,
+            )
+            rx_latency_packets = group.get("rx_pkts", {}).get(d.rx, 0)
+            rx.update(
+                rates(
+                    "rx_latency_", rx_latency_packets, runtime, self.args.frame_size
+                ),
+                rx_latency_lost_pps=(tx["tx_latency_packets"] - rx_latency_packets)
+                / runtime,
+            )
+            lost = tx["tx_packets"] - rx["rx_packets"]
+            rx.update(
+                rx_lost_packets=lost,
+                rx_lost_pps=lost / runtime,
+                rx_lost_packets_pct=100.0 * lost / max(1, tx["tx_packets"]),
+            )
+            numbers = latency.get(d.pg_id, {}).get("latency", {})
+            for field, name in [
+                ("rx_latency_average", "average"),
+                ("rx_latency_minimum", "total_min"),
+                ("rx_latency_maximum", "total_max"),
+            ]:
+                if isinstance(numbers.get(name), (int, float)):
+                    rx[field] = float(numbers[name])
+        return results
+
+    def failures(self, results: dict) -> list:
+        """Return why a trial failed, an empty list if it passed."""
+        failures = []
+        for port, result in sorted(results.items()):
+            if result["rx_active"]:
+                if result["rx_lost_packets_pct"] > self.args.max_loss_pct:
+                    failures.append("loss")
+                if (
+                    result["rx_lost_packets"] < 0
+                    and self.args.negative_packet_loss != "pass"
+                ):
+                    failures.append("negative_loss")
+            if result["tx_active"] and not (
+                result["tx_tolerance_min"]
+                <= result["tx_pps"]
+                <= result["tx_tolerance_max"]
+            ):
+                failures.append("tx_rate")
+        return sorted(set(failures))
+
+
+def empty_result() -> dict:
+    """Return the ResultSchema fields of a port neither sending nor receiving."""
+    result = {}
+    for prefix in ["rx_", "rx_latency_", "tx_", "tx_latency_"]:
+        result.update(rates(prefix, 0, 1, 0))
+    result.update(
+        rx_lost_packets=0,
+        rx_lost_packets_pct=0.0,
+        rx_lost_pps=0.0,
+        rx_latency_average=0.0,
+        rx_latency_minimum=0.0,
+        rx_latency_maximum=0.0,
+        rx_latency_lost_pps=0.0,
+        rx_active=False,
+        tx_pps_target=0.0,
+        tx_tolerance_min=0.0,
+        tx_tolerance_max=0.0,
+        tx_active=False,
+    )
+    return result
+
+
+def rates(prefix: str, packets: int, runtime: int, frame_size: int) -> dict:
+    """Return the packets, pps, l1_bps and l2_bps fields of a packet count."""
+    pps = float(packets) / runtime
+    return {
+        prefix + "packets": int(packets),
+        prefix + "pps": pps,
+        prefix + "l1_bps": pps * (frame_size + L1_OVERHEAD) * 8,
+        prefix + "l2_bps": pps * frame_size * 8,
+    }
+
+
+def search(args: argparse.Namespace, runner: TrialRunner) -> float:
+    """Run the search of args.search_strategy, return the throughput found."""
+    if args.one_shot:
+        passed, _ = runner.run(args.rate, args.validation_runtime, VALIDATION)
+        return args.rate if passed else None
+    strategy = ThroughputSearch(
+        runner.run, args.rate, args.search_granularity, args.min_rate
+    )
+    if args.search_strategy == "exp-bisect":
+        return strategy.exp_bisect(args.search_runtime, args.validation_runtime)
+    return strategy.mlr(
+        args.sniff_runtime or max(1, args.search_runtime // 6),
+        args.search_runtime,
+        args.validation_runtime,
+        args.search_phases,
+    )
+
+
+def main() -> int:
+    args = parse_args()
+    # stopped by the REST API with SIGTERM, leave the ports idle
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+    client = STLClient(server=args.trex_host)
+    try:
+        client.connect()
+        runner = TrialRunner(args, client)
+        runner.setup()
+        if args.send_teaching_warmup:
+            runner.teach()
+        throughput = search(args, runner)
+    except TRexError as e:
+        print("TRex error: %s" % e)
+        return 1
+    finally:
+        if client.is_connected():
+            try:
+                client.stop(ports=client.get_acquired_ports())
+                client.release()
+            except TRexError:
+                pass
+            client.disconnect()
+    if throughput is None:
+        print("no rate passed")
+        return 1
+    print("throughput: %s %s" % (throughput, args.rate_unit))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,5 @@
 #!/bin/bash
-# env: peer_mac_west peer_mac_east validation_seconds search_seconds sniff_seconds loss_ratio flows frame_size
+# env: peer_mac_west peer_mac_east validation_seconds search_seconds sniff_seconds loss_ratio flows frame_size search_strategy
 
 validation_seconds=${validation_seconds:-30}
 search_seconds=${search_seconds:-10}
@@ -10,6 +10,7 @@ frame_size=${frame_size:-64}
 rate=${rate:-25}
 steady_rate=${steady_rate:-0}
 steady_rate=${one_shot:-${steady_rate}}
+search_strategy=${search_strategy:-binary}   # binary, exp-bisect or mlr
 page_prefix="rfc2544_trex"
 pciDeviceDir="/sys/bus/pci/devices"
 vf_extra_opt=${vf_extra_opt:-"--no-promisc"}
@@ -29,6 +30,8 @@ function sigfunc() {
     [ -z ${pid} ] || kill ${pid}
     pid=`pgrep binary-search`
     [ -z ${pid} ] || kill ${pid}
+    pid=`pgrep -f throughput-search`
+    [ -z ${pid} ] || kill ${pid}
     tmux kill-session -t trex 2>/dev/null
     rm -rf /dev/hugepages/${page_prefix}*
     exit 0
@@ -152,9 +155,13 @@ if [ "$1" == "start" ]; then
     if (( l3 == 1)); then
         dst_mac_opt="--dst-macs=${peer_mac_west},${peer_mac_east}"
     fi
+    if [ "${search_strategy}" == "binary" ]; then
+        search_cmd="./binary-search.py --traffic-generator=trex-txrx"
+    else
+        search_cmd="./throughput-search.py --search-strategy=${search_strategy}"
+    fi
     for size in $(echo ${frame_size} | sed -e 's/,/ /g'); do
-        taskset -c ${client_cpu} ./binary-search.py \
-            --traffic-generator=trex-txrx \
+        taskset -c ${client_cpu} ${search_cmd} \
             --device-pairs=${device_pairs} \
             --active-device-pairs=${device_pairs} \
             --sniff-runtime=${sniff_seconds} \
@@ -172,7 +179,7 @@ if [ "$1" == "start" ]; then
             ${dst_mac_opt} ${vf_extra_opt}
     done
 elif [ "$1" == "server" ]; then
-    taskset -c ${client_cpu} waitress-serve --host=0.0.0.0 --port="$2" --call rest:create_app
+    taskset -c ${client_cpu} waitress-serve --host=0.0.0.0 --port="$2" --threads=8 --call rest:create_app
 fi
 
 tmux kill-session -t trex 2>/dev/null
@@ -0,0 +1,172 @@
+"""
+|------------------------------------------------------------------------------|
+|                                                                              |
+|    Filename: trex_connection.py                                              |
+| Description: Long-lived read-only connection of the REST API to the TRex     |
+|              server.                                                         |
+|                                                                              |
+|------------------------------------------------------------------------------|
+"""
+
+import threading
+import time
+
+from trex.stl.api import STLClient, TRexError
+
+# per port rates of STLClient.get_stats() exported by live_stats()
+RATE_FIELDS = ["tx_pps", "rx_pps", "tx_bps", "rx_bps", "tx_bps_L1", "rx_bps_L1"]
+
+
+def port_latency(flow_stats: dict, latency: dict) -> dict:
+    """Aggregate the latency streams per receiving port.
+
+    TRex reports latency per packet group id, a group is attributed to the port
+    that received most of its packets.
+
+    Args:
+        flow_stats(dict): pgid -> flow stats of get_pgid_stats()
+        latency(dict): pgid -> latency stats of get_pgid_stats()
+
+    Returns:
+        dict: port -> average, minimum and maximum latency and jitter, in usec
+    """
+    ports = {}
+    for pgid, stats in latency.items():
+        stats = stats.get("latency", {})
+        rx_pkts = {
+            port: count
+            for port, count in flow_stats.get(pgid, {}).get("rx_pkts", {}).items()
+            if isinstance(port, int) and count
+        }
+        if not rx_pkts or not isinstance(stats.get("average"), (int, float)):
+            continue
+        port = max(rx_pkts, key=rx_pkts.get)
+        ports.setdefault(port, []).append((rx_pkts[port], stats))
+    result = {}
+    for port, groups in ports.items():
+        packets = sum(count for count, _ in groups)
+        numbers = [
+            stats for _, stats in groups
+            if isinstance(stats.get("total_min"), (int, float))
+        ]
+        result[port] = {
+            "average": sum(count * stats["average"] for count, stats in groups)
+            / packets,
+            "minimum": min((s["total_min"] for s in numbers), default=None),
+            "maximum": max((s.get("total_max", 0) for _, s in groups), default=None),
+            "jitter": max((s.get("jitter", 0) for _, s in groups), default=None),
+        }
+    return result
+
+
+class TRexConnection:
+    """One STL client connection to the TRex server, shared by the endpoints.
+
+    The connection never acquires the ports, it only reads from them, so it
+    does not get in the way of the binary search. It is (re)established when
+    needed, at most every reconnect_interval seconds so that a TRex server
+    that is down does not slow down every request. The port info is cached
+    for as long as the connection lives, the live stats for stats_interval
+    seconds, which is about how often TRex updates its rates. STLClient is not
+    thread safe, every use of it holds the lock.
+    """
+
+    def __init__(
+        self,
+        server: str = "localhost",
+        reconnect_interval: float = 5.0,
+        stats_interval: float = 1.0,
+    ):
+        self.server = server
+        self.reconnect_interval = reconnect_interval
+        self.stats_interval = stats_interval
+        self.lock = threading.Lock()
+        self.client = None
+        self.ports = []
+        self.port_info = []
+        self.last_attempt = None
+        self.stats = None
+        self.stats_time = None
+
+    def _disconnect(self) -> None:
+        try:
+            self.client.disconnect()
+        except TRexError:
+            pass
+        self.client = None
+
+    def _connect(self) -> bool:
+        if self.client is not None:
+            if self.client.is_connected():
+                return True
+            self._disconnect()
+        now = time.monotonic()
+        if (
+            self.last_attempt is not None
+            and now - self.last_attempt < self.reconnect_interval
+        ):
+            return False
+        self.last_attempt = now
+        client = STLClient(server=self.server)
+        try:
+            client.connect()
+            self.ports = client.get_all_ports()
+            self.port_info = client.get_port_info(ports=self.ports)
+        except TRexError as e:
+            print("failed to connect to the TRex server: %s" % e)
+            self.client = client
+            self._disconnect()
+            return False
+        self.client = client
+        return True
+
+    def get_port_info(self) -> list:
+        """Return the port info of every port.
+
+        Returns:
+            list: the STLClient.get_port_info() of every port, empty if the
+            TRex server was never reached
+        """
+        with self.lock:
+            self._connect()
+            return self.port_info
+
+    def live_stats(self) -> dict:
+        """Return the current rates and latency of every port.
+
+        Returns:
+            dict: timestamp of the stats, in seconds since the epoch, and port ->
+            RATE_FIELDS and latency, None if the TRex server cannot be reached
+        """
+        with self.lock:
+            now = time.monotonic()
+            if self.stats_time is not None and now - self.stats_time < (
+                self.stats_interval
+            ):
+                return self.stats
+            if not self._connect():
+                return None
+            try:
+                stats = self.client.get_stats(ports=self.ports)
+                pgids = self.client.get_active_pgids().get("latency", [])
+                pgid_stats = self.client.get_pgid_stats(pgids) if pgids else {}
+            except TRexError as e:
+                print("failed to get the TRex stats: %s" % e)
+                self._disconnect()
+                return None
+            latency = port_latency(
+                pgid_stats.get("flow_stats", {}), pgid_stats.get("latency", {})
+            )
+            self.stats = {
+                "timestamp": time.time(),
+                "ports": {
+                    str(port): dict(
+                        {field: stats[port].get(field) for field in RATE_FIELDS},
+                        latency=latency.get(port),
+                    )
+                    for port in self.ports
+                    if port in stats
+                },
+            }
+            self.stats_time = now
+            return self.stats
@@ -0,0 +1,238 @@
+"""
+|------------------------------------------------------------------------------|
+|                                                                              |
+|    Filename: trial_log.py                                                    |
+| Description: Access to the trials of the binary-search.json log written by   |
+|              the binary search.                                              |
+|                                                                              |
+|------------------------------------------------------------------------------|
+"""
+
+import json
+import os
+import re
+import threading
+import time
+
+RESULT_FILE = "binary-search.json"
+# per port stats are keyed by the port number, other keys hold global stats
+PORT_PATTERN = re.compile("^[0-9]+$")
+# the per port stats reported for every trial while a search runs
+PROGRESS_FIELDS = [
+    "rx_pps",
+    "tx_pps",
+    "rx_lost_packets",
+    "rx_lost_packets_pct",
+]
+
+
+def port_stats(trial: dict) -> dict:
+    """Return the per port stats of a trial.
+
+    Args:
+        trial(dict): One entry of the trials list
+
+    Returns:
+        dict: port number -> stats
+    """
+    stats = trial.get("stats") or {}
+    return {port: stats[port] for port in stats if PORT_PATTERN.match(port)}
+
+
+def trial_progress(index: int, trial: dict) -> dict:
+    """Summarize a trial for the progress stream.
+
+    Args:
+        index(Integer): Position of the trial in the log
+        trial(dict): One entry of the trials list
+
+    Returns:
+        dict: the trial number, rate, rate unit, pass or fail result and the
+        PROGRESS_FIELDS of every port
+    """
+    return {
+        "trial": index,
+        "rate": trial.get("rate"),
+        "rate_unit": trial.get("rate_unit"),
+        "result": trial.get("result"),
+        "ports": {
+            port: {field: stats.get(field) for field in PROGRESS_FIELDS}
+            for port, stats in port_stats(trial).items()
+        },
+    }
+
+
+def project(trial: dict, fields: list) -> dict:
+    """Keep the given fields of a trial.
+
+    A field is a dotted path into the trial, e.g. rate or trial_params.runtime,
+    or ports.<stat> for a stat of every port, e.g. ports.rx_pps. Missing fields
+    are left out.
+
+    Args:
+        trial(dict): One entry of the trials list
+        fields(List): The fields to keep
+
+    Returns:
+        dict: the trial reduced to the fields, nested as in the trial
+    """
+    projected = {}
+    for field in fields:
+        if field.startswith("ports."):
+            stat = field[len("ports."):]
+            for port, stats in port_stats(trial).items():
+                if stat in stats:
+                    projected.setdefault("ports", {}).setdefault(port, {})[stat] = (
+                        stats[stat]
+                    )
+            continue
+        path = field.split(".")
+        value = trial
+        for key in path:
+            if not isinstance(value, dict) or key not in value:
+                break
+            value = value[key]
+        else:
+            target = projected
+            for key in path[:-1]:
+                target = target.setdefault(key, {})
+            target[path[-1]] = value
+    return projected
+
+
+def trial_page(trials: list, offset: int, limit: int, fields: list = None) -> dict:
+    """Return a page of the trial log.
+
+    Args:
+        trials(List): The trials of the binary search log
+        offset(Integer): Position of the first trial returned
+        limit(Integer): Maximum number of trials returned
+        fields(List): The fields of every trial returned, see project(), None
+            for whole trials
+
+    Returns:
+        dict: the total number of trials, the offset and the trials of the page,
+        each with its position in the log as index
+    """
+    page = []
+    for index, trial in enumerate(trials[offset:offset + limit], offset):
+        if fields is not None:
+            trial = project(trial, fields)
+        page.append(dict(trial, index=index))
+    return {"total": len(trials), "offset": offset, "trials": page}
+
+
+class TrialLog:
+    """The trial log of the binary search, read from its JSON file.
+
+    The log is identified by the inode, size and modification time of the file,
+    a different identity means the search wrote new trials. The parsed trials,
+    and whatever cached() derives from them, are kept until the identity
+    changes, so polling an unchanged log costs a stat() call.
+    """
+
+    def __init__(self, path: str = RESULT_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self._identity = None
+        self._trials = []
+        # name -> value derived from the trials of _identity
+        self._derived = {}
+
+    def identity(self) -> tuple:
+        """Return the (inode, size, mtime_ns) of the log, None if there is none."""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_ino, st.st_size, st.st_mtime_ns
+
+    def _read(self) -> list:
+        try:
+            with open(self.path) as f:
+                return json.load(f)["trials"]
+        except Exception:
+            return []
+
+    def _load(self) -> tuple:
+        # the identity is taken before reading, a write racing with the read
+        # only causes one more read on the next call
+        identity = self.identity()
+        with self.lock:
+            if identity != self._identity:
+                self._identity = identity
+                self._trials = self._read() if identity is not None else []
+                self._derived = {}
+            return identity, self._trials
+
+    def trials(self) -> list:
+        """Return the trials of the log, an empty list if it cannot be read.
+
+        A log being rewritten by the search may be truncated, it is reported as
+        empty until the next complete write.
+        """
+        return self._load()[1]
+
+    def cached(self, name: str, build) -> tuple:
+        """Return the identity of the log and a value derived from its trials.
+
+        Args:
+            name(String): The name the value is cached under
+            build(Function): Called with the trials to derive the value, only
+                once per identity of the log
+
+        Returns:
+            tuple: the identity of the log, None if there is none, and the value
+        """
+        identity, trials = self._load()
+        with self.lock:
+            if identity == self._identity and name in self._derived:
+                return identity, self._derived[name]
+        value = build(trials)
+        with self.lock:
+            if identity == self._identity:
+                self._derived[name] = value
+        return identity, value
+
+    def follow(self, job_manager, poll_interval: float = 1.0,
+               heartbeat: float = 10.0):
+        """Yield progress events for every trial of the running job.
+
+        Trials written before the job started belong to a previous run and are
+        skipped. The log is only re-read when its identity changes. Once the job
+        is not running anymore, the remaining trials and a final done event with
+        the job status are yielded.
+
+        Args:
+            job_manager(JobManager): The manager of the binary search job
+            poll_interval(Float): Seconds between checks of the log
+            heartbeat(Float): Seconds without a trial after which a heartbeat
+                event is yielded, so that clients that went away are noticed
+
+        Yields:
+            dict: trial, heartbeat and done events
+        """
+        sent = 0
+        seen = None
+        last_event = time.monotonic()
+        while True:
+            status = job_manager.status()
+            identity = self.identity()
+            if identity is not None and identity != seen:
+                seen = identity
+                started = status["start_time"] or 0
+                trials = self.trials() if identity[2] >= started * 1e9 else []
+                for index in range(sent, len(trials)):
+                    yield dict(trial_progress(index, trials[index]), event="trial")
+                    last_event = time.monotonic()
+                sent = max(sent, len(trials))
+            if not status["running"]:
+                if identity == self.identity():
+                    yield dict(status, event="done")
+                    return
+                # the search wrote its log as it exited, read it once more
+                continue
+            if time.monotonic() - last_event >= heartbeat:
+                yield {"event": "heartbeat"}
+                last_event = time.monotonic()
+            time.sleep(poll_interval)